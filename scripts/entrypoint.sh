@@ -13,4 +13,5 @@ then
 fi
 
 alembic upgrade head
-exec gunicorn -w 4 -k uvicorn.workers.UvicornWorker main:app -b 0.0.0.0:8000
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_metrics}"
+exec gunicorn -c gunicorn.conf.py -w 4 -k uvicorn.workers.UvicornWorker main:app -b 0.0.0.0:8000
@@ -1,23 +1,54 @@
 import logging
-from logging import config as logging_config
+import uuid
+from datetime import datetime, timedelta
 from typing import Any, Optional
 
-from fastapi import APIRouter, Depends, Query, status, Header
-from fastapi.responses import JSONResponse
+from fastapi import (APIRouter, Depends, Header, HTTPException, Query,
+                     Request, Response, status)
+from fastapi.responses import JSONResponse, RedirectResponse
+from sqlalchemy.engine import Row
 from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import ClientDisconnect
 
 from core.config import app_settings
-from core.logger import LOGGING
-from db.db import get_session
+from core.responses import ORJSONResponse, UploadStreamingResponse
+from db.db import get_read_session, get_session
+from models.short_url import short_url_for
 from schemas.short_url import (OriginalUrl, OriginalUrlsList,
-                               ShortUrl, ShortUrlsList)
+                               ShortenJobInfo, ShortenJobResultsList,
+                               ShortUrl, ShortUrlsList, UrlUsageStats,
+                               naive_utc)
+from services.bulk import STREAM_FORMATS, iter_records, shorten_stream
+from services.health import health_check
+from services.jobs import job_worker, shorten_jobs
 from services.short_url import urls_crud
 
-logging_config.dictConfig(LOGGING)
 logger = logging.getLogger(__name__)
+# Sampled by LOG_SAMPLE_RATES, redirects are the bulk of the traffic.
+redirect_logger = logging.getLogger(f'{__name__}.redirect')
 router = APIRouter()
 
 
+def short_url_content(row: Row) -> dict:
+    """Short url response item built from row without validation."""
+
+    return {'short_id': row.short_id, 'short_url': short_url_for(row.short_id)}
+
+
+def upload_format(content_type: str) -> str:
+    """Streaming upload format of the content type, 415 if unsupported."""
+
+    stream_format = STREAM_FORMATS.get(
+        content_type.split(';')[0].strip().lower()
+    )
+    if stream_format is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f'Supported types: {", ".join(STREAM_FORMATS)}'
+        )
+    return stream_format
+
+
 @router.get(
     '/ping', status_code=status.HTTP_200_OK,
     tags=[app_settings.tag_db_status],
@@ -31,6 +62,59 @@ async def health_db(db: AsyncSession = Depends(get_session)) -> Any:
     return {'database_connection': db_status}
 
 
+@router.get(
+    '/ping/live', status_code=status.HTTP_200_OK,
+    tags=[app_settings.tag_service_status],
+    description='Liveness probe, does not touch the database.'
+)
+async def health_live() -> Any:
+    """Worker liveness"""
+
+    return {'status': 'alive'}
+
+
+@router.get(
+    '/ping/ready', status_code=status.HTTP_200_OK,
+    tags=[app_settings.tag_service_status],
+    description='Readiness probe, database answers within timeout.'
+)
+async def health_ready() -> Any:
+    """Worker readiness"""
+
+    try:
+        database = await health_check.probe_db(app_settings.readiness_timeout)
+    except Exception as error:
+        logger.warning('Readiness probe failed: %r', error)
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={'status': 'not ready'}
+        )
+    return {'status': 'ready', 'database': database}
+
+
+@router.get(
+    '/ping/diagnostics', status_code=status.HTTP_200_OK,
+    tags=[app_settings.tag_service_status],
+    description='Database latency, pool, queues and cache of this worker.'
+)
+async def health_diagnostics() -> Any:
+    """Worker diagnostics"""
+
+    return await health_check.diagnostics(app_settings.readiness_timeout)
+
+
+@router.get(
+    '/cache', status_code=status.HTTP_200_OK,
+    tags=[app_settings.tag_service_status],
+    description='Return short url cache counters of this worker.'
+)
+async def cache_stats() -> Any:
+    """Short url cache counters"""
+
+    logger.info('Get cache stats')
+    return urls_crud.cache_stats()
+
+
 @router.get(
     '/', status_code=status.HTTP_200_OK,
     tags=[app_settings.tag_urls_short], description='API version'
@@ -54,8 +138,12 @@ async def create_short_url(
     """Create short url"""
 
     obj = await urls_crud.create(db=db, obj_in=original_url)
-    logger.info(f'Short url created {obj.original_url} -> {obj.short_id}')
-    return obj
+    logger.info(
+        'Short url created %s -> %s', obj.original_url, obj.short_id
+    )
+    return ORJSONResponse(
+        short_url_content(obj), status_code=status.HTTP_201_CREATED
+    )
 
 
 @router.post(
@@ -68,30 +156,139 @@ async def bulk_create_short_urls(
 ) -> Any:
     """Bulk create short urls"""
 
-    logger.info(f'Bulk created short urls: {list_urls}')
-    return await urls_crud.bulk_create(db=db, obj_in=list_urls)
+    if len(list_urls.__root__) > app_settings.bulk_create_max_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=(f'Batch is limited to '
+                    f'{app_settings.bulk_create_max_size} urls')
+        )
+    created = await urls_crud.bulk_create(db=db, obj_in=list_urls)
+    logger.info('Bulk created %d short urls', len(created))
+    return ORJSONResponse(
+        [short_url_content(row) for row in created],
+        status_code=status.HTTP_201_CREATED
+    )
+
+
+@router.post(
+    '/shorten/stream', status_code=status.HTTP_200_OK,
+    response_class=UploadStreamingResponse,
+    tags=[app_settings.tag_urls_short],
+    description=(
+        'Bulk create short urls from NDJSON or CSV upload, results are '
+        'streamed back as NDJSON while the upload goes on.'
+    )
+)
+async def stream_create_short_urls(
+        request: Request,
+        content_type: str = Header('application/x-ndjson')
+) -> Any:
+    """Bulk create short urls from streaming upload"""
+
+    stream_format = upload_format(content_type)
+    logger.info('Streaming bulk create from %s upload', stream_format)
+    return UploadStreamingResponse(
+        shorten_stream(request.stream(), stream_format),
+        media_type='application/x-ndjson'
+    )
+
+
+@router.post(
+    '/jobs/shorten', status_code=status.HTTP_202_ACCEPTED,
+    response_model=ShortenJobInfo, tags=[app_settings.tag_urls_short],
+    description=(
+        'Submit bulk create job from NDJSON or CSV upload, poll its '
+        'progress and results. Urls are validated by the job, invalid '
+        'ones are reported in the results.'
+    )
+)
+async def submit_shorten_job(
+        request: Request,
+        content_type: str = Header('application/x-ndjson'),
+        db: AsyncSession = Depends(get_session)
+) -> Any:
+    """Submit bulk create job from streaming upload"""
+
+    stream_format = upload_format(content_type)
+    try:
+        job = await shorten_jobs.submit(
+            db=db, records=iter_records(
+                request.stream(), stream_format, validate=False
+            ), max_size=app_settings.job_max_size
+        )
+    except ClientDisconnect:
+        logger.info('Client disconnected during job upload')
+        raise HTTPException(
+            status_code=400, detail='Upload was interrupted'
+        )
+    job_worker.notify()
+    logger.info(
+        'Shorten job %s submitted with %d urls', job.id, job.total
+    )
+    return job
+
+
+@router.get(
+    '/jobs/{job_id}', status_code=status.HTTP_200_OK,
+    response_model=ShortenJobInfo, tags=[app_settings.tag_urls_short],
+    description='Get bulk create job progress.'
+)
+async def get_shorten_job(
+        job_id: uuid.UUID, db: AsyncSession = Depends(get_session)
+) -> Any:
+    """Get bulk create job progress"""
+
+    return await shorten_jobs.get(db=db, job_id=job_id)
+
+
+@router.get(
+    '/jobs/{job_id}/results', status_code=status.HTTP_200_OK,
+    response_model=ShortenJobResultsList, response_model_exclude_none=True,
+    tags=[app_settings.tag_urls_short],
+    description='Get processed urls of bulk create job by pages.'
+)
+async def get_shorten_job_results(
+        job_id: uuid.UUID,
+        response: Response,
+        max_result: int = Query(
+            default=1000, ge=1, le=10000, alias='max-result'
+        ),
+        cursor: int = Query(
+            default=-1, ge=-1,
+            description='Next page cursor from X-Next-Cursor header.'
+        ),
+        db: AsyncSession = Depends(get_session),
+) -> Any:
+    """Get processed urls of bulk create job"""
+
+    job = await shorten_jobs.get(db=db, job_id=job_id)
+    rows, next_cursor = await shorten_jobs.results(
+        db=db, job=job, limit=max_result, after=cursor
+    )
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+    return rows
 
 
 @router.get(
     '/{short_id}', status_code=status.HTTP_307_TEMPORARY_REDIRECT,
-    response_model=OriginalUrl, tags=[app_settings.tag_urls_short],
-    description='Return original url bu uuid.'
+    response_class=RedirectResponse, tags=[app_settings.tag_urls_short],
+    description='Redirect to original url by uuid.'
 )
 async def get_url(
     short_id: str, db: AsyncSession = Depends(get_session),
+    read_db: Optional[AsyncSession] = Depends(get_read_session),
     user_agent: Optional[str] = Header(None)
 ) -> Any:
-    """Return original url by id."""
+    """Redirect to original url by id."""
 
-    obj = await urls_crud.get(db=db, short_id=short_id)
-    logger.info(f'Get original url with id: {obj.short_id}')
-    await urls_crud.update_usage_count(db=db, db_obj=obj)
-    logger.info(f'Update usage count for id: {obj.short_id}')
-    await urls_crud.create_history(
-        db=db, short_id=obj.id, user_agent=user_agent
+    original_url = await urls_crud.redirect(
+        db=db, short_id=short_id, user_agent=user_agent, read_db=read_db
+    )
+    redirect_logger.info('Redirect with id: %s', short_id)
+    return RedirectResponse(
+        original_url, status_code=status.HTTP_307_TEMPORARY_REDIRECT
     )
-    logger.info(f'Create usage history for id: {obj.short_id}')
-    return obj
 
 
 @router.get(
@@ -100,26 +297,79 @@ async def get_url(
 )
 async def get_url_status(
     short_id: str,
+    response: Response,
     full_info: bool = Query(default=False, alias='full-info'),
     max_result: int = Query(
         default=10, ge=1, alias='max-result', description='Query max size.'
     ),
-    offset: int = Query(default=0, ge=0, description='Query offset.'),
+    offset: int = Query(
+        default=0, ge=0,
+        description='Query offset, legacy paging. Prefer cursor.'
+    ),
+    cursor: Optional[str] = Query(
+        default=None,
+        description='Next page cursor from X-Next-Cursor header.'
+    ),
     db: AsyncSession = Depends(get_session),
+    read_db: Optional[AsyncSession] = Depends(get_read_session),
 ) -> Any:
     """Get url usage history."""
 
-    obj = await urls_crud.get(db=db, short_id=short_id)
+    obj = await urls_crud.get(db=db, short_id=short_id, read_db=read_db)
     result = await urls_crud.get_status(
-        db=db, db_obj=obj, full_info=full_info, limit=max_result, offset=offset
+        db=db, db_obj=obj, full_info=full_info, limit=max_result,
+        offset=offset, cursor=cursor, read_db=read_db
     )
     if not full_info:
-        logger.info(f'Return count usage for url with id: {obj.short_id}')
+        logger.info(
+            'Return count usage for url with id: %s', obj.short_id
+        )
         return JSONResponse(
             status_code=status.HTTP_200_OK, content={'usage_count': result}
         )
-    logger.info(f'Return usage history for url with id: {obj.short_id}')
-    return result
+    items, next_cursor = result
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    logger.info('Return usage history for url with id: %s', obj.short_id)
+    return items
+
+
+@router.get(
+    '/{short_id}/stats', status_code=status.HTTP_200_OK,
+    response_model=UrlUsageStats, response_model_exclude_none=True,
+    tags=[app_settings.tag_urls_short],
+    description='Get url usage counts per hour or day.'
+)
+async def get_url_stats(
+    short_id: str,
+    granularity: str = Query(default='hour', regex='^(hour|day)$'),
+    date_from: Optional[datetime] = Query(
+        default=None, alias='from', description='Default is 30 days ago.'
+    ),
+    date_to: Optional[datetime] = Query(
+        default=None, alias='to', description='Default is now.'
+    ),
+    user_agents: bool = Query(default=False, alias='user-agents'),
+    db: AsyncSession = Depends(get_session),
+    read_db: Optional[AsyncSession] = Depends(get_read_session),
+) -> Any:
+    """Get url usage counts per hour or day."""
+
+    date_to = naive_utc(date_to) if date_to else datetime.utcnow()
+    date_from = (
+        naive_utc(date_from) if date_from else date_to - timedelta(days=30)
+    )
+    if date_from > date_to:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail='from is later than to'
+        )
+    obj = await urls_crud.get(db=db, short_id=short_id, read_db=read_db)
+    logger.info('Return usage stats for url with id: %s', obj.short_id)
+    return await urls_crud.get_stats(
+        db=db, db_obj=obj, granularity=granularity, date_from=date_from,
+        date_to=date_to, user_agents=user_agents, read_db=read_db
+    )
 
 
 @router.delete(
@@ -133,7 +383,7 @@ async def delete_url(
 
     obj = await urls_crud.get(db=db, short_id=short_id)
     await urls_crud.delete(db=db, db_obj=obj)
-    logger.info(f'Set del_status to id: {obj.short_id}')
+    logger.info('Set del_status to id: %s', obj.short_id)
     return JSONResponse(
         status_code=status.HTTP_200_OK,
         content={'url_delete': f'Short url {obj.short_id} was deleted'}
@@ -0,0 +1,85 @@
+from typing import Optional
+from urllib.parse import quote
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from api.v1.base import redirect_logger
+from core.middleware import API_PREFIX, route_class
+from db.db import async_session, replicas
+from services.short_url import urls_crud
+
+LOCATION_SAFE = ":/%#?=@[]!$&'()*+,;"
+
+
+def header_value(scope: Scope, name: bytes) -> Optional[str]:
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+class RedirectMiddleware:
+    """Answer ``GET /api/v1/{short_id}`` without FastAPI routing.
+
+    Innermost middleware, so black list, rate limit and metrics still
+    apply. A cached url is redirected without a database session, other
+    urls open sessions only for the lookup. Responses match the get_url
+    endpoint, which stays for the API schema.
+    """
+
+    # Requests are labelled like the get_url route in metrics.
+    path = f'{API_PREFIX}{{short_id}}'
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(
+            self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if (scope['type'] != 'http'
+                or route_class(scope['method'], scope['path']) != 'redirect'):
+            await self.app(scope, receive, send)
+            return
+        scope['route'] = self
+        short_id = scope['path'][len(API_PREFIX):]
+        try:
+            original_url = await self.resolve(
+                short_id, header_value(scope, b'user-agent')
+            )
+        except HTTPException as error:
+            response = JSONResponse(
+                {'detail': error.detail}, status_code=error.status_code,
+                headers=error.headers
+            )
+            await response(scope, receive, send)
+            return
+        redirect_logger.info('Redirect with id: %s', short_id)
+        await send({
+            'type': 'http.response.start',
+            'status': status.HTTP_307_TEMPORARY_REDIRECT,
+            'headers': [
+                (b'content-length', b'0'),
+                (b'location',
+                 quote(original_url, safe=LOCATION_SAFE).encode('latin-1')),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b''})
+
+    @staticmethod
+    async def resolve(short_id: str, user_agent: Optional[str]) -> str:
+        cached = urls_crud.cached_url(short_id)
+        original_url = await urls_crud.redirect_from_cache(cached, user_agent)
+        if original_url is not None:
+            return original_url
+        async with async_session() as db:
+            read_db = replicas.session()
+            if read_db is None:
+                return await urls_crud.redirect_from_db(
+                    db, short_id, cached, user_agent
+                )
+            async with read_db:
+                return await urls_crud.redirect_from_db(
+                    db, short_id, cached, user_agent, read_db=read_db
+                )
@@ -0,0 +1,61 @@
+"""Compare load test results of two runs.
+
+Run from the ``src`` directory::
+
+    python -m benchmarks.compare results/before.json results/after.json
+
+Prints requests per second and latency percentiles of every label with
+the relative change, higher is better for rps, lower for latency.
+"""
+import argparse
+import json
+
+METRICS = ('rps', 'p50', 'p95', 'p99')
+
+
+def label_metrics(stats: dict) -> dict:
+    return {'rps': stats['rps'], **stats['latency_ms']}
+
+
+def change(before: float, after: float) -> str:
+    if not before:
+        return '-'
+    return f'{(after - before) / before * 100:+.1f}%'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    args = parser.parse_args()
+
+    with open(args.before) as file:
+        before = json.load(file)
+    with open(args.after) as file:
+        after = json.load(file)
+    if before['scenario'] != after['scenario']:
+        parser.error('Results are of different scenarios')
+    changed = {
+        name: (before['params'].get(name), value)
+        for name, value in after['params'].items()
+        if before['params'].get(name) != value
+    }
+    print(f'{before["scenario"]}: {before["commit"]} -> {after["commit"]}')
+    if changed:
+        print(f'Parameters differ: {changed}')
+    print(f'{"label":<12} {"metric":<6} {"before":>12} {"after":>12} '
+          f'{"change":>8}')
+    for label in sorted(set(before['labels']) | set(after['labels'])):
+        if label not in before['labels'] or label not in after['labels']:
+            print(f'{label:<12} only in one run')
+            continue
+        old = label_metrics(before['labels'][label])
+        new = label_metrics(after['labels'][label])
+        for metric in METRICS:
+            print(f'{label:<12} {metric:<6} {old[metric]:>12,.2f} '
+                  f'{new[metric]:>12,.2f} '
+                  f'{change(old[metric], new[metric]):>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Short id generators throughput and collision rate.
+
+Run from the ``src`` directory::
+
+    python -m benchmarks.id_generators --count 10000000
+
+Sequence based generators are fed by a local counter, so the numbers show
+encoding cost only; a real block costs one extra round trip per
+``SHORT_ID_BLOCK_SIZE`` ids.
+"""
+import argparse
+import time
+
+from services.id_generator import (FeistelIdGenerator, RandomIdGenerator,
+                                   SequenceIdGenerator)
+
+BATCH = 100000
+
+
+def run_random(count: int, length: int) -> tuple[float, int]:
+    generator = RandomIdGenerator(length)
+    seen = set()
+    started = time.perf_counter()
+    for start in range(0, count, BATCH):
+        seen.update(generator.random_ids(min(BATCH, count - start)))
+    return time.perf_counter() - started, count - len(seen)
+
+
+def run_sequence(
+        generator: SequenceIdGenerator, count: int
+) -> tuple[float, int]:
+    seen = set()
+    started = time.perf_counter()
+    for number in range(1, count + 1):
+        seen.add(generator.encode(number))
+    return time.perf_counter() - started, count - len(seen)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=10_000_000)
+    parser.add_argument('--length', type=int, default=8)
+    args = parser.parse_args()
+
+    results = {
+        'random': run_random(args.count, args.length),
+        'sequence': run_sequence(
+            SequenceIdGenerator(args.length, 'bench', BATCH), args.count
+        ),
+        'feistel': run_sequence(
+            FeistelIdGenerator(args.length, 'bench', BATCH, 'bench'),
+            args.count
+        ),
+    }
+    print(f'{"generator":<10} {"ids/s":>12} {"collisions":>11} {"rate":>10}')
+    for name, (elapsed, collisions) in results.items():
+        print(
+            f'{name:<10} {args.count / elapsed:>12,.0f} '
+            f'{collisions:>11} {collisions / args.count:>10.2e}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+"""Load generator for the shortener endpoints.
+
+Seed the database with ``benchmarks.seed``, start the service the way it
+runs in production and point the generator at it from the ``src``
+directory::
+
+    gunicorn -c gunicorn.conf.py -w 4 -k uvicorn.workers.UvicornWorker \\
+        main:app -b 127.0.0.1:8000
+    python -m benchmarks.load redirect --urls 1000000 --duration 30 \\
+        --output results/redirect.json
+
+Scenarios:
+
+* ``redirect``: GET of seeded short ids, Zipf distributed like real links.
+* ``bulk``: POST /shorten batches of new urls.
+* ``status``: full usage history of the hottest seeded urls, following
+  X-Next-Cursor up to ``--depth`` pages; later pages are reported apart.
+
+Every worker keeps one request in flight for ``--duration`` seconds after
+``--warmup`` seconds that are not measured. Workers get their own random
+generator derived from ``--seed``, so runs issue the same requests. The
+generator is CPU bound itself, run it on cores the service does not use.
+Results are compared with ``benchmarks.compare``.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Callable
+
+import httpx
+
+from benchmarks.workload import ZipfSampler, percentile, seed_short_id
+
+Record = Callable[[str, float, int], None]
+
+
+class Scenario(ABC):
+    """Requests one worker issues in a loop."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+
+    @abstractmethod
+    async def step(
+            self, client: httpx.AsyncClient, rng: random.Random,
+            record: Record
+    ) -> None:
+        """Issue requests of one iteration and record their latency."""
+
+    @staticmethod
+    async def timed(
+            client: httpx.AsyncClient, record: Record, label: str,
+            method: str, url: str, **kwargs
+    ) -> httpx.Response:
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        record(label, time.perf_counter() - started, response.status_code)
+        return response
+
+
+class RedirectScenario(Scenario):
+
+    def __init__(self, args: argparse.Namespace):
+        super().__init__(args)
+        self._sampler = ZipfSampler(args.urls, args.zipf)
+
+    async def step(self, client, rng, record) -> None:
+        short_id = seed_short_id(self._sampler.sample(rng))
+        await self.timed(client, record, 'redirect', 'GET', short_id)
+
+
+class BulkScenario(Scenario):
+
+    def __init__(self, args: argparse.Namespace):
+        super().__init__(args)
+        self._run = f'{time.time_ns():x}'
+
+    async def step(self, client, rng, record) -> None:
+        prefix = f'https://example.com/bulk/{self._run}/{rng.getrandbits(64)}'
+        body = [
+            {'original_url': f'{prefix}/{number}'}
+            for number in range(self.args.batch)
+        ]
+        await self.timed(client, record, 'bulk', 'POST', 'shorten', json=body)
+
+
+class StatusScenario(Scenario):
+
+    async def step(self, client, rng, record) -> None:
+        short_id = seed_short_id(rng.randrange(self.args.hot))
+        params = {'full-info': 'true', 'max-result': self.args.page_size}
+        for page in range(self.args.depth):
+            response = await self.timed(
+                client, record, 'status' if page == 0 else 'status.deep',
+                'GET', f'{short_id}/status', params=params
+            )
+            cursor = response.headers.get('X-Next-Cursor')
+            if cursor is None:
+                break
+            params['cursor'] = cursor
+
+
+SCENARIOS = {
+    'redirect': RedirectScenario,
+    'bulk': BulkScenario,
+    'status': StatusScenario,
+}
+
+
+class Recorder:
+    """Latencies and status codes per label of the measured window."""
+
+    def __init__(self):
+        self.measuring = False
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.statuses: dict[str, Counter] = defaultdict(Counter)
+        self.failures = 0
+
+    def __call__(self, label: str, seconds: float, status_code: int) -> None:
+        if self.measuring:
+            self.latencies[label].append(seconds)
+            self.statuses[label][status_code] += 1
+
+    def summary(self, duration: float) -> dict:
+        labels = {}
+        for label, latencies in sorted(self.latencies.items()):
+            latencies.sort()
+            labels[label] = {
+                'requests': len(latencies),
+                'rps': round(len(latencies) / duration, 1),
+                'statuses': {
+                    str(code): count
+                    for code, count in sorted(self.statuses[label].items())
+                },
+                'latency_ms': {
+                    name: round(percentile(latencies, percent) * 1000, 3)
+                    for name, percent in (
+                        ('p50', 50), ('p95', 95), ('p99', 99), ('max', 100)
+                    )
+                },
+            }
+        return labels
+
+
+async def worker(
+        scenario: Scenario, client: httpx.AsyncClient, rng: random.Random,
+        recorder: Recorder, deadline: float
+) -> None:
+    while time.perf_counter() < deadline:
+        try:
+            await scenario.step(client, rng, recorder)
+        except httpx.HTTPError:
+            if recorder.measuring:
+                recorder.failures += 1
+
+
+async def run(args: argparse.Namespace) -> dict:
+    scenario = SCENARIOS[args.scenario](args)
+    recorder = Recorder()
+    limits = httpx.Limits(
+        max_connections=args.concurrency,
+        max_keepalive_connections=args.concurrency
+    )
+    base_url = args.base_url.rstrip('/') + '/'
+    started_at = datetime.utcnow().isoformat(timespec='seconds')
+    async with httpx.AsyncClient(
+            base_url=base_url, limits=limits, timeout=args.timeout
+    ) as client:
+        deadline = time.perf_counter() + args.warmup + args.duration
+        workers = [
+            asyncio.create_task(worker(
+                scenario, client, random.Random(f'{args.seed}:{number}'),
+                recorder, deadline
+            ))
+            for number in range(args.concurrency)
+        ]
+        await asyncio.sleep(args.warmup)
+        recorder.measuring = True
+        started = time.perf_counter()
+        await asyncio.gather(*workers)
+        duration = time.perf_counter() - started
+    return {
+        'scenario': args.scenario,
+        'started_at': started_at,
+        'commit': git_commit(),
+        'host': platform.node(),
+        'params': {
+            name: value for name, value in vars(args).items()
+            if name not in ('output', 'scenario')
+        },
+        'duration': round(duration, 3),
+        'failures': recorder.failures,
+        'labels': recorder.summary(duration),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('scenario', choices=list(SCENARIOS))
+    parser.add_argument(
+        '--base-url', default='http://127.0.0.1:8000/api/v1/'
+    )
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--timeout', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument(
+        '--urls', type=int, default=1_000_000,
+        help='Seeded urls, as passed to benchmarks.seed.'
+    )
+    parser.add_argument('--zipf', type=float, default=1.1)
+    parser.add_argument('--batch', type=int, default=100)
+    parser.add_argument(
+        '--hot', type=int, default=100,
+        help='Status of this many most used seeded urls.'
+    )
+    parser.add_argument('--depth', type=int, default=10)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--output', help='Save results as JSON.')
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(f'{args.scenario}: {results["duration"]}s, '
+          f'{results["failures"]} failed requests')
+    print(f'{"label":<12} {"requests/s":>12} {"p50 ms":>9} {"p95 ms":>9} '
+          f'{"p99 ms":>9}  statuses')
+    for label, stats in results['labels'].items():
+        latency = stats['latency_ms']
+        print(f'{label:<12} {stats["rps"]:>12,.1f} {latency["p50"]:>9.2f} '
+              f'{latency["p95"]:>9.2f} {latency["p99"]:>9.2f}  '
+              f'{stats["statuses"]}')
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
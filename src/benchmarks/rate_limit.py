@@ -0,0 +1,87 @@
+"""Rate limiter overhead on the redirect path.
+
+Run from the ``src`` directory::
+
+    python -m benchmarks.rate_limit --requests 200000 --clients 10000
+
+Requests go straight into the middleware stack in front of a no-op ASGI
+app, so the difference between the rows is the limiter cost only. The
+``postgres`` backend needs the database from ``DATABASE_DSN``.
+"""
+import argparse
+import asyncio
+import time
+
+from core.middleware import (BlackList, BlackListMiddleware,
+                             RateLimitMiddleware)
+from db.db import async_session
+from services.rate_limit import build_rate_limit_backend
+
+
+async def endpoint(scope, receive, send) -> None:
+    await send({'type': 'http.response.start', 'status': 307,
+                'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def receive() -> dict:
+    return {'type': 'http.request', 'body': b''}
+
+
+async def send(message: dict) -> None:
+    pass
+
+
+async def run(app, requests: int, clients: int) -> float:
+    scopes = [
+        {
+            'type': 'http', 'method': 'GET', 'path': '/api/v1/AbCd1234',
+            'headers': [], 'client': (f'10.{i >> 16 & 255}.'
+                                      f'{i >> 8 & 255}.{i & 255}', 1234),
+        }
+        for i in range(clients)
+    ]
+    started = time.perf_counter()
+    for number in range(requests):
+        await app(scopes[number % clients], receive, send)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200_000)
+    parser.add_argument('--clients', type=int, default=10_000)
+    parser.add_argument(
+        '--backend', choices=['memory', 'postgres'], default='memory'
+    )
+    args = parser.parse_args()
+
+    black_list = BlackListMiddleware(
+        endpoint, black_list=BlackList(['192.0.2.0/24'])
+    )
+    limited = RateLimitMiddleware(
+        black_list,
+        backend=build_rate_limit_backend(args.backend, async_session),
+        limits={'redirect': (1_000_000, 1_000_000)}
+    )
+    results = {
+        'no middleware': asyncio.run(
+            run(endpoint, args.requests, args.clients)
+        ),
+        'black list': asyncio.run(
+            run(black_list, args.requests, args.clients)
+        ),
+        f'+ rate limit ({args.backend})': asyncio.run(
+            run(limited, args.requests, args.clients)
+        ),
+    }
+    print(f'{"stack":<24} {"requests/s":>12} {"us/request":>11}')
+    for name, elapsed in results.items():
+        print(
+            f'{name:<24} {args.requests / elapsed:>12,.0f} '
+            f'{elapsed / args.requests * 1e6:>11.2f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
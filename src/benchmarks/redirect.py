@@ -0,0 +1,105 @@
+"""Redirects per second through get_url and through the ASGI fast path.
+
+Run from the ``src`` directory::
+
+    python -m benchmarks.redirect --requests 20000 --urls 10000
+
+Both rows run the full middleware stack of the app in process, with all
+urls cached and usage counts and history taken by the background workers
+(their batches are discarded), so the database is not touched and the
+difference is routing, dependency injection and response handling.
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+os.environ['REDIRECT_FAST_PATH'] = 'false'
+
+from starlette.middleware import Middleware  # noqa: E402
+
+from api.v1.redirect import RedirectMiddleware  # noqa: E402
+from main import app  # noqa: E402
+from services.cache import CachedUrl  # noqa: E402
+from services.short_url import (history_writer, urls_cache,  # noqa: E402
+                                usage_counter)
+
+
+async def discard(batch) -> None:
+    pass
+
+
+async def receive() -> dict:
+    return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+
+def make_scope(short_id: str) -> dict:
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'root_path': '',
+        'path': f'/api/v1/{short_id}',
+        'raw_path': f'/api/v1/{short_id}'.encode(), 'query_string': b'',
+        'headers': [(b'host', b'127.0.0.1:8000'),
+                    (b'user-agent', b'benchmark/1.0')],
+        'client': ('127.0.0.1', 40000), 'server': ('127.0.0.1', 8000),
+    }
+
+
+async def run(asgi_app, short_ids: list[str], requests: int) -> float:
+    statuses = []
+
+    async def send(message: dict) -> None:
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+
+    started = time.perf_counter()
+    for number in range(requests):
+        await asgi_app(
+            make_scope(short_ids[number % len(short_ids)]), receive, send
+        )
+    elapsed = time.perf_counter() - started
+    if set(statuses) != {307}:
+        raise RuntimeError(f'Unexpected statuses: {set(statuses)}')
+    return elapsed
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    short_ids = [f'b{number:07d}' for number in range(args.urls)]
+    for short_id in short_ids:
+        urls_cache.set(short_id, CachedUrl(
+            uuid.uuid4(), f'https://example.com/{short_id}'
+        ))
+    await usage_counter.start(flush=discard)
+    await history_writer.start(write=discard)
+    try:
+        results = {'get_url endpoint': await run(
+            app.build_middleware_stack(), short_ids, args.requests
+        )}
+        app.user_middleware.append(Middleware(RedirectMiddleware))
+        results['fast path'] = await run(
+            app.build_middleware_stack(), short_ids, args.requests
+        )
+    finally:
+        await usage_counter.stop()
+        await history_writer.stop()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20_000)
+    parser.add_argument('--urls', type=int, default=10_000)
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    print(f'{"path":<18} {"requests/s":>12} {"us/request":>11}')
+    for name, elapsed in results.items():
+        print(
+            f'{name:<18} {args.requests / elapsed:>12,.0f} '
+            f'{elapsed / args.requests * 1e6:>11.2f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
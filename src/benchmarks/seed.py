@@ -0,0 +1,133 @@
+"""Seed short urls and usage history for load tests.
+
+Run from the ``src`` directory after ``alembic upgrade head``::
+
+    python -m benchmarks.seed --urls 1000000 --history 10000000
+
+Rows are written with binary COPY straight through asyncpg, which loads
+millions of rows in minutes. Url numbers map to fixed short ids (see
+``benchmarks.workload``), so the load generator picks existing ids without
+reading them back. History is Zipf distributed over the urls like the
+redirect scenario, spread evenly over the last ``--days`` days; missing
+history partitions are created. Usage rollups are not filled. Seeded
+ids are fixed, so seed a database once.
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import asyncpg
+
+from benchmarks.workload import (ZipfSampler, seed_original_url,
+                                 seed_short_id, seed_url_id)
+from core.config import app_settings
+from db.partitions import (create_partition_sql, partition_end,
+                           partition_start)
+from services.base import url_digest
+
+CHUNK = 100_000
+USER_AGENTS = [
+    'Mozilla/5.0 (X11; Linux x86_64)',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64)',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X)',
+    'curl/7.85.0',
+    'python-httpx/0.23.1',
+]
+
+
+def url_records(start: int, stop: int, created_at: datetime):
+    for number in range(start, stop):
+        original_url = seed_original_url(number)
+        yield (
+            seed_url_id(number), created_at, original_url,
+            url_digest(original_url), seed_short_id(number), 0, False
+        )
+
+
+def history_records(
+        count: int, sampler: ZipfSampler, rng: random.Random,
+        since: datetime, seconds: int
+):
+    for _ in range(count):
+        yield (
+            uuid.UUID(int=rng.getrandbits(128), version=4),
+            seed_url_id(sampler.sample(rng)),
+            rng.choice(USER_AGENTS),
+            since + timedelta(seconds=rng.random() * seconds),
+        )
+
+
+async def create_partitions(
+        connection: asyncpg.Connection, since: datetime
+) -> None:
+    interval = app_settings.history_partition_interval
+    start = partition_start(since, interval)
+    while start <= datetime.utcnow():
+        await connection.execute(create_partition_sql(start, interval))
+        start = partition_end(start, interval)
+
+
+async def seed(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    connection = await asyncpg.connect(
+        app_settings.database_dsn.replace('+asyncpg', '', 1)
+    )
+    now = datetime.utcnow()
+    since = now - timedelta(days=args.days)
+    try:
+        started = time.perf_counter()
+        for start in range(0, args.urls, CHUNK):
+            await connection.copy_records_to_table(
+                'short_url',
+                records=url_records(
+                    start, min(start + CHUNK, args.urls), since
+                ),
+                columns=[
+                    'id', 'created_at', 'original_url',
+                    'original_url_digest', 'short_id', 'usage_count',
+                    'del_status',
+                ],
+            )
+        print(f'short_url: {args.urls:,} rows in '
+              f'{time.perf_counter() - started:.1f}s')
+
+        started = time.perf_counter()
+        await create_partitions(connection, since)
+        sampler = ZipfSampler(args.urls, args.zipf)
+        for start in range(0, args.history, CHUNK):
+            await connection.copy_records_to_table(
+                'short_url_history',
+                records=history_records(
+                    min(CHUNK, args.history - start), sampler, rng, since,
+                    args.days * 86400
+                ),
+                columns=['id', 'short_url', 'user_agent', 'used_at'],
+            )
+        await connection.execute(
+            'UPDATE short_url SET usage_count = used.count FROM ('
+            'SELECT short_url, count(*) AS count FROM short_url_history '
+            'GROUP BY short_url) AS used WHERE short_url.id = used.short_url'
+        )
+        print(f'short_url_history: {args.history:,} rows in '
+              f'{time.perf_counter() - started:.1f}s')
+        await connection.execute('ANALYZE short_url')
+        await connection.execute('ANALYZE short_url_history')
+    finally:
+        await connection.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--urls', type=int, default=1_000_000)
+    parser.add_argument('--history', type=int, default=10_000_000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--zipf', type=float, default=1.1)
+    parser.add_argument('--seed', type=int, default=1)
+    asyncio.run(seed(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
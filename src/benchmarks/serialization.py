@@ -0,0 +1,89 @@
+"""Bulk create request and response encoding cost per item.
+
+Run from the ``src`` directory::
+
+    python -m benchmarks.serialization --items 10000
+
+``pydantic`` is the previous path: jsonable_encoder over the parsed body
+and FastAPI response_model validation of the returned rows before
+orjson. ``direct`` builds insert values and response items from the same
+data with plain dicts. Body parsing into OriginalUrlsList is common to
+both and is not measured.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from collections import namedtuple
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from api.v1.base import short_url_content
+from models.short_url import short_url_for
+from schemas.short_url import OriginalUrlsList, ShortUrlsList
+from services.base import url_data
+
+
+class CreatedRow(
+        namedtuple('CreatedRow', ['id', 'short_id', 'original_url'])
+):
+    """Bulk create RETURNING row with short url derived like the model."""
+
+    @property
+    def short_url(self) -> str:
+        return short_url_for(self.short_id)
+
+
+def make_rows(count: int) -> list[CreatedRow]:
+    return [
+        CreatedRow(
+            uuid.uuid4(), f'{number:08d}',
+            f'https://example.com/page/{number}'
+        )
+        for number in range(count)
+    ]
+
+
+def run_pydantic(obj_in: OriginalUrlsList, rows: list) -> float:
+    field = create_response_field('bench', ShortUrlsList)
+    started = time.perf_counter()
+    jsonable_encoder(obj_in)
+    content = asyncio.run(serialize_response(
+        field=field, response_content=rows
+    ))
+    orjson.dumps(content)
+    return time.perf_counter() - started
+
+
+def run_direct(obj_in: OriginalUrlsList, rows: list) -> float:
+    started = time.perf_counter()
+    [url_data(item) for item in obj_in.__root__]
+    orjson.dumps([short_url_content(row) for row in rows])
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    obj_in = OriginalUrlsList.parse_obj([
+        {'original_url': f'https://example.com/page/{number}'}
+        for number in range(args.items)
+    ])
+    rows = make_rows(args.items)
+    print(f'{"path":<10} {"batch ms":>10} {"us/item":>9}')
+    for name, run in (('pydantic', run_pydantic), ('direct', run_direct)):
+        elapsed = min(run(obj_in, rows) for _ in range(args.repeat))
+        print(
+            f'{name:<10} {elapsed * 1000:>10.1f} '
+            f'{elapsed / args.items * 1e6:>9.2f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Shared pieces of the seeding tool and the load generator."""
+import math
+import random
+import uuid
+from bisect import bisect_left
+from itertools import accumulate
+
+from services.id_generator import base62_encode
+
+# Seeded short ids start with 'z', far beyond what the sequence generators
+# reach, so seeding does not collide with ids the service issues later.
+SEED_ID_BASE = 61 * 62 ** 7
+SEED_UUID_BASE = 0x5eed << 112
+
+
+def seed_short_id(number: int, length: int = 8) -> str:
+    """Short id of the seeded url number, known without the database."""
+
+    return base62_encode(SEED_ID_BASE + number, length)
+
+
+def seed_url_id(number: int) -> uuid.UUID:
+    return uuid.UUID(int=SEED_UUID_BASE + number)
+
+
+def seed_original_url(number: int) -> str:
+    return f'https://example.com/seed/{number}'
+
+
+class ZipfSampler:
+    """Url numbers from 0 to ``count - 1``, number k has weight 1/(k+1)^s.
+
+    Cumulative weights are built once and shared by the callers, a sample
+    is one binary search.
+    """
+
+    def __init__(self, count: int, exponent: float):
+        self._cumulative = list(accumulate(
+            1 / rank ** exponent for rank in range(1, count + 1)
+        ))
+        self._total = self._cumulative[-1]
+
+    def sample(self, rng: random.Random) -> int:
+        return bisect_left(self._cumulative, rng.random() * self._total)
+
+
+def percentile(ordered: list[float], percent: float) -> float:
+    """Nearest rank percentile of sorted values."""
+
+    if not ordered:
+        return 0.0
+    rank = math.ceil(percent / 100 * len(ordered))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
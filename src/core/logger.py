@@ -1,5 +1,178 @@
+import logging
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+import orjson
+
+# Logging is configured before the settings are loaded, so it is set up
+# from the environment directly.
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 LOG_DEFAULT_HANDLERS = ['console']
+LOG_OUTPUT = os.environ.get('LOG_OUTPUT', 'json')
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+LOG_MAX_LENGTH = int(os.environ.get('LOG_MAX_LENGTH', 2000))
+LOG_SAMPLE_RATES = os.environ.get(
+    'LOG_SAMPLE_RATES', 'api.v1.base.redirect=0.01'
+)
+
+RECORD_ATTRIBUTES = {
+    *logging.makeLogRecord({}).__dict__, 'message', 'asctime', 'taskName'
+}
+
+
+def truncate(text: str, max_length: int) -> str:
+    if len(text) <= max_length:
+        return text
+    return f'{text[:max_length]}... [{len(text) - max_length} more]'
+
+
+def parse_sample_rates(value: str) -> dict[str, float]:
+    """Rates from ``logger=rate`` pairs separated by commas."""
+
+    rates = {}
+    for pair in value.split(','):
+        name, _, rate = pair.partition('=')
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, long values are truncated.
+
+    Values passed in ``extra`` are added as fields.
+    """
+
+    def __init__(self, max_length: int = LOG_MAX_LENGTH):
+        super().__init__()
+        self._max_length = max_length
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': datetime.fromtimestamp(
+                record.created, timezone.utc
+            ).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': truncate(record.getMessage(), self._max_length),
+        }
+        for name, value in record.__dict__.items():
+            if name not in RECORD_ATTRIBUTES and not name.startswith('_'):
+                if not isinstance(value, (int, float, bool, type(None))):
+                    value = truncate(str(value), self._max_length)
+                data[name] = value
+        if record.exc_info:
+            data['exception'] = truncate(
+                self.formatException(record.exc_info), 4 * self._max_length
+            )
+        return orjson.dumps(data).decode()
+
+
+class TextFormatter(logging.Formatter):
+    """Plain text record truncated to ``max_length``."""
+
+    def __init__(
+            self, fmt: Optional[str] = None, max_length: int = LOG_MAX_LENGTH
+    ):
+        super().__init__(fmt)
+        self._max_length = max_length
+
+    def format(self, record: logging.LogRecord) -> str:
+        return truncate(super().format(record), 4 * self._max_length)
+
+
+class SamplingFilter(logging.Filter):
+    """Pass a share of INFO and lower records of the given loggers."""
+
+    def __init__(self, rates: str = LOG_SAMPLE_RATES):
+        super().__init__()
+        self._rates = parse_sample_rates(rates)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self._rates.get(record.name)
+        if rate is None or record.levelno > logging.INFO:
+            return True
+        return random.random() < rate
+
+
+class WriterListener(QueueListener):
+    """Queue listener that waits for room for its stop sentinel."""
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+class AsyncQueueHandler(QueueHandler):
+    """Hand records over to a thread that formats and writes them.
+
+    The caller only puts the record into a bounded queue, records are
+    dropped and counted when the queue is full. Messages are formatted by
+    the writer thread, so log arguments should be plain values. The thread
+    starts with the first record of the process, so a handler created
+    before a fork writes from the forked worker.
+    """
+
+    def __init__(
+            self, stream: str = 'stderr', queue_size: int = LOG_QUEUE_SIZE
+    ):
+        super().__init__(queue.Queue(queue_size))
+        self.dropped = 0
+        self._queue_size = queue_size
+        self._target = logging.StreamHandler(getattr(sys, stream))
+        self._listener: Optional[WriterListener] = None
+        self._pid: Optional[int] = None
+
+    def setFormatter(self, fmt: Optional[logging.Formatter]) -> None:
+        super().setFormatter(fmt)
+        self._target.setFormatter(fmt)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        # Called under the handler lock.
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self) -> None:
+        """Start the writer thread, threads do not survive a fork."""
+
+        if self._pid is not None:
+            self.queue = queue.Queue(self._queue_size)
+        self._listener = WriterListener(self.queue, self._target)
+        self._listener.start()
+        self._pid = os.getpid()
+
+    def close(self) -> None:
+        """Write queued records and stop the writer thread."""
+
+        if self._pid == os.getpid():
+            self._listener.stop()
+        self._pid = None
+        self._target.close()
+        super().close()
+
+
+def dropped_records() -> int:
+    """Records dropped by full queues of the configured handlers."""
+
+    handlers = {
+        *logging.getLogger().handlers,
+        *logging.getLogger('uvicorn.access').handlers,
+    }
+    return sum(
+        handler.dropped for handler in handlers
+        if isinstance(handler, AsyncQueueHandler)
+    )
 
 
 LOGGING = {
@@ -7,7 +180,11 @@ LOGGING = {
     'disable_existing_loggers': False,
     'formatters': {
         'verbose': {
-            'format': LOG_FORMAT
+            '()': 'core.logger.TextFormatter',
+            'fmt': LOG_FORMAT,
+        },
+        'json': {
+            '()': 'core.logger.JsonFormatter',
         },
         'default': {
             '()': 'uvicorn.logging.DefaultFormatter',
@@ -20,11 +197,17 @@ LOGGING = {
                    "'%(request_line)s' %(status_code)s",
         },
     },
+    'filters': {
+        'sampling': {
+            '()': 'core.logger.SamplingFilter',
+        },
+    },
     'handlers': {
         'console': {
+            '()': 'core.logger.AsyncQueueHandler',
             'level': 'DEBUG',
-            'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
+            'formatter': 'json' if LOG_OUTPUT == 'json' else 'verbose',
+            'filters': ['sampling'],
         },
         'default': {
             'formatter': 'default',
@@ -32,9 +215,9 @@ LOGGING = {
             'stream': 'ext://sys.stdout',
         },
         'access': {
-            'formatter': 'access',
-            'class': 'logging.StreamHandler',
-            'stream': 'ext://sys.stdout',
+            '()': 'core.logger.AsyncQueueHandler',
+            'formatter': 'json' if LOG_OUTPUT == 'json' else 'access',
+            'stream': 'stdout',
         },
     },
     'loggers': {
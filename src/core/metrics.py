@@ -0,0 +1,200 @@
+import logging
+import os
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Optional
+
+from fastapi import Response
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from services.periodic import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency.',
+    ['method', 'route', 'status']
+)
+REQUEST_STAGE_LATENCY = Histogram(
+    'http_request_stage_duration_seconds',
+    'HTTP request time spent in middleware, app, db and serialization.',
+    ['route', 'stage']
+)
+DB_QUERY_LATENCY = Histogram(
+    'db_query_duration_seconds',
+    'Database statement latency per repository method.', ['method']
+)
+POOL_CONNECTIONS = Gauge(
+    'db_pool_connections', 'Pool connections by state.',
+    ['engine', 'state'], multiprocess_mode='livesum'
+)
+CACHE_EVENTS = Gauge(
+    'url_cache_events', 'Url cache hits, misses and evictions.',
+    ['event'], multiprocess_mode='livesum'
+)
+CACHE_SIZE = Gauge(
+    'url_cache_size', 'Urls in cache.', multiprocess_mode='livesum'
+)
+QUEUE_DEPTH = Gauge(
+    'background_queue_depth', 'Items waiting in background queues.',
+    ['queue'], multiprocess_mode='livesum'
+)
+HISTORY_DROPPED = Gauge(
+    'history_events_dropped', 'Usage history events lost or dropped.',
+    multiprocess_mode='livesum'
+)
+
+_request_stages: ContextVar[Optional[dict]] = ContextVar(
+    'request_stages', default=None
+)
+_repository_method: ContextVar[str] = ContextVar(
+    'repository_method', default='other'
+)
+
+
+def add_stage_time(stage: str, seconds: float) -> None:
+    """Add time to a stage of the current request."""
+
+    stages = _request_stages.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+def repository_method(func: Callable) -> Callable:
+    """Label database statements of the method with its name."""
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = _repository_method.set(func.__qualname__)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            _repository_method.reset(token)
+
+    return wrapper
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Observe statement latency of the engine."""
+
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def before_execute(conn, cursor, statement, parameters, context,
+                       executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def after_execute(conn, cursor, statement, parameters, context,
+                      executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        DB_QUERY_LATENCY.labels(_repository_method.get()).observe(elapsed)
+        add_stage_time('db', elapsed)
+
+    @event.listens_for(engine.sync_engine, 'handle_error')
+    def handle_error(context):
+        if context.connection is not None:
+            started = context.connection.info.get('query_started')
+            if started:
+                started.pop()
+
+
+def route_label(scope: Scope) -> str:
+    route = scope.get('route')
+    return getattr(route, 'path', None) or 'unmatched'
+
+
+class MetricsMiddleware:
+    """Outermost middleware, observes request latency by stage.
+
+    ``app`` time is reported by AppTimerMiddleware at the bottom of the
+    middleware stack, the rest of the request is ``middleware`` time.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(
+            self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        response_status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_status
+            if message['type'] == 'http.response.start':
+                response_status = message['status']
+            await send(message)
+
+        stages = {}
+        token = _request_stages.set(stages)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_stages.reset(token)
+            route = route_label(scope)
+            REQUEST_LATENCY.labels(
+                scope['method'], route, response_status
+            ).observe(elapsed)
+            app_time = stages.pop('app', 0.0)
+            stages['middleware'] = elapsed - app_time
+            stages['app'] = max(
+                app_time - stages.get('db', 0.0)
+                - stages.get('serialization', 0.0), 0.0
+            )
+            for stage, seconds in stages.items():
+                REQUEST_STAGE_LATENCY.labels(route, stage).observe(seconds)
+
+
+class AppTimerMiddleware:
+    """Innermost middleware, reports time spent in routing and endpoint."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(
+            self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            add_stage_time('app', time.perf_counter() - started)
+
+
+def metrics_response() -> Response:
+    """Metrics of all workers in Prometheus text format."""
+
+    registry = REGISTRY
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(
+        generate_latest(registry),
+        headers={'Content-Type': CONTENT_TYPE_LATEST}
+    )
+
+
+class GaugeUpdater(PeriodicTask):
+    """Refresh gauges of the worker periodically.
+
+    A scrape is answered by one worker, the others are seen by their last
+    update.
+    """
+
+    failure_message = 'Metrics gauges are not updated'
+
+    def __init__(self, update: Callable[[], None], period: float):
+        super().__init__(period)
+        self._update = update
+
+    async def run_once(self) -> None:
+        self._update()
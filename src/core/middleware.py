@@ -1,27 +1,304 @@
-import logging.config
-from typing import Callable
+import ipaddress
+import logging
+import math
+import os
+import socket
+from bisect import bisect_right
+from typing import Iterable, Optional
 
-from fastapi import Request, Response, status
+from fastapi import Response, status
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from core.logger import LOGGING
+from db.db import track_queries
+from services.periodic import PeriodicTask
+from services.rate_limit import RateLimitBackend
 
-logging.config.dictConfig(LOGGING)
 logger = logging.getLogger(__name__)
 
+API_PREFIX = '/api/v1/'
+QUERY_STATS_HEADER = b'x-query-stats'
+SERVICE_PATHS = {'ping', 'cache'}
+IPV4_MAPPED_PREFIX = bytes(10) + b'\xff\xff'
+
+
+def address_value(address: str) -> Optional[tuple[int, int]]:
+    """IP version and integer value of the address, None if invalid."""
+
+    try:
+        return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, address),
+                                 'big')
+    except OSError:
+        pass
+    try:
+        packed = socket.inet_pton(socket.AF_INET6, address)
+    except OSError:
+        return None
+    if packed[:12] == IPV4_MAPPED_PREFIX:
+        return 4, int.from_bytes(packed[12:], 'big')
+    return 6, int.from_bytes(packed, 'big')
+
+
+class IpRanges:
+    """IPv4 and IPv6 networks as merged sorted integer ranges.
+
+    Lookup is a binary search over range starts of the address family.
+    """
+
+    def __init__(self, networks: Iterable[str] = ()):
+        ranges = {4: [], 6: []}
+        for network in networks:
+            try:
+                parsed = ipaddress.ip_network(network.strip(), strict=False)
+            except ValueError:
+                logger.warning('Skip invalid network %r', network)
+                continue
+            ranges[parsed.version].append((
+                int(parsed.network_address), int(parsed.broadcast_address)
+            ))
+        self._starts = {}
+        self._ends = {}
+        for version, version_ranges in ranges.items():
+            merged = []
+            for start, end in sorted(version_ranges):
+                if merged and start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self._starts[version] = [start for start, _ in merged]
+            self._ends[version] = [end for _, end in merged]
+
+    def __len__(self) -> int:
+        return len(self._starts[4]) + len(self._starts[6])
+
+    def __contains__(self, address: str) -> bool:
+        if not self:
+            return False
+        parsed = address_value(address)
+        if parsed is None:
+            return False
+        version, value = parsed
+        index = bisect_right(self._starts[version], value) - 1
+        return index >= 0 and value <= self._ends[version][index]
+
+
+def read_networks(path: str) -> list[str]:
+    """Networks from a file, one per line, ``#`` starts a comment."""
+
+    with open(path) as file:
+        lines = (line.split('#', 1)[0].strip() for line in file)
+        return [line for line in lines if line]
+
+
+def client_host(scope: Scope, trusted: IpRanges) -> Optional[str]:
+    """Client address, from X-Forwarded-For behind trusted proxies."""
+
+    client = scope.get('client')
+    host = client[0] if client else None
+    if host is None or host not in trusted:
+        return host
+    for name, value in scope['headers']:
+        if name == b'x-forwarded-for':
+            hops = [hop.strip() for hop in value.decode('latin-1').split(',')]
+            for hop in reversed(hops):
+                if hop not in trusted:
+                    return hop
+    return host
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    """Rate limit class of the request, None when it is not limited."""
+
+    if not path.startswith(API_PREFIX):
+        return None
+    rest = path[len(API_PREFIX):]
+    if method == 'POST':
+        return 'create'
+    if (method == 'GET' and rest and '/' not in rest
+            and rest not in SERVICE_PATHS):
+        return 'redirect'
+    return None
+
+
+class BlackList:
+    """Black listed networks by source, shared with the middleware.
+
+    Settings, the black list file reloader or an admin hook each replace
+    their own source with ``update``, requests are checked against the
+    merged ranges of all sources.
+    """
+
+    def __init__(self, networks: Iterable[str] = ()):
+        self._sources: dict[str, list[str]] = {}
+        self._ranges = IpRanges()
+        if networks:
+            self.update('settings', networks)
+
+    def update(self, source: str, networks: Iterable[str]) -> None:
+        self._sources[source] = list(networks)
+        self._ranges = IpRanges([
+            network for networks in self._sources.values()
+            for network in networks
+        ])
+        logger.info(
+            'Black list %s loaded: %d ranges', source, len(self._ranges)
+        )
+
+    def __contains__(self, address: str) -> bool:
+        return address in self._ranges
+
+
+denied_networks = BlackList()
+
+
+class BlackListReloader(PeriodicTask):
+    """Load networks of the black list file when the file changes."""
+
+    failure_message = 'Black list file is not loaded'
+
+    def __init__(
+            self, file: Optional[str], period: float,
+            black_list: Optional[BlackList] = None
+    ):
+        super().__init__(period)
+        self._file = file
+        self._black_list = (
+            denied_networks if black_list is None else black_list
+        )
+        self._file_mtime: Optional[float] = None
+
+    async def start(self) -> None:
+        if self._file:
+            await super().start()
+
+    def reload(self) -> None:
+        if not self._file:
+            return
+        try:
+            mtime = os.stat(self._file).st_mtime
+            if mtime != self._file_mtime:
+                self._black_list.update('file', read_networks(self._file))
+                self._file_mtime = mtime
+        except OSError as error:
+            logger.warning('%s: %s', self.failure_message, error)
+
+    async def run_once(self) -> None:
+        self.reload()
+
 
 class BlackListMiddleware:
+    """Deny requests from black listed addresses and networks.
+
+    The client address is taken from X-Forwarded-For only when the peer is
+    a trusted proxy. Networks are read from ``black_list``, the module
+    level ``denied_networks`` by default.
+    """
 
-    def __init__(self, black_list: list[str]):
-        self._black_list = black_list
+    def __init__(
+            self, app: ASGIApp, black_list: Optional[BlackList] = None,
+            trusted_proxies: Iterable[str] = ()
+    ):
+        self.app = app
+        self._black_list = (
+            denied_networks if black_list is None else black_list
+        )
+        self._trusted = IpRanges(trusted_proxies)
 
     async def __call__(
-            self, request: Request, call_next: Callable
-    ) -> Response:
-        if request.client and request.client.host in self._black_list:
-            logger.info(
-                f'Client {request.client.host} from black list send request'
-            )
-            return Response(
+            self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        host = client_host(scope, self._trusted)
+        if host is not None and host in self._black_list:
+            logger.info('Client %s from black list send request', host)
+            response = Response(
                 'Access denied', status_code=status.HTTP_403_FORBIDDEN
             )
-        return await call_next(request)
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+class RateLimitMiddleware:
+    """Limit request rate per client and route class.
+
+    ``limits`` maps a route class to its rate per second and burst, other
+    requests pass through. Rejected requests get 429 with Retry-After.
+    """
+
+    def __init__(
+            self, app: ASGIApp, backend: RateLimitBackend,
+            limits: dict[str, tuple[float, int]],
+            trusted_proxies: Iterable[str] = ()
+    ):
+        self.app = app
+        self._backend = backend
+        self._limits = {
+            name: limit for name, limit in limits.items() if limit[0] > 0
+        }
+        self._trusted = IpRanges(trusted_proxies)
+
+    async def __call__(
+            self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        name = route_class(scope['method'], scope['path'])
+        limit = self._limits.get(name)
+        host = client_host(scope, self._trusted) if limit else None
+        if host is None:
+            await self.app(scope, receive, send)
+            return
+        retry_after = await self._backend.hit(f'{name}:{host}', *limit)
+        if retry_after:
+            logger.info('Client %s is rate limited on %s', host, name)
+            response = JSONResponse(
+                {'detail': 'Too many requests'},
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={'Retry-After': str(math.ceil(retry_after))}
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+class QueryStatsMiddleware:
+    """Count database work per request.
+
+    With ``header`` the counts made before the response starts are sent in
+    X-Query-Stats. Requests with more statements than ``log_threshold``
+    are logged with the final counts, 0 disables the log.
+    """
+
+    def __init__(
+            self, app: ASGIApp, header: bool = False, log_threshold: int = 0
+    ):
+        self.app = app
+        self._header = header
+        self._log_threshold = log_threshold
+
+    async def __call__(
+            self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        with track_queries() as stats:
+
+            async def send_wrapper(message: Message) -> None:
+                if self._header and message['type'] == 'http.response.start':
+                    message['headers'] = [
+                        *message.get('headers', []),
+                        (QUERY_STATS_HEADER, str(stats).encode()),
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+        if self._log_threshold and stats.statements > self._log_threshold:
+            logger.warning(
+                '%s %s queries over budget: %s',
+                scope['method'], scope['path'], stats
+            )
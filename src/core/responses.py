@@ -0,0 +1,35 @@
+import time
+from typing import Any
+
+from fastapi import responses
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from core.metrics import add_stage_time
+
+
+class ORJSONResponse(responses.ORJSONResponse):
+    """ORJSONResponse that reports rendering as serialization stage."""
+
+    def render(self, content: Any) -> bytes:
+        started = time.perf_counter()
+        try:
+            return super().render(content)
+        finally:
+            add_stage_time('serialization', time.perf_counter() - started)
+
+
+class UploadStreamingResponse(StreamingResponse):
+    """Streaming response for endpoints that read the request body lazily.
+
+    Starlette listens for disconnect on ``receive`` while streaming, which
+    would race the body iterator for upload messages. Disconnect is seen by
+    the body reader instead.
+    """
+
+    async def __call__(
+            self, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
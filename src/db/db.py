@@ -1,18 +1,213 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from asyncpg import Connection
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import (AsyncEngine, AsyncSession,
+                                    create_async_engine)
 from sqlalchemy.orm import declarative_base, sessionmaker
 
-from core.config import app_settings
+from core.config import AppSettings, app_settings
+from core.metrics import instrument_engine
+from db.replicas import ReplicaRouter
+
+logger = logging.getLogger(__name__)
+
+_query_stats: ContextVar[Optional['QueryStats']] = ContextVar(
+    'query_stats', default=None
+)
+
+
+class PgBouncerConnection(Connection):
+    """asyncpg connection with prepared statement names unique per process.
+
+    Behind PgBouncer in transaction pooling mode the server connection is
+    shared by many clients, so the default sequential names collide.
+    """
+
+    def _get_unique_id(self, prefix: str) -> str:
+        return f'__asyncpg_{prefix}_{uuid.uuid4().hex}__'
+
+
+def engine_options(settings: AppSettings) -> dict:
+    """Keyword arguments of create_async_engine built from the settings."""
+
+    connect_args = {
+        'statement_cache_size': settings.db_statement_cache_size,
+        'prepared_statement_cache_size': (
+            settings.db_prepared_statement_cache_size
+        ),
+    }
+    if settings.db_pgbouncer:
+        connect_args.update(
+            statement_cache_size=0,
+            prepared_statement_cache_size=0,
+            connection_class=PgBouncerConnection,
+        )
+    return {
+        'echo': settings.engine_echo,
+        'future': True,
+        'pool_size': settings.db_pool_size,
+        'max_overflow': settings.db_max_overflow,
+        'pool_timeout': settings.db_pool_timeout,
+        'pool_recycle': settings.db_pool_recycle,
+        'pool_pre_ping': settings.db_pool_pre_ping,
+        'connect_args': connect_args,
+    }
+
+
+class QueryStats:
+    """Database work of a block, added to enclosing blocks as well.
+
+    ``statements`` counts executemany parameter sets one by one, while
+    ``round_trips`` counts them once and adds transaction begin, commit and
+    rollback.
+    """
+
+    __slots__ = ('statements', 'round_trips', 'rows', 'seconds', '_parent')
+
+    def __init__(self, parent: Optional['QueryStats'] = None):
+        self.statements = 0
+        self.round_trips = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self._parent = parent
+
+    def add(
+            self, statements: int = 0, round_trips: int = 0, rows: int = 0,
+            seconds: float = 0.0
+    ) -> None:
+        stats = self
+        while stats is not None:
+            stats.statements += statements
+            stats.round_trips += round_trips
+            stats.rows += rows
+            stats.seconds += seconds
+            stats = stats._parent
+
+    def __str__(self) -> str:
+        return (
+            f'statements={self.statements}, '
+            f'round-trips={self.round_trips}, rows={self.rows}, '
+            f'time-ms={self.seconds * 1000:.3f}'
+        )
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """Count database work of the block and tasks started from it."""
+
+    stats = QueryStats(_query_stats.get())
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+
+
+def count_queries(engine: AsyncEngine) -> None:
+    """Add database work of the engine to the tracked block, if any."""
+
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def before_execute(conn, cursor, statement, parameters, context,
+                       executemany):
+        if _query_stats.get() is not None:
+            conn.info.setdefault('query_stats_started', []).append(
+                time.perf_counter()
+            )
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after_execute(conn, cursor, statement, parameters, context,
+                      executemany):
+        stats = _query_stats.get()
+        if stats is None:
+            return
+        elapsed = time.perf_counter() - conn.info['query_stats_started'].pop()
+        rows = cursor.rowcount
+        if rows < 0:
+            # The asyncpg adapter fetches all rows of a statement at once.
+            rows = len(getattr(cursor, '_rows', None) or ())
+        stats.add(
+            statements=len(parameters) if executemany else 1,
+            round_trips=1, rows=rows, seconds=elapsed
+        )
+
+    @event.listens_for(sync_engine, 'handle_error')
+    def handle_error(context):
+        if _query_stats.get() is None or context.connection is None:
+            return
+        started = context.connection.info.get('query_stats_started')
+        if started:
+            started.pop()
+
+    for name in ('begin', 'commit', 'rollback'):
+        event.listen(sync_engine, name, transaction_round_trip)
+
+
+def transaction_round_trip(conn) -> None:
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.add(round_trips=1)
 
 
 Base = declarative_base()
 engine = create_async_engine(
-    app_settings.database_dsn, echo=app_settings.engine_echo, future=True
+    app_settings.database_dsn, **engine_options(app_settings)
 )
 async_session = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
+replicas = ReplicaRouter(
+    app_settings.database_replica_dsns,
+    retry_after=app_settings.replica_retry_after,
+    options=engine_options(app_settings),
+)
+
+
+for instrumented in [engine, *replicas.engines]:
+    instrument_engine(instrumented)
+    count_queries(instrumented)
 
 
 async def get_session() -> AsyncSession:
     async with async_session() as session:
         yield session
+
+
+async def get_read_session() -> Optional[AsyncSession]:
+    """Replica session for reads, None when reads go to the primary."""
+
+    session = replicas.session()
+    if session is None:
+        yield None
+        return
+    async with session:
+        yield session
+
+
+async def warm_up_pool(engine: AsyncEngine, size: int) -> int:
+    """Open up to size pooled connections before the first requests."""
+
+    async def open_connection():
+        connection = await engine.connect()
+        await connection.execute(text('SELECT 1'))
+        return connection
+
+    opened = await asyncio.gather(
+        *(open_connection() for _ in range(size)), return_exceptions=True
+    )
+    warmed = 0
+    for connection in opened:
+        if isinstance(connection, BaseException):
+            logger.warning('Pool warm-up connection failed: %s', connection)
+            continue
+        await connection.close()
+        warmed += 1
+    return warmed
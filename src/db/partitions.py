@@ -0,0 +1,237 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from services.periodic import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TABLE = 'short_url_history'
+DEFAULT_PARTITION = f'{HISTORY_TABLE}_default'
+HISTORY_COLUMNS = 'id, short_url, user_agent, used_at'
+MAINTENANCE_LOCK_ID = 7_340_001
+NAME_FORMATS = {'day': '%Y%m%d', 'month': '%Y%m'}
+
+
+def partition_start(moment: datetime, interval: str) -> datetime:
+    """Lower bound of the partition the moment belongs to."""
+
+    start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == 'month':
+        start = start.replace(day=1)
+    return start
+
+
+def partition_end(start: datetime, interval: str) -> datetime:
+    if interval == 'day':
+        return start + timedelta(days=1)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def partition_name(start: datetime, interval: str) -> str:
+    return f'{HISTORY_TABLE}_p{start.strftime(NAME_FORMATS[interval])}'
+
+
+def create_partition_sql(start: datetime, interval: str) -> str:
+    end = partition_end(start, interval)
+    return (
+        f'CREATE TABLE IF NOT EXISTS {partition_name(start, interval)} '
+        f'PARTITION OF {HISTORY_TABLE} '
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+
+
+async def partition_names(connection: AsyncConnection) -> list[str]:
+    """Names of the attached partitions of the history table."""
+
+    result = await connection.execute(text(
+        'SELECT child.relname FROM pg_inherits '
+        'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent '
+        'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+        'WHERE parent.relname = :table'
+    ), {'table': HISTORY_TABLE})
+    return list(result.scalars())
+
+
+def partition_bounds(name: str) -> Optional[tuple[datetime, datetime]]:
+    """Range of a partition by its name of any interval, None if unknown."""
+
+    prefix = f'{HISTORY_TABLE}_p'
+    if not name.startswith(prefix):
+        return None
+    for interval, name_format in NAME_FORMATS.items():
+        try:
+            start = datetime.strptime(name[len(prefix):], name_format)
+        except ValueError:
+            continue
+        return start, partition_end(start, interval)
+    return None
+
+
+def missing_ranges(
+        existing: list[tuple[datetime, datetime]], start: datetime,
+        interval: str
+) -> list[tuple[datetime, str]]:
+    """Partitions to create for the range of ``start`` of the interval.
+
+    After the interval setting changes, the range may overlap partitions
+    of the other interval, its days they do not cover get day partitions.
+    """
+
+    end = partition_end(start, interval)
+    overlapping = [
+        (other_start, other_end) for other_start, other_end in existing
+        if other_start < end and start < other_end
+    ]
+    if not overlapping:
+        return [(start, interval)]
+    days = []
+    day = start
+    while day < end:
+        next_day = partition_end(day, 'day')
+        if not any(
+                other_start < next_day and day < other_end
+                for other_start, other_end in overlapping
+        ):
+            days.append((day, 'day'))
+        day = next_day
+    return days
+
+
+def expired_partitions(names: Iterable[str], border: datetime) -> list[str]:
+    """Range partitions that ended before the border, oldest first."""
+
+    expired = []
+    for name in names:
+        bounds = partition_bounds(name)
+        if bounds is not None and bounds[1] <= border:
+            expired.append((bounds[0], name))
+    return [name for _, name in sorted(expired)]
+
+
+async def move_default_rows(
+        connection: AsyncConnection, start: datetime, interval: str
+) -> int:
+    """Create the partition for rows that landed in the default one.
+
+    Postgres refuses to create a partition while the default partition
+    holds rows of its range, so the default is detached, the partition is
+    created, the rows are moved into it and the default is attached back.
+    """
+
+    await connection.execute(text(
+        f'ALTER TABLE {HISTORY_TABLE} DETACH PARTITION {DEFAULT_PARTITION}'
+    ))
+    await connection.execute(text(create_partition_sql(start, interval)))
+    result = await connection.execute(text(
+        f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} '
+        'WHERE used_at >= :start AND used_at < :end '
+        f'RETURNING {HISTORY_COLUMNS}) '
+        f'INSERT INTO {HISTORY_TABLE} ({HISTORY_COLUMNS}) '
+        f'SELECT {HISTORY_COLUMNS} FROM moved'
+    ), {'start': start, 'end': partition_end(start, interval)})
+    await connection.execute(text(
+        f'ALTER TABLE {HISTORY_TABLE} '
+        f'ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT'
+    ))
+    return result.rowcount
+
+
+async def ensure_partitions(
+        connection: AsyncConnection, interval: str, ahead: int
+) -> list[str]:
+    """Create partitions from the current one to ``ahead`` upcoming.
+
+    Rows of a missing range already stored in the default partition are
+    moved into the new partition, other failures are raised.
+    """
+
+    names = await partition_names(connection)
+    has_default = DEFAULT_PARTITION in names
+    existing = [
+        bounds for bounds in map(partition_bounds, names) if bounds
+    ]
+    start = partition_start(datetime.utcnow(), interval)
+    created = []
+    for _ in range(ahead + 1):
+        for missing, missing_interval in missing_ranges(
+                existing, start, interval
+        ):
+            name = partition_name(missing, missing_interval)
+            stray = has_default and await connection.scalar(text(
+                f'SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} '
+                'WHERE used_at >= :start AND used_at < :end)'
+            ), {
+                'start': missing,
+                'end': partition_end(missing, missing_interval)
+            })
+            if stray:
+                moved = await move_default_rows(
+                    connection, missing, missing_interval
+                )
+                logger.warning(
+                    'Moved %s history rows from %s to %s',
+                    moved, DEFAULT_PARTITION, name
+                )
+            else:
+                await connection.execute(
+                    text(create_partition_sql(missing, missing_interval))
+                )
+            created.append(name)
+        start = partition_end(start, interval)
+    return created
+
+
+async def drop_expired_partitions(
+        connection: AsyncConnection, retention_days: int
+) -> list[str]:
+    """Drop whole partitions that ended before the retention window."""
+
+    border = datetime.utcnow() - timedelta(days=retention_days)
+    dropped = expired_partitions(await partition_names(connection), border)
+    for name in dropped:
+        await connection.execute(text(f'DROP TABLE {name}'))
+    return dropped
+
+
+class PartitionMaintainer(PeriodicTask):
+    """Keep usage history partitions ahead of time and enforce retention.
+
+    Runs in every worker, an advisory lock lets only one of them work at a
+    time.
+    """
+
+    failure_message = 'History partition maintenance failed'
+
+    def __init__(
+            self, engine: AsyncEngine, interval: str, ahead: int,
+            retention_days: Optional[int], period: float
+    ):
+        super().__init__(period)
+        self._engine = engine
+        self._interval = interval
+        self._ahead = ahead
+        self._retention_days = retention_days
+
+    async def run_once(self) -> None:
+        async with self._engine.begin() as connection:
+            locked = await connection.scalar(
+                text('SELECT pg_try_advisory_xact_lock(:id)'),
+                {'id': MAINTENANCE_LOCK_ID}
+            )
+            if not locked:
+                return
+            created = await ensure_partitions(
+                connection, self._interval, self._ahead
+            )
+            if created:
+                logger.info('Created history partitions: %s', created)
+            if self._retention_days:
+                dropped = await drop_expired_partitions(
+                    connection, self._retention_days
+                )
+                if dropped:
+                    logger.info('Dropped history partitions: %s', dropped)
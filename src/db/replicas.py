@@ -0,0 +1,59 @@
+import logging
+import random
+import time
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import (AsyncEngine, AsyncSession,
+                                    create_async_engine)
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaRouter:
+    """Round-robin choice of read replicas that are not marked down.
+
+    A replica that failed is skipped for ``retry_after`` seconds, reads go
+    to the primary when no replica is left.
+    """
+
+    def __init__(self, dsns: list[str], retry_after: float, options: dict):
+        self.engines: list[AsyncEngine] = [
+            create_async_engine(dsn, **options) for dsn in dsns
+        ]
+        self._retry_after = retry_after
+        self._down_until: dict[AsyncEngine, float] = {}
+        self._next = random.randrange(len(dsns)) if dsns else 0
+
+    def choose(self) -> Optional[AsyncEngine]:
+        now = time.monotonic()
+        for _ in range(len(self.engines)):
+            engine = self.engines[self._next]
+            self._next = (self._next + 1) % len(self.engines)
+            if self._down_until.get(engine, 0) <= now:
+                return engine
+        return None
+
+    def mark_down(self, engine: AsyncEngine, error: Exception) -> None:
+        self._down_until[engine] = time.monotonic() + self._retry_after
+        logger.warning(
+            'Replica %s marked down: %r', engine.url.host, error
+        )
+
+    def session(self) -> Optional[AsyncSession]:
+        """Session on the next healthy replica, None for the primary."""
+
+        engine = self.choose()
+        if engine is None:
+            return None
+        return AsyncSession(engine, expire_on_commit=False)
+
+    def stats(self) -> list[dict]:
+        now = time.monotonic()
+        return [
+            {
+                'host': engine.url.host,
+                'healthy': self._down_until.get(engine, 0) <= now,
+                'pool': engine.sync_engine.pool.status(),
+            }
+            for engine in self.engines
+        ]
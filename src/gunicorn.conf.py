@@ -0,0 +1,27 @@
+import os
+import shutil
+import tempfile
+
+# Workers write metrics to files in this directory, /metrics merges them.
+# prometheus_client picks its value backend on import, so the variable is
+# set before anything imports it and workers inherit it.
+os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR',
+    os.path.join(tempfile.gettempdir(), 'prometheus_metrics')
+)
+
+
+def on_starting(server):
+    """Drop metrics of the previous run."""
+
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    """Forget live gauges of the exited worker."""
+
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,11 +1,29 @@
+from logging import config as logging_config
+
 import uvicorn
-from fastapi import FastAPI
-from fastapi.responses import ORJSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi import FastAPI, Response
 
 from api.v1 import base
+from api.v1.redirect import RedirectMiddleware
 from core.config import app_settings
-from core.middleware import BlackListMiddleware
+from core.logger import LOGGING
+from core.metrics import (AppTimerMiddleware, GaugeUpdater,
+                          MetricsMiddleware, metrics_response)
+from core.middleware import (BlackListMiddleware, BlackListReloader,
+                             QueryStatsMiddleware, RateLimitMiddleware,
+                             denied_networks)
+from core.responses import ORJSONResponse
+from db.db import async_session, engine, replicas, warm_up_pool
+from services.health import health_check
+from services.rate_limit import build_rate_limit_backend
+from services.short_url import (cache_invalidator, expiry_sweeper,
+                                history_writer, partition_maintainer,
+                                save_history, save_usage_counts,
+                                usage_counter)
+from services.jobs import job_worker, process_next_job, upload_sweeper
+
+# Configured once per process, handlers start their writer threads lazily.
+logging_config.dictConfig(LOGGING)
 
 app = FastAPI(
     title=app_settings.app_title,
@@ -14,9 +32,82 @@ app = FastAPI(
     default_response_class=ORJSONResponse,
 )
 
-black_list = BlackListMiddleware(black_list=app_settings.black_list)
+gauge_updater = GaugeUpdater(
+    health_check.update_metrics, period=app_settings.metrics_update_period
+)
+
+denied_networks.update('settings', app_settings.black_list)
+black_list_reloader = BlackListReloader(
+    app_settings.black_list_file,
+    period=app_settings.black_list_reload_interval,
+)
+black_list_reloader.reload()
+
+if app_settings.redirect_fast_path:
+    app.add_middleware(RedirectMiddleware)
+app.add_middleware(AppTimerMiddleware)
+if app_settings.query_stats_header or app_settings.query_stats_log_threshold:
+    app.add_middleware(
+        QueryStatsMiddleware,
+        header=app_settings.query_stats_header,
+        log_threshold=app_settings.query_stats_log_threshold,
+    )
+app.add_middleware(
+    RateLimitMiddleware,
+    backend=build_rate_limit_backend(
+        app_settings.rate_limit_backend, async_session
+    ),
+    limits={
+        'create': (
+            app_settings.rate_limit_create_rate,
+            app_settings.rate_limit_create_burst,
+        ),
+        'redirect': (
+            app_settings.rate_limit_redirect_rate,
+            app_settings.rate_limit_redirect_burst,
+        ),
+    },
+    trusted_proxies=app_settings.trusted_proxies,
+)
+app.add_middleware(
+    BlackListMiddleware,
+    trusted_proxies=app_settings.trusted_proxies,
+)
+app.add_middleware(MetricsMiddleware)
 
-app.add_middleware(BaseHTTPMiddleware, dispatch=black_list)
+
+@app.on_event('startup')
+async def startup() -> None:
+    """Warm up the connection pool and start background workers."""
+
+    if app_settings.db_pool_warmup:
+        size = min(app_settings.db_pool_warmup, app_settings.db_pool_size)
+        for pool_engine in [engine, *replicas.engines]:
+            await warm_up_pool(pool_engine, size)
+    await cache_invalidator.start()
+    await usage_counter.start(flush=save_usage_counts)
+    await history_writer.start(write=save_history)
+    await partition_maintainer.start()
+    await expiry_sweeper.start()
+    await job_worker.start(process=process_next_job)
+    await upload_sweeper.start()
+    await gauge_updater.start()
+    await black_list_reloader.start()
+
+
+@app.on_event('shutdown')
+async def shutdown() -> None:
+    """Stop background workers."""
+
+    await black_list_reloader.stop()
+    await gauge_updater.stop()
+    await upload_sweeper.stop()
+    await job_worker.stop()
+    await cache_invalidator.stop()
+    await usage_counter.stop()
+    await history_writer.stop()
+    await partition_maintainer.stop()
+    await expiry_sweeper.stop()
 
 
 @app.get("/")
@@ -29,6 +120,14 @@ def read_root():
             )
 
 
+@app.get('/metrics', include_in_schema=False)
+def metrics() -> Response:
+    """Prometheus metrics of all workers."""
+
+    health_check.update_metrics()
+    return metrics_response()
+
+
 app.include_router(base.router, prefix='/api/v1')
 
 if __name__ == '__main__':
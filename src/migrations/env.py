@@ -9,7 +9,9 @@ from sqlalchemy.ext.asyncio import AsyncEngine
 
 from core.config import app_settings
 from db.db import Base
-from models.short_url import ShortUrl, ShortUrlHistory
+from models.job import ShortenJob, ShortenJobItem
+from models.rate_limit import RateLimitBucket
+from models.short_url import ShortUrl, ShortUrlArchive, ShortUrlHistory
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,47 @@
+"""03_original-url-digest
+
+Revision ID: 2b7d5f0c8e31
+Revises: 9c1e4b7a2d10
+Create Date: 2026-10-18 11:00:00.000000
+
+Digests of existing rows are backfilled in batches of BACKFILL_BATCH in
+the migration transaction, so run it in a maintenance window on big
+installations.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from services.base import url_digest
+
+# revision identifiers, used by Alembic.
+revision = '2b7d5f0c8e31'
+down_revision = '9c1e4b7a2d10'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH = 10000
+
+
+def upgrade() -> None:
+    op.add_column('short_url', sa.Column('original_url_digest', sa.LargeBinary(length=32), nullable=True))
+    bind = op.get_bind()
+    last_id = None
+    while True:
+        after = '' if last_id is None else 'WHERE id > :last_id '
+        rows = bind.execute(sa.text(
+            f'SELECT id, original_url FROM short_url {after}'
+            'ORDER BY id LIMIT :limit'
+        ), {'last_id': last_id, 'limit': BACKFILL_BATCH}).all()
+        if not rows:
+            break
+        bind.execute(
+            sa.text('UPDATE short_url SET original_url_digest = :digest WHERE id = :id'),
+            [{'id': row.id, 'digest': url_digest(row.original_url)} for row in rows]
+        )
+        last_id = rows[-1].id
+    op.create_index('ix_short_url_original_url_digest', 'short_url', ['original_url_digest'], unique=False, postgresql_using='hash')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_short_url_original_url_digest', table_name='short_url', postgresql_using='hash')
+    op.drop_column('short_url', 'original_url_digest')
@@ -0,0 +1,24 @@
+"""04_history-keyset-index
+
+Revision ID: 6e0a3c9d4f52
+Revises: 2b7d5f0c8e31
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e0a3c9d4f52'
+down_revision = '2b7d5f0c8e31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_short_url_history_short_url_used_at', 'short_url_history', ['short_url', 'used_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_short_url_history_short_url_used_at', table_name='short_url_history')
@@ -0,0 +1,28 @@
+"""02_unique-short-id
+
+Revision ID: 9c1e4b7a2d10
+Revises: 4f5fc4677fe1
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c1e4b7a2d10'
+down_revision = '4f5fc4677fe1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.drop_index(op.f('ix_short_url_short_id'), table_name='short_url')
+    op.create_index(op.f('ix_short_url_short_id'), 'short_url', ['short_id'], unique=True)
+    op.execute(sa.schema.CreateSequence(sa.Sequence('short_url_short_id_seq')))
+
+
+def downgrade() -> None:
+    op.execute(sa.schema.DropSequence(sa.Sequence('short_url_short_id_seq')))
+    op.drop_index(op.f('ix_short_url_short_id'), table_name='short_url')
+    op.create_index(op.f('ix_short_url_short_id'), 'short_url', ['short_id'], unique=False)
@@ -0,0 +1,49 @@
+"""08_shorten-jobs
+
+Revision ID: a5e9d3b7c1f6
+Revises: f3c7a9e1b2d4
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlalchemy_utils
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'a5e9d3b7c1f6'
+down_revision = 'f3c7a9e1b2d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('shorten_job',
+    sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=False),
+    sa.Column('processed', sa.Integer(), nullable=False),
+    sa.Column('failures', sa.Integer(), nullable=False),
+    sa.Column('error', sa.String(length=200), nullable=True),
+    sa.Column('retry_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_shorten_job_active', 'shorten_job', ['created_at'], unique=False, postgresql_where=sa.text("status IN ('pending', 'running')"))
+    op.create_table('shorten_job_item',
+    sa.Column('job_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('position', sa.Integer(), nullable=False),
+    sa.Column('original_url', sqlalchemy_utils.types.url.URLType(), nullable=False),
+    sa.Column('short_url', postgresql.UUID(as_uuid=True), nullable=True),
+    sa.Column('error', sa.String(length=200), nullable=True),
+    sa.ForeignKeyConstraint(['job_id'], ['shorten_job.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['short_url'], ['short_url.id'], ),
+    sa.PrimaryKeyConstraint('job_id', 'position')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('shorten_job_item')
+    op.drop_index('ix_shorten_job_active', table_name='shorten_job', postgresql_where=sa.text("status IN ('pending', 'running')"))
+    op.drop_table('shorten_job')
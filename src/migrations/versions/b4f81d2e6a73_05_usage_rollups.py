@@ -0,0 +1,48 @@
+"""05_usage-rollups
+
+Revision ID: b4f81d2e6a73
+Revises: 6e0a3c9d4f52
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'b4f81d2e6a73'
+down_revision = '6e0a3c9d4f52'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('short_url_usage_rollup',
+    sa.Column('short_url', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('granularity', sa.String(length=4), nullable=False),
+    sa.Column('bucket', sa.DateTime(), nullable=False),
+    sa.Column('count', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['short_url'], ['short_url.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('short_url', 'granularity', 'bucket')
+    )
+    op.create_table('short_url_agent_rollup',
+    sa.Column('short_url', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('granularity', sa.String(length=4), nullable=False),
+    sa.Column('bucket', sa.DateTime(), nullable=False),
+    sa.Column('user_agent', sa.String(length=50), nullable=False),
+    sa.Column('count', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['short_url'], ['short_url.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('short_url', 'granularity', 'bucket', 'user_agent')
+    )
+    op.execute(
+        "INSERT INTO short_url_usage_rollup (short_url, granularity, bucket, count) "
+        "SELECT short_url, granularity, date_trunc(granularity, used_at), count(*) "
+        "FROM short_url_history, (VALUES ('hour'), ('day')) AS g(granularity) "
+        "WHERE used_at IS NOT NULL "
+        "GROUP BY 1, 2, 3"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('short_url_agent_rollup')
+    op.drop_table('short_url_usage_rollup')
@@ -0,0 +1,34 @@
+"""09_drop-short-url-column
+
+Revision ID: c2d4f6a8b0e3
+Revises: a5e9d3b7c1f6
+Create Date: 2026-10-18 18:00:00.000000
+
+Short urls are derived from short_id and PUBLIC_BASE_URL. Dropping the
+column does not rewrite the table, pages shrink as rows are updated or
+after VACUUM FULL / pg_repack.
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlalchemy_utils
+
+from core.config import app_settings
+
+# revision identifiers, used by Alembic.
+revision = 'c2d4f6a8b0e3'
+down_revision = 'a5e9d3b7c1f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.drop_column('short_url', 'short_url')
+
+
+def downgrade() -> None:
+    op.add_column('short_url', sa.Column('short_url', sqlalchemy_utils.types.url.URLType(), nullable=True))
+    op.execute(
+        sa.text('UPDATE short_url SET short_url = :prefix || short_id')
+        .bindparams(prefix=app_settings.short_url_prefix)
+    )
+    op.alter_column('short_url', 'short_url', nullable=False)
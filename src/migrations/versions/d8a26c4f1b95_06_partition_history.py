@@ -0,0 +1,88 @@
+"""06_partition-history
+
+Revision ID: d8a26c4f1b95
+Revises: b4f81d2e6a73
+Create Date: 2026-10-18 14:00:00.000000
+
+Converts short_url_history to range partitioning by used_at with
+monthly partitions. The partition layout is fixed here, not read from
+settings; HISTORY_PARTITION_INTERVAL and HISTORY_PARTITIONS_AHEAD only
+drive the runtime maintenance. The table is copied, so run it in a
+maintenance window on big installations.
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from db.partitions import (create_partition_sql, partition_end,
+                           partition_start)
+
+# revision identifiers, used by Alembic.
+revision = 'd8a26c4f1b95'
+down_revision = 'b4f81d2e6a73'
+branch_labels = None
+depends_on = None
+
+INTERVAL = 'month'
+PARTITIONS_AHEAD = 3
+
+
+def upgrade() -> None:
+    interval = INTERVAL
+    op.drop_index('ix_short_url_history_short_url_used_at', table_name='short_url_history')
+    op.drop_index(op.f('ix_short_url_history_used_at'), table_name='short_url_history')
+    op.rename_table('short_url_history', 'short_url_history_old')
+    op.execute('ALTER TABLE short_url_history_old RENAME CONSTRAINT short_url_history_pkey TO short_url_history_old_pkey')
+    op.execute('ALTER TABLE short_url_history_old RENAME CONSTRAINT short_url_history_short_url_fkey TO short_url_history_old_short_url_fkey')
+    op.create_table('short_url_history',
+    sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('short_url', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('user_agent', sa.String(length=50), nullable=False),
+    sa.Column('used_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['short_url'], ['short_url.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id', 'used_at'),
+    postgresql_partition_by='RANGE (used_at)'
+    )
+    op.create_index('ix_short_url_history_short_url_used_at', 'short_url_history', ['short_url', 'used_at', 'id'], unique=False)
+    op.execute('CREATE TABLE short_url_history_default PARTITION OF short_url_history DEFAULT')
+
+    now = datetime.utcnow()
+    first = op.get_bind().execute(sa.text('SELECT min(used_at) FROM short_url_history_old')).scalar()
+    start = partition_start(min(first or now, now), interval)
+    last = partition_start(now, interval)
+    for _ in range(PARTITIONS_AHEAD):
+        last = partition_end(last, interval)
+    while start <= last:
+        op.execute(create_partition_sql(start, interval))
+        start = partition_end(start, interval)
+
+    op.execute(
+        'INSERT INTO short_url_history (id, short_url, user_agent, used_at) '
+        'SELECT id, short_url, user_agent, coalesce(used_at, now()) '
+        'FROM short_url_history_old'
+    )
+    op.drop_table('short_url_history_old')
+
+
+def downgrade() -> None:
+    op.rename_table('short_url_history', 'short_url_history_partitioned')
+    op.drop_index('ix_short_url_history_short_url_used_at', table_name='short_url_history_partitioned')
+    op.execute('ALTER TABLE short_url_history_partitioned RENAME CONSTRAINT short_url_history_pkey TO short_url_history_partitioned_pkey')
+    op.execute('ALTER TABLE short_url_history_partitioned RENAME CONSTRAINT short_url_history_short_url_fkey TO short_url_history_partitioned_short_url_fkey')
+    op.create_table('short_url_history',
+    sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('short_url', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('user_agent', sa.String(length=50), nullable=False),
+    sa.Column('used_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['short_url'], ['short_url.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute(
+        'INSERT INTO short_url_history (id, short_url, user_agent, used_at) '
+        'SELECT id, short_url, user_agent, used_at FROM short_url_history_partitioned'
+    )
+    op.drop_table('short_url_history_partitioned')
+    op.create_index(op.f('ix_short_url_history_used_at'), 'short_url_history', ['used_at'], unique=False)
+    op.create_index('ix_short_url_history_short_url_used_at', 'short_url_history', ['short_url', 'used_at', 'id'], unique=False)
@@ -0,0 +1,67 @@
+"""10_link-expiry
+
+Revision ID: e7b3c5d9f1a2
+Revises: c2d4f6a8b0e3
+Create Date: 2026-10-18 19:00:00.000000
+
+Urls deleted before this revision get the upgrade time as deletion time,
+so the expiry sweeper purges them EXPIRY_PURGE_AFTER_DAYS later. Lookup
+indexes only cover live rows from here on, short ids are unique among live
+urls only. Downgrade fails once a short id of a deleted url is reissued.
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlalchemy_utils
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3c5d9f1a2'
+down_revision = 'c2d4f6a8b0e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('short_url', sa.Column('expires_at', sa.DateTime(), nullable=True))
+    op.add_column('short_url', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.execute('UPDATE short_url SET del_status = false WHERE del_status IS NULL')
+    op.execute("UPDATE short_url SET deleted_at = now() AT TIME ZONE 'UTC' WHERE del_status")
+    op.alter_column('short_url', 'del_status', existing_type=sa.Boolean(), nullable=False, server_default=sa.text('false'))
+    op.drop_index('ix_short_url_original_url_digest', table_name='short_url', postgresql_using='hash')
+    op.create_index('ix_short_url_original_url_digest', 'short_url', ['original_url_digest'], unique=False, postgresql_using='hash', postgresql_where=sa.text('NOT del_status'))
+    op.drop_index('ix_short_url_short_id', table_name='short_url')
+    op.create_index('ix_short_url_short_id', 'short_url', ['short_id'], unique=True, postgresql_where=sa.text('NOT del_status'))
+    op.create_index('ix_short_url_expires_at', 'short_url', ['expires_at'], unique=False, postgresql_where=sa.text('NOT del_status AND expires_at IS NOT NULL'))
+    op.create_index('ix_short_url_deleted_at', 'short_url', ['deleted_at'], unique=False, postgresql_where=sa.text('del_status'))
+    op.create_table('short_url_archive',
+    sa.Column('id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('short_id', sa.String(length=8), nullable=False),
+    sa.Column('original_url', sqlalchemy_utils.types.url.URLType(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=True),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.Column('usage_count', sa.Integer(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_short_url_archive_short_id'), 'short_url_archive', ['short_id'], unique=False)
+    op.add_column('shorten_job_item', sa.Column('expires_at', sa.DateTime(), nullable=True))
+    op.drop_constraint('shorten_job_item_short_url_fkey', 'shorten_job_item', type_='foreignkey')
+    op.create_foreign_key('shorten_job_item_short_url_fkey', 'shorten_job_item', 'short_url', ['short_url'], ['id'], ondelete='SET NULL')
+
+
+def downgrade() -> None:
+    op.drop_constraint('shorten_job_item_short_url_fkey', 'shorten_job_item', type_='foreignkey')
+    op.create_foreign_key('shorten_job_item_short_url_fkey', 'shorten_job_item', 'short_url', ['short_url'], ['id'])
+    op.drop_column('shorten_job_item', 'expires_at')
+    op.drop_index(op.f('ix_short_url_archive_short_id'), table_name='short_url_archive')
+    op.drop_table('short_url_archive')
+    op.drop_index('ix_short_url_deleted_at', table_name='short_url', postgresql_where=sa.text('del_status'))
+    op.drop_index('ix_short_url_expires_at', table_name='short_url', postgresql_where=sa.text('NOT del_status AND expires_at IS NOT NULL'))
+    op.drop_index('ix_short_url_short_id', table_name='short_url', postgresql_where=sa.text('NOT del_status'))
+    op.create_index('ix_short_url_short_id', 'short_url', ['short_id'], unique=True)
+    op.drop_index('ix_short_url_original_url_digest', table_name='short_url', postgresql_using='hash', postgresql_where=sa.text('NOT del_status'))
+    op.create_index('ix_short_url_original_url_digest', 'short_url', ['original_url_digest'], unique=False, postgresql_using='hash')
+    op.alter_column('short_url', 'del_status', existing_type=sa.Boolean(), nullable=True, server_default=None)
+    op.drop_column('short_url', 'deleted_at')
+    op.drop_column('short_url', 'expires_at')
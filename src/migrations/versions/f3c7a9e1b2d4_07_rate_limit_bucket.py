@@ -0,0 +1,30 @@
+"""07_rate-limit-bucket
+
+Revision ID: f3c7a9e1b2d4
+Revises: d8a26c4f1b95
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c7a9e1b2d4'
+down_revision = 'd8a26c4f1b95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('rate_limit_bucket',
+    sa.Column('key', sa.String(length=100), nullable=False),
+    sa.Column('tat', sa.Float(), nullable=False),
+    sa.Column('allowed', sa.Boolean(), nullable=False),
+    sa.PrimaryKeyConstraint('key'),
+    prefixes=['UNLOGGED']
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('rate_limit_bucket')
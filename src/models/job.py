@@ -0,0 +1,47 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import (Column, DateTime, ForeignKey, Index, Integer, String,
+                        text)
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy_utils import URLType
+
+from db.db import Base
+
+
+class ShortenJob(Base):
+    """Bulk shortening job model."""
+
+    __tablename__ = 'shorten_job'
+    __table_args__ = (
+        Index(
+            'ix_shorten_job_active', 'created_at',
+            postgresql_where=text("status IN ('pending', 'running')")
+        ),
+    )
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    status = Column(String(10), nullable=False, default='pending')
+    total = Column(Integer, nullable=False)
+    processed = Column(Integer, nullable=False, default=0)
+    failures = Column(Integer, nullable=False, default=0)
+    error = Column(String(200))
+    retry_at = Column(DateTime)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class ShortenJobItem(Base):
+    """Url of bulk shortening job and its short url once processed."""
+
+    __tablename__ = 'shorten_job_item'
+    job_id = Column(
+        UUID(as_uuid=True), ForeignKey('shorten_job.id', ondelete="CASCADE"),
+        primary_key=True,
+    )
+    position = Column(Integer, primary_key=True)
+    original_url = Column(URLType, nullable=False)
+    short_url = Column(
+        UUID(as_uuid=True), ForeignKey('short_url.id', ondelete='SET NULL')
+    )
+    expires_at = Column(DateTime)
+    error = Column(String(200))
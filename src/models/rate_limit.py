@@ -0,0 +1,13 @@
+from sqlalchemy import Boolean, Column, Float, String
+
+from db.db import Base
+
+
+class RateLimitBucket(Base):
+    """Shared rate limit state of one client and route class."""
+
+    __tablename__ = 'rate_limit_bucket'
+    __table_args__ = {'prefixes': ['UNLOGGED']}
+    key = Column(String(100), primary_key=True)
+    tat = Column(Float, nullable=False)
+    allowed = Column(Boolean, nullable=False)
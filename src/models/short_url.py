@@ -1,36 +1,125 @@
 import uuid
 from datetime import datetime
 
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy import (BigInteger, Boolean, Column, DateTime, ForeignKey,
+                        Index, Integer, LargeBinary, String, text)
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy_utils import URLType
 
+from core.config import app_settings
 from db.db import Base
 
 
+def short_url_for(short_id: str) -> str:
+    """Public short url, derived from the short id."""
+
+    return app_settings.short_url_prefix + short_id
+
+
 class ShortUrl(Base):
-    """Short url model."""
+    """Short url model.
+
+    Lookup indexes cover live rows only, expired urls leave them once the
+    expiry sweeper marks them deleted. Short ids are unique among live
+    urls.
+    """
 
     __tablename__ = 'short_url'
+    __table_args__ = (
+        Index(
+            'ix_short_url_original_url_digest', 'original_url_digest',
+            postgresql_using='hash', postgresql_where=text('NOT del_status')
+        ),
+        Index(
+            'ix_short_url_short_id', 'short_id', unique=True,
+            postgresql_where=text('NOT del_status')
+        ),
+        Index(
+            'ix_short_url_expires_at', 'expires_at',
+            postgresql_where=text(
+                'NOT del_status AND expires_at IS NOT NULL'
+            )
+        ),
+        Index(
+            'ix_short_url_deleted_at', 'deleted_at',
+            postgresql_where=text('del_status')
+        ),
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     created_at = Column(DateTime, default=datetime.utcnow)
     original_url = Column(URLType, nullable=False)
-    short_id = Column(String(8), index=True, nullable=False)
-    short_url = Column(URLType, nullable=False)
+    original_url_digest = Column(LargeBinary(32))
+    short_id = Column(String(8), nullable=False)
     usage_count = Column(Integer)
     url_history = relationship('ShortUrlHistory', cascade="all, delete")
-    del_status = Column(Boolean, default=False)
+    del_status = Column(
+        Boolean, nullable=False, default=False, server_default=text('false')
+    )
+    expires_at = Column(DateTime)
+    deleted_at = Column(DateTime)
+
+    @property
+    def short_url(self) -> str:
+        return short_url_for(self.short_id)
 
 
 class ShortUrlHistory(Base):
     """Url usage history model."""
 
     __tablename__ = 'short_url_history'
+    __table_args__ = (
+        Index(
+            'ix_short_url_history_short_url_used_at',
+            'short_url', 'used_at', 'id'
+        ),
+        {'postgresql_partition_by': 'RANGE (used_at)'},
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     short_url = Column(
         UUID(as_uuid=True), ForeignKey('short_url.id', ondelete="CASCADE"),
         nullable=False,
     )
     user_agent = Column(String(50), nullable=False)
-    used_at = Column(DateTime, index=True, default=datetime.utcnow)
+    used_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
+
+
+class ShortUrlUsageRollup(Base):
+    """Url usage count per hour or day."""
+
+    __tablename__ = 'short_url_usage_rollup'
+    short_url = Column(
+        UUID(as_uuid=True), ForeignKey('short_url.id', ondelete="CASCADE"),
+        primary_key=True,
+    )
+    granularity = Column(String(4), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    count = Column(BigInteger, nullable=False)
+
+
+class ShortUrlAgentRollup(Base):
+    """Url usage count per user agent and hour or day."""
+
+    __tablename__ = 'short_url_agent_rollup'
+    short_url = Column(
+        UUID(as_uuid=True), ForeignKey('short_url.id', ondelete="CASCADE"),
+        primary_key=True,
+    )
+    granularity = Column(String(4), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    user_agent = Column(String(50), primary_key=True)
+    count = Column(BigInteger, nullable=False)
+
+
+class ShortUrlArchive(Base):
+    """Short url purged by the expiry sweeper."""
+
+    __tablename__ = 'short_url_archive'
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    short_id = Column(String(8), nullable=False, index=True)
+    original_url = Column(URLType, nullable=False)
+    created_at = Column(DateTime)
+    expires_at = Column(DateTime)
+    deleted_at = Column(DateTime)
+    usage_count = Column(Integer)
+    archived_at = Column(DateTime, nullable=False, default=datetime.utcnow)
@@ -1,6 +1,16 @@
-from datetime import datetime
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
 
-from pydantic import BaseModel, HttpUrl
+from pydantic import BaseModel, HttpUrl, validator
+
+
+def naive_utc(value: datetime) -> datetime:
+    """Naive UTC like the stored timestamps, naive values are kept."""
+
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
 
 
 class ShortUrl(BaseModel):
@@ -44,16 +54,76 @@ class UrlHistoryFullInfo(BaseModel):
     __root__: list[UrlHistoryInfo]
 
 
+class UrlUsageBucket(BaseModel):
+    """Url usage count in time bucket"""
+
+    bucket: datetime
+    count: int
+    user_agents: Optional[dict[str, int]] = None
+
+
+class UrlUsageStats(BaseModel):
+    """Url usage time series"""
+
+    __root__: list[UrlUsageBucket]
+
+
 class OriginalUrl(BaseModel):
     """Original url"""
 
     original_url: HttpUrl
+    expires_at: Optional[datetime] = None
 
     class Config:
         orm_mode = True
 
+    @validator('expires_at')
+    def utc_future(cls, value: Optional[datetime]) -> Optional[datetime]:
+        """Naive UTC like the stored timestamps, not in the past."""
+
+        if value is None:
+            return None
+        value = naive_utc(value)
+        if value <= datetime.utcnow():
+            raise ValueError('expiration time is in the past')
+        return value
+
 
 class OriginalUrlsList(BaseModel):
     """List of url for bulk create"""
 
     __root__: list[OriginalUrl]
+
+
+class ShortenJobInfo(BaseModel):
+    """Bulk shortening job progress"""
+
+    id: uuid.UUID
+    status: str
+    total: int
+    processed: int
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        orm_mode = True
+
+
+class ShortenJobResult(BaseModel):
+    """Processed url of bulk shortening job"""
+
+    position: int
+    original_url: str
+    short_id: Optional[str] = None
+    short_url: Optional[HttpUrl] = None
+    error: Optional[str] = None
+
+    class Config:
+        orm_mode = True
+
+
+class ShortenJobResultsList(BaseModel):
+    """Processed urls of bulk shortening job"""
+
+    __root__: list[ShortenJobResult]
@@ -1,48 +1,121 @@
+import asyncio
+import base64
+import hashlib
 import logging
+import uuid
 from abc import ABC, abstractmethod
-from logging import config as logging_config
-from typing import Any, Generic, Optional, Type, TypeVar
+from datetime import datetime, timedelta
+from typing import Any, Callable, Generic, Optional, Type, TypeVar
+from urllib.parse import urlsplit, urlunsplit
 
 from fastapi import HTTPException
-from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
-from shortuuid import ShortUUID
+from sqlalchemy import (Integer, Table, and_, bindparam, cast, column, func,
+                        insert, literal, literal_column, or_, tuple_, update)
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
+from sqlalchemy.engine import Result, Row
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from core.config import app_settings
-from core.logger import LOGGING
+from core.metrics import repository_method
 from db.db import Base
-from models.short_url import ShortUrl
+from db.partitions import partition_start
+from db.replicas import ReplicaRouter
 from schemas.short_url import UrlHistoryInfo
+from services.cache import MISSING, CachedUrl, UrlCache
+from services.counter import UsageCounter
+from services.history import HistoryEvent, HistoryWriter
+from services.id_generator import IdGenerator, RandomIdGenerator
+from services.rollup import GRANULARITIES, aggregate, bucket_range
 
-logging_config.dictConfig(LOGGING)
 logger = logging.getLogger(__name__)
 
 ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 BulkCreateSchemaType = TypeVar("BulkCreateSchemaType", bound=BaseModel)
+HISTORY_USER_AGENT_LENGTH = 50
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+# asyncpg binds at most this many parameters to one statement.
+MAX_BIND_PARAMS = 32767
 
 
-def create_short_url(url_len: int) -> str:
+def history_event(short_url: Any, user_agent: Optional[str]) -> HistoryEvent:
+
+    return HistoryEvent(
+        uuid.uuid4(), short_url,
+        (user_agent or '')[:HISTORY_USER_AGENT_LENGTH], datetime.utcnow()
+    )
+
+
+def encode_cursor(used_at: datetime, history_id: uuid.UUID) -> str:
+    """Opaque usage history page cursor."""
+
+    value = f'{used_at.isoformat()}|{history_id}'
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+
+    try:
+        used_at, history_id = base64.urlsafe_b64decode(
+            cursor.encode()
+        ).decode().split('|')
+        return datetime.fromisoformat(used_at), uuid.UUID(history_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+
+
+def url_digest(url: str) -> bytes:
+    """Digest of url with normalized scheme, host, port and fragment."""
+
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.hostname or ''
+    if parts.username or parts.password:
+        netloc = f'{parts.username or ""}:{parts.password or ""}@{netloc}'
+    if parts.port and DEFAULT_PORTS.get(scheme) != parts.port:
+        netloc = f'{netloc}:{parts.port}'
+    normalized = urlunsplit(
+        (scheme, netloc, parts.path or '/', parts.query, '')
+    )
+    return hashlib.sha256(normalized.encode()).digest()
+
+
+def values_chunk_size(table: Table, columns: Optional[int] = None) -> int:
+    """Rows of one multi-row statement, within the bind parameter limit.
+
+    Multi-row VALUES bind every column of the table for each row.
+    """
+
+    return max(1, min(
+        app_settings.bulk_create_chunk_size,
+        MAX_BIND_PARAMS // (columns or len(table.columns))
+    ))
 
-    return ShortUUID().random(length=url_len)
 
+def url_data(obj_in: BaseModel) -> dict:
+    """Insert values of validated original url."""
 
-def create_obj(obj_in_data, model) -> ShortUrl:
+    return {
+        'original_url': str(obj_in.original_url),
+        'expires_at': obj_in.expires_at,
+    }
+
+
+def short_url_values(obj_in_data: dict, short_id: str) -> dict:
 
     add_obj_info = {}
-    short_id = create_short_url(app_settings.short_url_length)
     add_obj_info['short_id'] = short_id
-    short_url = (
-        f'http://{app_settings.project_host}:'
-        f'{app_settings.project_port}/api/v1/{short_id}'
+    add_obj_info['original_url_digest'] = url_digest(
+        obj_in_data['original_url']
     )
-    add_obj_info['short_url'] = short_url
     add_obj_info['usage_count'] = 0
     obj_in_data.update(add_obj_info)
-    return model(**obj_in_data)
+    obj_in_data.setdefault('expires_at', None)
+    return obj_in_data
 
 
 class Repository(ABC):
@@ -55,6 +128,10 @@ class Repository(ABC):
     def create(self, *args, **kwargs):
         raise NotImplementedError
 
+    @abstractmethod
+    def redirect(self, *args, **kwargs):
+        raise NotImplementedError
+
     @abstractmethod
     def create_history(self, *args, **kwargs):
         raise NotImplementedError
@@ -86,61 +163,219 @@ class RepositoryDB(
         ModelType, CreateSchemaType, UpdateSchemaType, BulkCreateSchemaType
     ]
 ):
-    def __init__(self, model: Type[ModelType], request: Type[ModelType]):
+    def __init__(
+            self, model: Type[ModelType], request: Type[ModelType],
+            cache: Optional[UrlCache] = None,
+            invalidation_channel: Optional[str] = None,
+            counter: Optional[UsageCounter] = None,
+            history: Optional[HistoryWriter] = None,
+            id_generator: Optional[IdGenerator] = None,
+            rollup: Optional[Type[Base]] = None,
+            agent_rollup: Optional[Type[Base]] = None,
+            replicas: Optional[ReplicaRouter] = None
+    ):
         self._model = model
         self._request_model = request
+        self._rollup = rollup
+        self._agent_rollup = agent_rollup
+        self._id_generator = id_generator or RandomIdGenerator(
+            app_settings.short_url_length
+        )
+        self._cache = cache
+        self._counter = counter
+        self._history = history
+        self._invalidation_channel = invalidation_channel
+        self._replicas = replicas
 
+    @repository_method
     async def ping_db(self, db: AsyncSession) -> bool:
         """Get database availability status"""
 
-        result = await db.execute(statement=select(self._model))
-        return True if result else False
+        result = await db.execute(statement=select(literal(1)))
+        return result.scalar() == 1
 
+    @repository_method
     async def create(
             self, db: AsyncSession, *, obj_in: CreateSchemaType
-    ) -> ModelType:
+    ) -> Row:
         """Create short url"""
 
-        obj_in_data = jsonable_encoder(obj_in)
-        db_obj = create_obj(obj_in_data, self._model)
-        db.add(db_obj)
+        db_obj, = await self.create_rows(db, [url_data(obj_in)])
         await db.commit()
-        await db.refresh(db_obj)
+        if self._cache and app_settings.replica_read_your_writes:
+            self._cache.set(db_obj.short_id, CachedUrl(
+                db_obj.id, str(db_obj.original_url), db_obj.expires_at
+            ))
+        else:
+            self._invalidate(db_obj.short_id)
         return db_obj
 
+    @repository_method
     async def bulk_create(
             self, db: AsyncSession, obj_in: BulkCreateSchemaType
-    ) -> list[ModelType]:
+    ) -> list[Row]:
         """Bulk create short urls"""
 
-        list_urls = jsonable_encoder(obj_in)
-        db_obj = [create_obj(data, self._model) for data in list_urls]
-        db.add_all(db_obj)
+        created = await self.create_rows(
+            db, [url_data(item) for item in obj_in.__root__]
+        )
         await db.commit()
-        for obj in db_obj:
-            await db.refresh(obj)
-        return db_obj
+        for obj in created:
+            self._invalidate(obj.short_id)
+        return created
+
+    @repository_method
+    async def bulk_create_chunk(
+            self, db: AsyncSession, list_urls: list[dict]
+    ) -> list[Row]:
+        """Create and commit one chunk of a streaming upload"""
+
+        if not list_urls:
+            return []
+        created = await self.create_rows(db, list_urls)
+        await db.commit()
+        for obj in created:
+            self._invalidate(obj.short_id)
+        return created
+
+    async def create_rows(
+            self, db: AsyncSession, list_urls: list[dict]
+    ) -> list[Row]:
+        """Create short urls without commit, reusing known urls on dedup.
+
+        Urls with expiration time are always created, they are keyed by
+        position instead of digest. Dedup is best effort: two concurrent
+        creates of the same new url both insert it. A unique digest index
+        would reject the duplicates that dedup disabled allows.
+        """
+
+        if not app_settings.dedup_enabled:
+            return await self._insert_chunks(db, list_urls)
+        keys = [
+            url_digest(data['original_url'])
+            if data.get('expires_at') is None else index
+            for index, data in enumerate(list_urls)
+        ]
+        first_index = {}
+        for index, key in enumerate(keys):
+            first_index.setdefault(key, index)
+        unique_digests = [key for key in first_index if isinstance(key, bytes)]
+        chunk_size = values_chunk_size(self._model.__table__, columns=1)
+        rows = {}
+        for start in range(0, len(unique_digests), chunk_size):
+            result = await db.execute(statement=select(
+                self._model.original_url_digest, *self._created_columns()
+            ).where(
+                self._model.original_url_digest.in_(
+                    unique_digests[start:start + chunk_size]
+                ),
+                ~self._model.del_status, self._model.expires_at.is_(None)
+            ))
+            for row in result:
+                rows.setdefault(row.original_url_digest, row)
+        new_keys = [key for key in first_index if key not in rows]
+        inserted = await self._insert_chunks(
+            db, [list_urls[first_index[key]] for key in new_keys]
+        )
+        rows.update(zip(new_keys, inserted))
+        return [rows[key] for key in keys]
+
+    async def _insert_chunks(
+            self, db: AsyncSession, list_urls: list[dict]
+    ) -> list[Row]:
+        chunk_size = values_chunk_size(self._model.__table__)
+        created = []
+        for start in range(0, len(list_urls), chunk_size):
+            created.extend(await self._insert_chunk(
+                db, list_urls[start:start + chunk_size]
+            ))
+        return created
+
+    def _created_columns(self) -> tuple:
+        return (
+            self._model.id, self._model.short_id, self._model.original_url,
+            self._model.expires_at
+        )
 
+    async def _insert_chunk(
+            self, db: AsyncSession, list_urls: list[dict]
+    ) -> list[Row]:
+        """Insert urls with one statement per collision round.
+
+        Short ids taken by live rows or repeated in the batch are
+        skipped by ON CONFLICT and generated again for the next round.
+        """
+
+        created: dict[int, Row] = {}
+        pending = list(range(len(list_urls)))
+        while pending:
+            short_ids = {}
+            generated = await self._id_generator.generate(db, len(pending))
+            for short_id, index in zip(generated, pending):
+                short_ids.setdefault(short_id, index)
+            statement = pg_insert(self._model).values([
+                short_url_values(dict(list_urls[index]), short_id)
+                for short_id, index in short_ids.items()
+            ]).on_conflict_do_nothing(
+                index_elements=[self._model.short_id],
+                index_where=~self._model.del_status
+            ).returning(*self._created_columns())
+            result = await db.execute(statement=statement)
+            for row in result:
+                created[short_ids[row.short_id]] = row
+            pending = [index for index in pending if index not in created]
+        return [created[index] for index in range(len(list_urls))]
+
+    @repository_method
     async def delete(
             self, db: AsyncSession, db_obj: ModelType
     ) -> None:
         """Set delete status to short url"""
 
         db_obj.del_status = True
+        db_obj.deleted_at = datetime.utcnow()
+        if self._invalidation_channel:
+            await db.execute(statement=select(func.pg_notify(
+                self._invalidation_channel, db_obj.short_id
+            )))
         await db.commit()
         await db.refresh(db_obj)
+        self._invalidate(db_obj.short_id)
 
+    @repository_method
     async def get(
-            self, db: AsyncSession, short_id: Any
+            self, db: AsyncSession, short_id: Any,
+            read_db: Optional[AsyncSession] = None
     ) -> Optional[ModelType]:
-        """Get original url."""
+        """Get original url.
+
+        Live urls are looked up first, over the partial index of live rows,
+        other rows are read only to tell why the url is not available.
+        """
 
-        statement = select(self._model).where(self._model.short_id == short_id)
-        result = await db.execute(statement=statement)
+        statement = select(self._model).where(
+            self._model.short_id == short_id, ~self._model.del_status
+        )
+        result = await self._read(db, read_db, statement)
         obj = result.scalar_one_or_none()
+        if not obj and self._read_your_writes(read_db):
+            result = await db.execute(statement=statement)
+            obj = result.scalar_one_or_none()
+        if not obj:
+            result = await self._read(db, read_db, select(self._model).where(
+                self._model.short_id == short_id
+            ).order_by(self._model.deleted_at.desc()).limit(1))
+            obj = result.scalar_one_or_none()
         if not obj:
             logger.info('Short url not found')
             raise HTTPException(status_code=400, detail='Short url not found')
+        if obj.expires_at is not None and obj.expires_at <= (
+                obj.deleted_at or datetime.utcnow()
+        ):
+            logger.info('Short url has expired')
+            raise HTTPException(
+                status_code=400, detail='Short url has expired'
+            )
         if obj.del_status:
             logger.info('Short url was deleted')
             raise HTTPException(
@@ -148,41 +383,438 @@ class RepositoryDB(
             )
         return obj
 
+    @repository_method
+    async def redirect(
+            self, db: AsyncSession, short_id: str, user_agent: Optional[str],
+            read_db: Optional[AsyncSession] = None
+    ) -> str:
+        """Resolve short url, count usage and save history at once."""
+
+        cached = self.cached_url(short_id)
+        original_url = await self.redirect_from_cache(cached, user_agent)
+        if original_url is not None:
+            return original_url
+        return await self.redirect_from_db(
+            db, short_id, cached, user_agent, read_db=read_db
+        )
+
+    def cached_url(self, short_id: str) -> Any:
+        """Cached url entry or MISSING, raise for a cached failure.
+
+        An entry past its expiration time is dropped and reported MISSING,
+        so the database tells why the url is gone.
+        """
+
+        cached = self._cache.get(short_id) if self._cache else MISSING
+        if isinstance(cached, str):
+            raise HTTPException(status_code=400, detail=cached)
+        if (isinstance(cached, CachedUrl) and cached.expires_at is not None
+                and cached.expires_at <= datetime.utcnow()):
+            self._invalidate(short_id)
+            return MISSING
+        return cached
+
+    async def redirect_from_cache(
+            self, cached: Any, user_agent: Optional[str]
+    ) -> Optional[str]:
+        """Redirect without the database, None when it is needed.
+
+        Possible for a cached url while usage counts and history are
+        written by the background workers.
+        """
+
+        if (not isinstance(cached, CachedUrl)
+                or self._counter is None or not self._counter.running
+                or self._history is None or not self._history.running):
+            return None
+        self._counter.add(cached.id)
+        await self._history.put(history_event(cached.id, user_agent))
+        return cached.original_url
+
+    @repository_method
+    async def redirect_from_db(
+            self, db: AsyncSession, short_id: str, cached: Any,
+            user_agent: Optional[str], read_db: Optional[AsyncSession] = None
+    ) -> str:
+        """Redirect when the url is not cached or writes are not deferred."""
+
+        count_later = self._counter is not None and self._counter.running
+        save_later = self._history is not None and self._history.running
+        save_in_visit = not save_later and not self._rollups_enabled
+        if (not isinstance(cached, CachedUrl) or not count_later
+                or save_in_visit):
+            cached = await self._visit(
+                db, short_id, cached,
+                user_agent or '' if save_in_visit else None,
+                count_usage=not count_later, read_db=read_db
+            )
+        if count_later:
+            self._counter.add(cached.id)
+        event = history_event(cached.id, user_agent)
+        if save_later:
+            await self._history.put(event)
+        elif not save_in_visit:
+            await self.write_history(db=db, events=[event])
+        return cached.original_url
+
+    @property
+    def _rollups_enabled(self) -> bool:
+        return self._rollup is not None and app_settings.rollups_enabled
+
+    async def _visit(
+            self, db: AsyncSession, short_id: str, cached: Any,
+            user_agent: Optional[str], count_usage: bool,
+            read_db: Optional[AsyncSession] = None
+    ) -> CachedUrl:
+        """Resolve live url and do the writes that are not deferred.
+
+        Without writes the url is resolved on ``read_db`` when given.
+        """
+
+        if isinstance(cached, CachedUrl):
+            condition = self._model.id == cached.id
+        else:
+            condition = self._model.short_id == short_id
+        statement = self._visit_statement(condition, user_agent, count_usage)
+        if count_usage or user_agent is not None:
+            result = await db.execute(statement=statement)
+            row = result.one_or_none()
+            await db.commit()
+        else:
+            result = await self._read(db, read_db, statement)
+            row = result.one_or_none()
+            if row is None and self._read_your_writes(read_db):
+                result = await db.execute(statement=statement)
+                row = result.one_or_none()
+        if row is not None:
+            entry = CachedUrl(row.id, str(row.original_url), row.expires_at)
+            if cached is MISSING and self._cache:
+                self._cache.set(short_id, entry)
+            return entry
+        self._invalidate(short_id)
+        try:
+            await self.get(db=db, short_id=short_id)
+        except HTTPException as error:
+            if self._cache:
+                self._cache.set_missing(short_id, error.detail)
+            raise
+        raise HTTPException(status_code=400, detail='Short url not found')
+
+    def _visit_statement(
+            self, condition: Any, user_agent: Optional[str],
+            count_usage: bool
+    ):
+        """Resolve live url, count usage and save history in one query.
+
+        History is saved only when ``user_agent`` is given.
+        """
+
+        columns = (
+            self._model.id, self._model.original_url, self._model.expires_at
+        )
+        if count_usage:
+            hit = update(self._model).where(
+                condition, self._live()
+            ).values(
+                usage_count=self._model.usage_count + 1
+            ).returning(*columns)
+        else:
+            hit = select(*columns).where(condition, self._live())
+        if user_agent is None:
+            return hit
+        hit = hit.cte('hit')
+        history = insert(self._request_model).from_select(
+            ['id', 'short_url', 'user_agent', 'used_at'],
+            select(
+                literal(uuid.uuid4(), self._request_model.id.type),
+                hit.c.id,
+                literal(user_agent[:HISTORY_USER_AGENT_LENGTH]),
+                literal(datetime.utcnow())
+            )
+        ).returning(self._request_model.short_url).cte('history')
+        return select(hit.c.id, hit.c.original_url, hit.c.expires_at).join(
+            history, history.c.short_url == hit.c.id
+        )
+
+    def _live(self) -> Any:
+        """Condition of urls that are neither deleted nor expired."""
+
+        return and_(~self._model.del_status, or_(
+            self._model.expires_at.is_(None),
+            self._model.expires_at > datetime.utcnow()
+        ))
+
+    async def _read(
+            self, db: AsyncSession, read_db: Optional[AsyncSession],
+            statement: Any
+    ) -> Result:
+        """Execute read on replica, on primary when the replica fails."""
+
+        if read_db is None:
+            return await db.execute(statement=statement)
+        try:
+            return await read_db.execute(statement=statement)
+        except (OSError, asyncio.TimeoutError, DBAPIError) as error:
+            await read_db.rollback()
+            if self._replicas is not None and (
+                    not isinstance(error, DBAPIError)
+                    or error.connection_invalidated
+            ):
+                self._replicas.mark_down(read_db.bind, error)
+            logger.warning('Replica read failed, using primary: %r', error)
+        return await db.execute(statement=statement)
+
+    @staticmethod
+    def _read_your_writes(read_db: Optional[AsyncSession]) -> bool:
+        return read_db is not None and app_settings.replica_read_your_writes
+
+    def _invalidate(self, short_id: str) -> None:
+        if self._cache:
+            self._cache.invalidate(short_id)
+
+    def cache_stats(self) -> dict:
+        """Get cache hit/miss counters"""
+
+        return self._cache.stats() if self._cache else {}
+
+    @repository_method
     async def update_usage_count(
             self, db: AsyncSession, db_obj: ModelType
     ) -> None:
         """Update usage count"""
 
-        db_obj.usage_count += 1
+        if self._counter is not None and self._counter.running:
+            self._counter.add(db_obj.id)
+            return
+        await db.execute(statement=update(self._model).where(
+            self._model.id == db_obj.id
+        ).values(usage_count=self._model.usage_count + 1))
         await db.commit()
         await db.refresh(db_obj)
 
+    @repository_method
+    async def flush_usage_counts(
+            self, db: AsyncSession, deltas: dict[Any, int],
+            committed: Optional[Callable[[], None]] = None
+    ) -> None:
+        """Add buffered usage counts in one statement"""
+
+        # Sorted ids keep row lock order the same across workers.
+
+        id_type = self._model.id.type
+        ids, counts = zip(*sorted(deltas.items()))
+        delta = func.unnest(
+            cast(bindparam('ids', list(ids)), ARRAY(id_type)),
+            cast(bindparam('deltas', list(counts)), ARRAY(Integer))
+        ).table_valued(
+            column('id', id_type), column('delta', Integer)
+        ).render_derived(name='delta')
+        await db.execute(statement=update(self._model).where(
+            self._model.id == delta.c.id
+        ).values(usage_count=self._model.usage_count + delta.c.delta))
+        await db.commit()
+        if committed is not None:
+            committed()
+
+    @repository_method
     async def create_history(
             self, db: AsyncSession, short_id: int, user_agent: str
     ) -> None:
         """Create usage history"""
 
-        request_obj = self._request_model(
-            short_url=short_id, user_agent=user_agent
-        )
-        db.add(request_obj)
+        event = history_event(short_id, user_agent)
+        if self._history is not None and self._history.running:
+            await self._history.put(event)
+            return
+        await self.write_history(db=db, events=[event])
+
+    @repository_method
+    async def write_history(
+            self, db: AsyncSession, events: list[HistoryEvent]
+    ) -> None:
+        """Save usage history batch and update its rollups"""
+
+        if self._rollups_enabled:
+            await self._update_rollups(db, events)
+        table = self._request_model.__table__
+        if app_settings.history_write_method == 'copy':
+            connection = await db.connection()
+            raw_connection = await connection.get_raw_connection()
+            await raw_connection.driver_connection.copy_records_to_table(
+                table.name, records=events, columns=HistoryEvent._fields
+            )
+        else:
+            chunk_size = values_chunk_size(table)
+            for start in range(0, len(events), chunk_size):
+                await db.execute(statement=insert(table).values([
+                    event._asdict()
+                    for event in events[start:start + chunk_size]
+                ]))
         await db.commit()
-        await db.refresh(request_obj)
 
+    async def _update_rollups(
+            self, db: AsyncSession, events: list[HistoryEvent]
+    ) -> None:
+        with_agents = (
+            self._agent_rollup is not None and app_settings.rollup_user_agents
+        )
+        usage_rows, agent_rows = aggregate(events, user_agents=with_agents)
+        for model, rows in (
+                (self._rollup, usage_rows), (self._agent_rollup, agent_rows)
+        ):
+            chunk_size = values_chunk_size(model.__table__)
+            for start in range(0, len(rows), chunk_size):
+                statement = pg_insert(model).values(
+                    rows[start:start + chunk_size]
+                )
+                await db.execute(statement=statement.on_conflict_do_update(
+                    index_elements=[
+                        column.name for column in model.__table__.primary_key
+                    ],
+                    set_={'count': model.count + statement.excluded.count}
+                ))
+
+    @repository_method
+    async def get_stats(
+            self, db: AsyncSession, db_obj: ModelType, granularity: str,
+            date_from: datetime, date_to: datetime, user_agents: bool,
+            read_db: Optional[AsyncSession] = None
+    ) -> list[dict]:
+        """Get usage counts per bucket from rollups or raw history.
+
+        Raw history is aggregated when rollups are disabled, their tables
+        are not kept up to date then.
+        """
+
+        if self._rollups_enabled:
+            usage, agents = self._rollup_stats(
+                db_obj, granularity, date_from, date_to
+            )
+        else:
+            usage, agents = self._history_stats(
+                db_obj, granularity, date_from, date_to
+            )
+        result = await self._read(
+            db, read_db, usage.order_by(usage.selected_columns.bucket)
+        )
+        buckets = {
+            row.bucket: {'bucket': row.bucket, 'count': row.count}
+            for row in result
+        }
+        if user_agents and agents is not None:
+            agents = agents.subquery()
+            rank = func.row_number().over(
+                partition_by=agents.c.bucket, order_by=agents.c.count.desc()
+            ).label('rank')
+            ranked = select(
+                agents.c.bucket, agents.c.user_agent, agents.c.count, rank
+            ).subquery()
+            result = await self._read(db, read_db, select(
+                ranked.c.bucket, ranked.c.user_agent, ranked.c.count
+            ).where(ranked.c.rank <= app_settings.rollup_top_user_agents))
+            for row in result:
+                if row.bucket in buckets:
+                    buckets[row.bucket].setdefault(
+                        'user_agents', {}
+                    )[row.user_agent] = row.count
+        return list(buckets.values())
+
+    def _rollup_stats(
+            self, db_obj: ModelType, granularity: str, date_from: datetime,
+            date_to: datetime
+    ) -> tuple[Any, Any]:
+        rollup = self._rollup
+        usage = select(rollup.bucket, rollup.count).where(
+            rollup.short_url == db_obj.id,
+            rollup.granularity == granularity,
+            rollup.bucket >= date_from, rollup.bucket <= date_to
+        )
+        agent_rollup = self._agent_rollup
+        if agent_rollup is None:
+            return usage, None
+        return usage, select(
+            agent_rollup.bucket, agent_rollup.user_agent, agent_rollup.count
+        ).where(
+            agent_rollup.short_url == db_obj.id,
+            agent_rollup.granularity == granularity,
+            agent_rollup.bucket >= date_from,
+            agent_rollup.bucket <= date_to
+        )
+
+    def _history_stats(
+            self, db_obj: ModelType, granularity: str, date_from: datetime,
+            date_to: datetime
+    ) -> tuple[Any, Any]:
+        if granularity not in GRANULARITIES:
+            raise HTTPException(status_code=400, detail='Invalid granularity')
+        history = self._request_model
+        start, end = bucket_range(date_from, date_to, granularity)
+        # Rendered inline, the same expression is selected and grouped by.
+        bucket = func.date_trunc(
+            literal_column(f"'{granularity}'"), history.used_at
+        )
+        in_range = (
+            history.short_url == db_obj.id,
+            history.used_at >= start, history.used_at < end
+        )
+        usage = select(
+            bucket.label('bucket'), func.count().label('count')
+        ).where(*in_range).group_by(bucket)
+        agents = select(
+            bucket.label('bucket'), history.user_agent,
+            func.count().label('count')
+        ).where(*in_range).group_by(bucket, history.user_agent)
+        return usage, agents
+
+    @staticmethod
+    def _history_start(db_obj: Any) -> datetime:
+        """Start of the oldest history partition the url can have rows in.
+
+        History starts with the url creation and partitions before the
+        retention window are dropped.
+        """
+
+        interval = app_settings.history_partition_interval
+        start = db_obj.created_at or datetime.min
+        if app_settings.history_retention_days:
+            start = max(start, datetime.utcnow() - timedelta(
+                days=app_settings.history_retention_days
+            ))
+        return partition_start(start, interval)
+
+    @repository_method
     async def get_status(
             self, db: AsyncSession, db_obj: ModelType,
-            full_info: bool, limit: int, offset: int
-    ) -> list[UrlHistoryInfo]:
-        """Get usage count of usage history"""
+            full_info: bool, limit: int, offset: int,
+            cursor: Optional[str] = None,
+            read_db: Optional[AsyncSession] = None
+    ) -> Any:
+        """Get usage count or usage history page with next page cursor"""
 
         if not full_info:
-            return db_obj.usage_count
+            if self._counter is None:
+                return db_obj.usage_count
+            return db_obj.usage_count + self._counter.pending(db_obj.id)
+        history = self._request_model
         statement = select(
-            self._request_model
+            history.id, history.user_agent, history.used_at
         ).where(
-            self._request_model.short_url == db_obj.id
-        ).offset(offset).limit(limit)
-        result = await db.execute(statement=statement)
-        return [
-            UrlHistoryInfo.from_orm(item) for item in result.scalars().all()
-        ]
+            history.short_url == db_obj.id,
+            history.used_at >= self._history_start(db_obj)
+        ).order_by(history.used_at.desc(), history.id.desc()).limit(limit)
+        if cursor is not None:
+            used_at, history_id = decode_cursor(cursor)
+            # Partitions are pruned by the plain bound, not by the row
+            # comparison that orders the page.
+            statement = statement.where(
+                history.used_at <= used_at,
+                tuple_(history.used_at, history.id) < (used_at, history_id)
+            )
+        elif offset:
+            statement = statement.offset(offset)
+        result = await self._read(db, read_db, statement)
+        rows = result.all()
+        next_cursor = None
+        if len(rows) == limit:
+            next_cursor = encode_cursor(rows[-1].used_at, rows[-1].id)
+        return [UrlHistoryInfo.from_orm(row) for row in rows], next_cursor
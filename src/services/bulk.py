@@ -0,0 +1,168 @@
+import codecs
+import csv
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterator, Optional
+
+import orjson
+from pydantic import ValidationError
+from pydantic.datetime_parse import parse_datetime
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import ClientDisconnect
+
+from core.config import app_settings
+from db.db import async_session
+from models.short_url import short_url_for
+from schemas.short_url import OriginalUrl, naive_utc
+from services.short_url import urls_crud
+
+logger = logging.getLogger(__name__)
+
+STREAM_FORMATS = {
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'text/csv': 'csv',
+}
+CSV_HEADERS = ('original_url', 'url')
+MAX_LINE_LENGTH = 8192
+
+
+async def iter_lines(
+        chunks: AsyncIterator[bytes], max_length: int = MAX_LINE_LENGTH
+) -> AsyncIterator[Optional[str]]:
+    """Decode lines from body chunks, None in place of too long lines."""
+
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    buffer = ''
+    overlong = False
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split('\n')
+        for line in lines:
+            if overlong or len(line) > max_length:
+                yield None
+            else:
+                yield line.rstrip('\r')
+            overlong = False
+        if len(buffer) > max_length:
+            buffer, overlong = '', True
+    buffer += decoder.decode(b'', final=True)
+    if buffer or overlong:
+        yield None if overlong else buffer.rstrip('\r')
+
+
+def parse_line(line: str, stream_format: str) -> dict:
+    """Url data from NDJSON string or object line or first CSV column.
+
+    Only NDJSON objects carry ``expires_at``.
+    """
+
+    if stream_format == 'csv':
+        return {'original_url': next(csv.reader([line]), [''])[0].strip()}
+    value = orjson.loads(line)
+    if isinstance(value, str):
+        return {'original_url': value}
+    if isinstance(value, dict) and isinstance(value.get('original_url'), str):
+        data = {'original_url': value['original_url']}
+        if value.get('expires_at') is not None:
+            data['expires_at'] = value['expires_at']
+        return data
+    raise ValueError('Expected url string or object with original_url')
+
+
+def parse_expires_at(value: Any) -> Optional[datetime]:
+    """Expiration time of a line kept for later validation."""
+
+    if value is None:
+        return None
+    if not isinstance(value, (str, int, float)):
+        raise ValueError('invalid datetime format')
+    return naive_utc(parse_datetime(value))
+
+
+async def iter_records(
+        chunks: AsyncIterator[bytes], stream_format: str,
+        validate: bool = True
+) -> AsyncIterator[tuple[int, Optional[dict], Optional[str]]]:
+    """Urls as line number, url data and error.
+
+    Without ``validate`` only the line format is checked, urls are left as
+    they are for a later validation.
+    """
+
+    number = 0
+    async for line in iter_lines(chunks):
+        number += 1
+        if line is None:
+            yield number, None, 'Line is too long'
+            continue
+        if not line.strip():
+            continue
+        try:
+            data = parse_line(line, stream_format)
+            if (number == 1 and stream_format == 'csv'
+                    and data['original_url'].lower() in CSV_HEADERS):
+                continue
+            if not validate:
+                data['expires_at'] = parse_expires_at(data.get('expires_at'))
+                yield number, data, None
+                continue
+            obj = OriginalUrl(**data)
+        except ValidationError as error:
+            yield number, None, error.errors()[0]['msg']
+        except ValueError as error:
+            yield number, None, str(error)
+        else:
+            data = {'original_url': obj.original_url}
+            if obj.expires_at is not None:
+                data['expires_at'] = obj.expires_at
+            yield number, data, None
+
+
+def result_line(number: int, row, error: Optional[str]) -> bytes:
+    if error is not None:
+        result = {'line': number, 'error': error}
+    else:
+        result = {
+            'line': number, 'short_id': row.short_id,
+            'short_url': short_url_for(row.short_id),
+            'original_url': str(row.original_url),
+        }
+    return orjson.dumps(result) + b'\n'
+
+
+async def create_pending(db: AsyncSession, pending: list) -> bytes:
+    """Create valid urls of the chunk, results keep the input order."""
+
+    rows = iter(await urls_crud.bulk_create_chunk(
+        db=db, list_urls=[data for _, data, error in pending if not error]
+    ))
+    return b''.join(
+        result_line(number, None if error else next(rows), error)
+        for number, _, error in pending
+    )
+
+
+async def shorten_stream(
+        chunks: AsyncIterator[bytes], stream_format: str
+) -> AsyncIterator[bytes]:
+    """Create short urls chunk by chunk, yield NDJSON results per chunk.
+
+    Every chunk is committed before its results are sent, so memory is
+    bounded by the chunk size whatever the upload size is.
+    """
+
+    chunk_size = app_settings.bulk_create_chunk_size
+    pending = []
+    async with async_session() as db:
+        try:
+            async for record in iter_records(chunks, stream_format):
+                pending.append(record)
+                if len(pending) >= chunk_size:
+                    yield await create_pending(db, pending)
+                    pending = []
+        except ClientDisconnect:
+            logger.info('Client disconnected during streaming upload')
+            return
+        if pending:
+            yield await create_pending(db, pending)
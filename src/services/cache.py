@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, namedtuple
+from typing import Any
+
+import asyncpg
+
+from services.periodic import BackgroundTask
+
+logger = logging.getLogger(__name__)
+
+CachedUrl = namedtuple(
+    'CachedUrl', ['id', 'original_url', 'expires_at'], defaults=[None]
+)
+MISSING = object()
+
+
+class UrlCache:
+    """Bounded LRU cache of short_id lookups with TTL.
+
+    Values are ``CachedUrl`` tuples for live links or the error detail
+    string for unknown and deleted ids (negative entries).
+    """
+
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Any:
+        """Return cached value or MISSING."""
+
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return MISSING
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return MISSING
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """Cache positive lookup result."""
+
+        self._store(key, value, self._ttl)
+
+    def set_missing(self, key: str, detail: str) -> None:
+        """Cache unknown or deleted short id."""
+
+        self._store(key, detail, self._negative_ttl)
+
+    def invalidate(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'max_size': self._max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def _store(self, key: str, value: Any, ttl: float) -> None:
+        if self._max_size <= 0 or ttl <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self._max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+
+class CacheInvalidator(BackgroundTask):
+    """Drop cache entries on Postgres NOTIFY from any worker.
+
+    While the channel is down entries expire by TTL, and the cache is
+    cleared on every reconnect because notifications may have been lost.
+    """
+
+    def __init__(
+            self, cache: UrlCache, dsn: str, channel: str,
+            reconnect_delay: float = 1.0
+    ):
+        super().__init__()
+        self._cache = cache
+        self._dsn = dsn.replace('+asyncpg', '')
+        self._channel = channel
+        self._reconnect_delay = reconnect_delay
+
+    @property
+    def channel(self) -> str:
+        return self._channel
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        self._cache.invalidate(payload)
+
+    async def _run(self) -> None:
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self._dsn)
+                closed = asyncio.Event()
+                connection.add_termination_listener(
+                    lambda conn: closed.set()
+                )
+                await connection.add_listener(self._channel, self._on_notify)
+                self._cache.clear()
+                logger.info('Listen cache invalidation on %s', self._channel)
+                await closed.wait()
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                logger.warning('Cache invalidation channel error: %s', error)
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(self._reconnect_delay)
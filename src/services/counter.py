@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class UsageCounter:
+    """Per-worker write-behind buffer of usage count increments.
+
+    Increments are collected per short url id and handed to the flush
+    callback on an interval, when the buffer reaches the threshold and
+    once more on stop. The callback calls ``flushed`` right after its
+    commit, so reads stop adding the delta the database already has.
+    """
+
+    def __init__(self, interval: float, threshold: int):
+        self._interval = interval
+        self._threshold = threshold
+        self._pending: dict[Any, int] = {}
+        self._flushing: dict[Any, int] = {}
+        self._total = 0
+        self._flush_callback: Optional[
+            Callable[[dict[Any, int]], Awaitable[None]]
+        ] = None
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    @property
+    def depth(self) -> int:
+        """Number of unflushed increments."""
+
+        return self._total
+
+    def add(self, key: Any, delta: int = 1) -> None:
+        self._pending[key] = self._pending.get(key, 0) + delta
+        self._total += delta
+        if self._total >= self._threshold:
+            self._wakeup.set()
+
+    def pending(self, key: Any) -> int:
+        """Unflushed increments for the key in this worker.
+
+        Increments buffered by other workers are not visible here.
+        """
+
+        return self._pending.get(key, 0) + self._flushing.get(key, 0)
+
+    def flushed(self) -> None:
+        """Forget the increments of the flush, they are committed."""
+
+        self._flushing = {}
+
+    async def start(
+            self, flush: Callable[[dict[Any, int]], Awaitable[None]]
+    ) -> None:
+        if self._task is None:
+            self._flush_callback = flush
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the task and flush the rest.
+
+        The task is woken up rather than cancelled, wait_for may swallow a
+        cancellation that comes together with the wake up.
+        """
+
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        self._stopping = False
+        await self.flush()
+
+    async def flush(self) -> None:
+        if not self._pending or self._flush_callback is None:
+            return
+        deltas, self._pending, self._total = self._pending, {}, 0
+        self._flushing = deltas
+        try:
+            await self._flush_callback(deltas)
+        except Exception as error:
+            logger.warning('Usage count flush failed: %s', error)
+            for key, delta in deltas.items():
+                self._pending[key] = self._pending.get(key, 0) + delta
+                self._total += delta
+        finally:
+            self._flushing = {}
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), timeout=self._interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not self._stopping:
+                await self.flush()
@@ -0,0 +1,107 @@
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Optional, Type
+
+from sqlalchemy import delete, insert, literal, update
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.future import select
+
+from db.db import Base
+from services.periodic import PeriodicTask
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLUMNS = (
+    'id', 'short_id', 'original_url', 'created_at', 'expires_at',
+    'deleted_at', 'usage_count',
+)
+
+
+class ExpirySweeper(PeriodicTask):
+    """Mark expired short urls deleted and purge long deleted ones.
+
+    Rows are handled in batches, each one a short transaction over rows
+    locked with SKIP LOCKED, so sweepers of all workers share the work and
+    never wait for redirects or each other. Purged urls are moved to the
+    archive table or dropped; their history goes with them.
+    """
+
+    failure_message = 'Short url expiry sweep failed'
+
+    def __init__(
+            self, engine: AsyncEngine, model: Type[Base],
+            archive: Optional[Type[Base]], batch_size: int, purge: str,
+            purge_after_days: int, period: float
+    ):
+        super().__init__(period)
+        self._engine = engine
+        self._model = model
+        self._archive = archive
+        self._batch_size = batch_size
+        self._purge = purge
+        self._purge_after_days = purge_after_days
+
+    async def run_once(self) -> tuple[int, int]:
+        """Sweep until a batch comes back short, return expired and purged."""
+
+        expired = await self._repeat(self.expire_batch)
+        purged = 0
+        if self._purge != 'keep':
+            purged = await self._repeat(self.purge_batch)
+        if expired or purged:
+            logger.info(
+                'Expired %s short urls, purged %s', expired, purged
+            )
+        return expired, purged
+
+    async def _repeat(self, sweep: Callable[[], Awaitable[int]]) -> int:
+        total = 0
+        while True:
+            count = await sweep()
+            total += count
+            if count < self._batch_size:
+                return total
+
+    def _batch(self, *conditions, order_by: Any) -> Any:
+        return select(self._model.id).where(*conditions).order_by(
+            order_by
+        ).limit(self._batch_size).with_for_update(
+            skip_locked=True
+        ).scalar_subquery()
+
+    async def expire_batch(self) -> int:
+        """Mark one batch of expired urls deleted."""
+
+        model = self._model
+        now = datetime.utcnow()
+        batch = self._batch(
+            ~model.del_status, model.expires_at <= now,
+            order_by=model.expires_at
+        )
+        async with self._engine.begin() as connection:
+            result = await connection.execute(update(model).where(
+                model.id.in_(batch)
+            ).values(del_status=True, deleted_at=now))
+        return result.rowcount
+
+    async def purge_batch(self) -> int:
+        """Archive or delete one batch of urls deleted long enough ago."""
+
+        model = self._model
+        border = datetime.utcnow() - timedelta(days=self._purge_after_days)
+        batch = self._batch(
+            model.del_status, model.deleted_at < border,
+            order_by=model.deleted_at
+        )
+        statement = delete(model).where(model.id.in_(batch))
+        if self._purge == 'archive' and self._archive is not None:
+            purged = statement.returning(*(
+                getattr(model, name) for name in ARCHIVE_COLUMNS
+            )).cte('purged')
+            statement = insert(self._archive).from_select(
+                [*ARCHIVE_COLUMNS, 'archived_at'],
+                select(*purged.c, literal(datetime.utcnow()))
+            )
+        async with self._engine.begin() as connection:
+            result = await connection.execute(statement)
+        return result.rowcount
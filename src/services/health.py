@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from core.logger import dropped_records
+from core.metrics import (CACHE_EVENTS, CACHE_SIZE, HISTORY_DROPPED,
+                          POOL_CONNECTIONS, QUEUE_DEPTH)
+from db.db import engine, replicas
+from db.replicas import ReplicaRouter
+from services.cache import UrlCache
+from services.counter import UsageCounter
+from services.history import HistoryWriter
+from services.short_url import history_writer, urls_cache, usage_counter
+
+
+class HealthCheck:
+    """Readiness probe and diagnostics of the worker."""
+
+    def __init__(
+            self, engine: AsyncEngine, cache: UrlCache,
+            counter: UsageCounter, history: HistoryWriter,
+            replicas: ReplicaRouter
+    ):
+        self._engine = engine
+        self._cache = cache
+        self._counter = counter
+        self._history = history
+        self._replicas = replicas
+
+    async def probe_db(self, timeout: float) -> dict:
+        """Acquire a pooled connection and run SELECT 1 within timeout."""
+
+        async def probe() -> dict:
+            started = time.perf_counter()
+            async with self._engine.connect() as connection:
+                acquired = time.perf_counter()
+                await connection.execute(text('SELECT 1'))
+            return {
+                'acquire_ms': round((acquired - started) * 1000, 3),
+                'latency_ms': round(
+                    (time.perf_counter() - acquired) * 1000, 3
+                ),
+            }
+
+        return await asyncio.wait_for(probe(), timeout=timeout)
+
+    def pool_stats(self) -> dict:
+        pool = self._engine.sync_engine.pool
+        stats = {'status': pool.status()}
+        for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+            method = getattr(pool, name, None)
+            if method is not None:
+                stats[name] = method()
+        return stats
+
+    def queue_stats(self) -> dict:
+        return {
+            'history': {
+                'running': self._history.running,
+                'depth': self._history.depth,
+                'dropped': self._history.dropped,
+            },
+            'usage_counter': {
+                'running': self._counter.running,
+                'depth': self._counter.depth,
+            },
+            'log': {'dropped': dropped_records()},
+        }
+
+    def update_metrics(self) -> None:
+        """Set gauges of pools, cache and background queues."""
+
+        engines = [('primary', self._engine)] + [
+            (replica.url.host, replica) for replica in self._replicas.engines
+        ]
+        for name, pool_engine in engines:
+            pool = pool_engine.sync_engine.pool
+            for state in ('size', 'checkedin', 'checkedout', 'overflow'):
+                method = getattr(pool, state, None)
+                if method is not None:
+                    POOL_CONNECTIONS.labels(name, state).set(max(method(), 0))
+        cache = self._cache.stats()
+        for cache_event in ('hits', 'misses', 'evictions'):
+            CACHE_EVENTS.labels(cache_event).set(cache[cache_event])
+        CACHE_SIZE.set(cache['size'])
+        QUEUE_DEPTH.labels('history').set(self._history.depth)
+        QUEUE_DEPTH.labels('usage_counter').set(self._counter.depth)
+        HISTORY_DROPPED.set(self._history.dropped)
+
+    async def diagnostics(self, timeout: float) -> dict:
+        try:
+            database = await self.probe_db(timeout)
+        except Exception as error:
+            database = {'error': repr(error)}
+        return {
+            'database': database,
+            'pool': self.pool_stats(),
+            'replicas': self._replicas.stats(),
+            'queues': self.queue_stats(),
+            'cache': self._cache.stats(),
+        }
+
+
+health_check = HealthCheck(
+    engine=engine, cache=urls_cache, counter=usage_counter,
+    history=history_writer, replicas=replicas
+)
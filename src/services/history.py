@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import random
+import time
+from collections import namedtuple
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+HistoryEvent = namedtuple(
+    'HistoryEvent', ['id', 'short_url', 'user_agent', 'used_at']
+)
+BACKPRESSURE_POLICIES = ('block', 'drop_oldest', 'sample')
+
+
+class HistoryWriter:
+    """Background writer of url usage history in batches.
+
+    Events wait in a bounded queue and are written when the batch is full
+    or the flush interval has passed. When the queue is full the policy
+    decides what happens to a new event: ``block`` waits for free space,
+    ``drop_oldest`` replaces the oldest event and ``sample`` keeps only
+    ``sample_rate`` of the new events in place of the oldest ones.
+    """
+
+    def __init__(
+            self, batch_size: int, flush_interval: float, max_size: int,
+            policy: str = 'block', sample_rate: float = 0.1
+    ):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f'Unknown backpressure policy: {policy}')
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._policy = policy
+        self._sample_rate = sample_rate
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self._write: Optional[
+            Callable[[list[HistoryEvent]], Awaitable[None]]
+        ] = None
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    @property
+    def depth(self) -> int:
+        """Number of queued events."""
+
+        return self._queue.qsize()
+
+    async def put(self, event: HistoryEvent) -> None:
+        if self._policy == 'block' or not self._queue.full():
+            await self._queue.put(event)
+        elif self._policy == 'sample' and (
+                random.random() >= self._sample_rate
+        ):
+            self.dropped += 1
+            return
+        else:
+            self._queue.get_nowait()
+            self._queue.task_done()
+            self.dropped += 1
+            self._queue.put_nowait(event)
+        self._wakeup.set()
+
+    async def start(
+            self, write: Callable[[list[HistoryEvent]], Awaitable[None]]
+    ) -> None:
+        if self._task is None:
+            self._write = write
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush queued events and stop the writer."""
+
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._closing = False
+
+    async def _run(self) -> None:
+        while True:
+            if self._queue.empty():
+                await self._wait(None)
+                continue
+            deadline = time.monotonic() + self._flush_interval
+            batch = []
+            while len(batch) < self._batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - time.monotonic()
+                if timeout <= 0 or self._closing:
+                    break
+                await self._wait(timeout)
+            await self._flush(batch)
+
+    async def _wait(self, timeout: Optional[float]) -> None:
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _flush(self, batch: list[HistoryEvent]) -> None:
+        try:
+            await self._write(batch)
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            self.dropped += len(batch)
+            logger.warning(
+                'History batch of %d events lost: %s', len(batch), error
+            )
+        finally:
+            for _ in batch:
+                self._queue.task_done()
@@ -0,0 +1,133 @@
+import hashlib
+import math
+import os
+from abc import ABC, abstractmethod
+from collections import deque
+
+from sqlalchemy import Sequence, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+ALPHABET = (
+    '0123456789'
+    'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    'abcdefghijklmnopqrstuvwxyz'
+)
+
+
+def base62_encode(number: int, length: int) -> str:
+    """Encode number as fixed length base62 string."""
+
+    chars = []
+    for _ in range(length):
+        number, rest = divmod(number, 62)
+        chars.append(ALPHABET[rest])
+    if number:
+        raise ValueError(f'Number does not fit into {length} chars')
+    return ''.join(reversed(chars))
+
+
+class IdGenerator(ABC):
+    """Short id generator."""
+
+    def __init__(self, length: int):
+        self._length = length
+        self._capacity = 62 ** length
+
+    @abstractmethod
+    async def generate(self, db: AsyncSession, count: int) -> list[str]:
+        raise NotImplementedError
+
+
+class RandomIdGenerator(IdGenerator):
+    """Random ids, collisions are resolved by the unique index."""
+
+    async def generate(self, db: AsyncSession, count: int) -> list[str]:
+        return self.random_ids(count)
+
+    def random_ids(self, count: int) -> list[str]:
+        data = os.urandom(8 * count)
+        return [
+            base62_encode(
+                int.from_bytes(data[i:i + 8], 'big') % self._capacity,
+                self._length
+            )
+            for i in range(0, 8 * count, 8)
+        ]
+
+
+class SequenceIdGenerator(IdGenerator):
+    """Ids from a Postgres sequence, preallocated by blocks per worker."""
+
+    def __init__(self, length: int, sequence: str, block_size: int):
+        super().__init__(length)
+        self._sequence = Sequence(sequence)
+        self._block_size = block_size
+        self._block: deque[int] = deque()
+
+    async def generate(self, db: AsyncSession, count: int) -> list[str]:
+        while len(self._block) < count:
+            size = max(self._block_size, count - len(self._block))
+            result = await db.execute(statement=select(
+                self._sequence.next_value()
+            ).select_from(func.generate_series(1, size)))
+            self._block.extend(result.scalars())
+        return [self.encode(self._block.popleft()) for _ in range(count)]
+
+    def encode(self, number: int) -> str:
+        return base62_encode(number, self._length)
+
+
+class FeistelIdGenerator(SequenceIdGenerator):
+    """Sequence ids permuted by a keyed Feistel network.
+
+    The permutation is a bijection on the largest even bit width that fits
+    into the id length, so ids stay unique but are not guessable.
+    """
+
+    rounds = 4
+
+    def __init__(
+            self, length: int, sequence: str, block_size: int, secret: str
+    ):
+        super().__init__(length, sequence, block_size)
+        if not secret:
+            raise ValueError('Feistel id generator needs a secret')
+        self._half_bits = int(math.log2(self._capacity)) // 2
+        self._mask = (1 << self._half_bits) - 1
+        self._keys = [
+            hashlib.blake2b(
+                f'{secret}:{round_number}'.encode(), digest_size=16
+            ).digest()
+            for round_number in range(self.rounds)
+        ]
+
+    def permute(self, number: int) -> int:
+        if number >> (2 * self._half_bits):
+            raise ValueError('Sequence is out of the id space')
+        left, right = number >> self._half_bits, number & self._mask
+        for key in self._keys:
+            left, right = right, left ^ self._round(right, key)
+        return (left << self._half_bits) | right
+
+    def encode(self, number: int) -> str:
+        return base62_encode(self.permute(number), self._length)
+
+    def _round(self, value: int, key: bytes) -> int:
+        digest = hashlib.blake2b(
+            value.to_bytes(8, 'big'), key=key, digest_size=8
+        ).digest()
+        return int.from_bytes(digest, 'big') & self._mask
+
+
+def build_id_generator(
+        kind: str, length: int, sequence: str, block_size: int, secret: str
+) -> IdGenerator:
+    """Create id generator by its settings name."""
+
+    if kind == 'random':
+        return RandomIdGenerator(length)
+    if kind == 'sequence':
+        return SequenceIdGenerator(length, sequence, block_size)
+    if kind == 'feistel':
+        return FeistelIdGenerator(length, sequence, block_size, secret)
+    raise ValueError(f'Unknown short id generator: {kind}')
@@ -0,0 +1,351 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy import (DateTime, Integer, Interval, String, bindparam, case,
+                        cast, column, delete, func, literal, or_, update)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from core.config import app_settings
+from core.metrics import repository_method
+from db.db import async_session
+from models.job import ShortenJob, ShortenJobItem
+from models.short_url import ShortUrl, short_url_for
+from schemas.short_url import OriginalUrl
+from services.base import RepositoryDB, url_data
+from services.periodic import PeriodicTask
+from services.short_url import urls_crud
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('pending', 'running')
+
+
+class ShortenJobs:
+    """Bulk shortening jobs stored in Postgres.
+
+    A job is processed chunk by chunk, every chunk is one transaction that
+    validates the urls, creates the short urls and moves the job progress.
+    The job row is locked with SKIP LOCKED, so workers of all processes
+    share the jobs and a restarted worker resumes from the last committed
+    chunk. A failed chunk is retried after ``retry_delay`` seconds,
+    doubled with every failure, other jobs are processed meanwhile.
+    """
+
+    def __init__(
+            self, urls: RepositoryDB, chunk_size: int, max_failures: int,
+            retry_delay: float
+    ):
+        self._urls = urls
+        self._chunk_size = chunk_size
+        self._max_failures = max_failures
+        self._retry_delay = retry_delay
+
+    @repository_method
+    async def submit(
+            self, db: AsyncSession,
+            records: AsyncIterator[tuple[int, Optional[dict], Optional[str]]],
+            max_size: int
+    ) -> ShortenJob:
+        """Save job with its urls in chunks while they are uploaded.
+
+        Every chunk is committed on its own, so a slow client does not
+        hold a transaction open. Workers skip the job while it is
+        ``uploading``, it becomes ``pending`` with the last chunk and is
+        deleted when the upload fails.
+        """
+
+        job = ShortenJob(total=0, status='uploading')
+        db.add(job)
+        await db.commit()
+        try:
+            job.total = await self._save_items(db, job.id, records, max_size)
+        except Exception:
+            await db.rollback()
+            await db.execute(statement=delete(ShortenJob).where(
+                ShortenJob.id == job.id
+            ))
+            await db.commit()
+            raise
+        job.status = 'pending'
+        job.updated_at = datetime.utcnow()
+        await db.commit()
+        return job
+
+    async def _save_items(
+            self, db: AsyncSession, job_id: Any,
+            records: AsyncIterator[tuple[int, Optional[dict], Optional[str]]],
+            max_size: int
+    ) -> int:
+        total = 0
+        items = []
+        async for number, data, error in records:
+            if error is not None:
+                raise HTTPException(
+                    status_code=400, detail=f'Line {number}: {error}'
+                )
+            if total >= max_size:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f'Job is limited to {max_size} urls'
+                )
+            items.append({
+                'job_id': job_id, 'position': total,
+                'original_url': data['original_url'],
+                'expires_at': data.get('expires_at'),
+            })
+            total += 1
+            if len(items) >= self._chunk_size:
+                await self._save_chunk(db, job_id, items)
+                items = []
+        if items:
+            await self._save_chunk(db, job_id, items)
+        return total
+
+    async def _save_chunk(
+            self, db: AsyncSession, job_id: Any, items: list[dict]
+    ) -> None:
+        await db.execute(ShortenJobItem.__table__.insert(), items)
+        await db.execute(statement=update(ShortenJob).where(
+            ShortenJob.id == job_id
+        ).values(updated_at=datetime.utcnow()))
+        await db.commit()
+
+    @repository_method
+    async def purge_stale_uploads(
+            self, db: AsyncSession, timeout: float
+    ) -> int:
+        """Delete jobs whose upload stopped without finishing"""
+
+        result = await db.execute(statement=delete(ShortenJob).where(
+            ShortenJob.status == 'uploading',
+            ShortenJob.updated_at < datetime.utcnow() - timedelta(
+                seconds=timeout
+            )
+        ))
+        await db.commit()
+        return result.rowcount
+
+    @repository_method
+    async def get(self, db: AsyncSession, job_id: Any) -> ShortenJob:
+        """Get job progress"""
+
+        job = await db.get(ShortenJob, job_id)
+        if job is None:
+            logger.info('Job not found')
+            raise HTTPException(status_code=400, detail='Job not found')
+        return job
+
+    @repository_method
+    async def results(
+            self, db: AsyncSession, job: ShortenJob, limit: int, after: int
+    ) -> tuple[list[dict], Optional[int]]:
+        """Get processed urls page and position to continue after"""
+
+        item = ShortenJobItem
+        result = await db.execute(statement=select(
+            item.position, item.original_url, item.error, ShortUrl.short_id
+        ).outerjoin(
+            ShortUrl, ShortUrl.id == item.short_url
+        ).where(
+            item.job_id == job.id, item.position > after,
+            item.position < job.processed
+        ).order_by(item.position).limit(limit))
+        rows = result.all()
+        next_after = rows[-1].position if len(rows) == limit else None
+        return [
+            {'position': row.position, 'original_url': str(row.original_url),
+             'short_id': row.short_id,
+             'short_url': row.short_id and short_url_for(row.short_id),
+             'error': row.error}
+            for row in rows
+        ], next_after
+
+    @repository_method
+    async def process_next(self, db: AsyncSession) -> bool:
+        """Process one chunk of the oldest free job, False if none"""
+
+        result = await db.execute(statement=select(ShortenJob).where(
+            ShortenJob.status.in_(ACTIVE_STATUSES),
+            or_(
+                ShortenJob.retry_at.is_(None),
+                ShortenJob.retry_at <= datetime.utcnow()
+            )
+        ).order_by(ShortenJob.created_at).limit(1).with_for_update(
+            skip_locked=True
+        ))
+        job = result.scalar_one_or_none()
+        if job is None:
+            await db.rollback()
+            return False
+        job_id = job.id
+        try:
+            await self._process_chunk(db, job)
+            await db.commit()
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            await db.rollback()
+            await self._record_failure(db, job_id, error)
+        return True
+
+    async def _process_chunk(self, db: AsyncSession, job: ShortenJob) -> None:
+        item = ShortenJobItem
+        result = await db.execute(statement=select(
+            item.position, item.original_url, item.expires_at
+        ).where(
+            item.job_id == job.id, item.position >= job.processed
+        ).order_by(item.position).limit(self._chunk_size))
+        items = result.all()
+        valid, errors = [], {}
+        for row in items:
+            try:
+                valid.append(url_data(OriginalUrl(
+                    original_url=str(row.original_url),
+                    expires_at=row.expires_at
+                )))
+            except ValidationError as error:
+                errors[row.position] = error.errors()[0]['msg'][:200]
+        created = iter(await self._urls.create_rows(db, valid))
+        if items:
+            short_url_type = item.short_url.type
+            done = func.unnest(
+                cast(bindparam('positions', [row.position for row in items]),
+                     ARRAY(Integer)),
+                cast(bindparam('ids', [
+                    None if row.position in errors else next(created).id
+                    for row in items
+                ]), ARRAY(short_url_type)),
+                cast(bindparam('errors', [
+                    errors.get(row.position) for row in items
+                ]), ARRAY(String))
+            ).table_valued(
+                column('position', Integer), column('id', short_url_type),
+                column('error', String)
+            ).render_derived(name='done')
+            await db.execute(statement=update(item).where(
+                item.job_id == job.id, item.position == done.c.position
+            ).values(short_url=done.c.id, error=done.c.error))
+        job.processed += len(items)
+        finished = not items or job.processed >= job.total
+        job.status = 'done' if finished else 'running'
+        job.updated_at = datetime.utcnow()
+
+    async def _record_failure(
+            self, db: AsyncSession, job_id: Any, error: Exception
+    ) -> None:
+        logger.warning('Shorten job %s chunk failed: %r', job_id, error)
+        now = datetime.utcnow()
+        await db.execute(statement=update(ShortenJob).where(
+            ShortenJob.id == job_id
+        ).values(
+            failures=ShortenJob.failures + 1,
+            retry_at=cast(literal(now), DateTime) + cast(
+                literal(timedelta(seconds=self._retry_delay)), Interval
+            ) * func.power(2, ShortenJob.failures),
+            status=case(
+                (ShortenJob.failures + 1 >= self._max_failures, 'failed'),
+                else_=ShortenJob.status
+            ),
+            error=repr(error)[:200], updated_at=now
+        ))
+        await db.commit()
+
+
+class JobWorker:
+    """Pool of background tasks that process shorten jobs.
+
+    Idle tasks poll for jobs every ``poll_interval`` seconds, a job
+    submitted by this process wakes them up at once.
+    """
+
+    def __init__(self, concurrency: int, poll_interval: float):
+        self._concurrency = concurrency
+        self._poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    async def start(self, process: Callable[[], Awaitable[bool]]) -> None:
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._run(process))
+                for _ in range(self._concurrency)
+            ]
+
+    async def stop(self) -> None:
+        """Stop tasks, an unfinished chunk is rolled back and redone."""
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self, process: Callable[[], Awaitable[bool]]) -> None:
+        while True:
+            try:
+                if await process():
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                logger.warning('Shorten job worker: %r', error)
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), self._poll_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+shorten_jobs = ShortenJobs(
+    urls_crud,
+    chunk_size=app_settings.bulk_create_chunk_size,
+    max_failures=app_settings.job_max_failures,
+    retry_delay=app_settings.job_retry_delay,
+)
+job_worker = JobWorker(
+    concurrency=app_settings.job_workers,
+    poll_interval=app_settings.job_poll_interval,
+)
+
+
+class UploadSweeper(PeriodicTask):
+    """Delete jobs left ``uploading`` by a worker that died mid upload."""
+
+    failure_message = 'Stale job uploads are not deleted'
+
+    def __init__(self, jobs: ShortenJobs, timeout: float):
+        super().__init__(timeout)
+        self._jobs = jobs
+        self._timeout = timeout
+
+    async def run_once(self) -> None:
+        async with async_session() as db:
+            purged = await self._jobs.purge_stale_uploads(db, self._timeout)
+        if purged:
+            logger.info('Deleted %s stale job uploads', purged)
+
+
+upload_sweeper = UploadSweeper(
+    shorten_jobs, timeout=app_settings.job_upload_timeout
+)
+
+
+async def process_next_job() -> bool:
+    """Process one job chunk with a fresh session."""
+
+    async with async_session() as db:
+        return await shorten_jobs.process_next(db)
@@ -0,0 +1,55 @@
+import asyncio
+import logging
+from typing import Optional
+
+
+class BackgroundTask:
+    """One asyncio task of the worker, started and cancelled with the app."""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        raise NotImplementedError
+
+
+class PeriodicTask(BackgroundTask):
+    """Call ``run_once`` every ``period`` seconds.
+
+    Failures are logged with ``failure_message`` by the logger of the
+    subclass module and retried next period.
+    """
+
+    failure_message = 'Periodic task failed'
+
+    def __init__(self, period: float):
+        super().__init__()
+        self._period = period
+
+    async def run_once(self) -> None:
+        raise NotImplementedError
+
+    async def _run(self) -> None:
+        logger = logging.getLogger(type(self).__module__)
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                logger.warning('%s: %r', self.failure_message, error)
+            await asyncio.sleep(self._period)
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Optional
+
+from sqlalchemy import Float, case, cast, delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.rate_limit import RateLimitBucket
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitBackend(ABC):
+    """Token bucket store, implemented as generic cell rate algorithm.
+
+    Every key keeps only its theoretical arrival time: a request is allowed
+    while it is at most ``burst`` intervals of ``1 / rate`` ahead of now.
+    """
+
+    @abstractmethod
+    async def hit(self, key: str, rate: float, burst: int) -> float:
+        """Take a token, return 0 or seconds to wait for the next one."""
+
+        raise NotImplementedError
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """Per worker buckets, limits are multiplied by the workers count."""
+
+    def __init__(self, max_keys: int = 100000):
+        self._max_keys = max_keys
+        self._tat: dict[str, float] = {}
+
+    async def hit(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        interval = 1 / rate
+        tat = max(self._tat.get(key, now), now) + interval
+        if tat - now > burst * interval:
+            return tat - now - burst * interval
+        if key not in self._tat and len(self._tat) >= self._max_keys:
+            self._prune(now)
+        self._tat[key] = tat
+        return 0.0
+
+    def _prune(self, now: float) -> None:
+        """Forget full buckets, the oldest keys when all are in use."""
+
+        self._tat = {
+            key: tat for key, tat in self._tat.items() if tat > now
+        }
+        excess = len(self._tat) - self._max_keys + 1
+        for key in list(self._tat)[:max(excess, 0)]:
+            del self._tat[key]
+
+
+class PostgresRateLimitBackend(RateLimitBackend):
+    """Buckets shared by all workers in an unlogged table.
+
+    One upsert per request, the database clock is used so workers on
+    different hosts agree. Requests are allowed when the database fails.
+    """
+
+    def __init__(
+            self, session_factory: Callable[[], AsyncSession],
+            cleanup_interval: float = 60
+    ):
+        self._session_factory = session_factory
+        self._cleanup_interval = cleanup_interval
+        self._cleaned_at = time.monotonic()
+        self._cleanup: Optional[asyncio.Task] = None
+
+    async def hit(self, key: str, rate: float, burst: int) -> float:
+        bucket = RateLimitBucket
+        interval = 1 / rate
+        now = cast(func.extract('epoch', func.now()), Float)
+        start = func.greatest(bucket.tat, now)
+        fits = start + interval - now <= burst * interval
+        statement = pg_insert(bucket).values(
+            key=key, tat=now + interval, allowed=True
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[bucket.key],
+            set_={
+                'allowed': fits,
+                'tat': case((fits, start + interval), else_=bucket.tat),
+            }
+        ).returning(bucket.allowed, (bucket.tat - now).label('ahead'))
+        try:
+            async with self._session_factory() as db:
+                result = await db.execute(statement=statement)
+                row = result.one()
+                await db.commit()
+        except Exception as error:
+            logger.warning('Rate limit is not checked: %r', error)
+            return 0.0
+        self._schedule_cleanup()
+        if row.allowed:
+            return 0.0
+        return max(row.ahead - (burst - 1) * interval, 0.0)
+
+    def _schedule_cleanup(self) -> None:
+        if (time.monotonic() - self._cleaned_at < self._cleanup_interval
+                or self._cleanup is not None and not self._cleanup.done()):
+            return
+        self._cleaned_at = time.monotonic()
+        self._cleanup = asyncio.create_task(self.cleanup())
+
+    async def cleanup(self) -> None:
+        """Delete buckets that are full again."""
+
+        try:
+            async with self._session_factory() as db:
+                await db.execute(statement=delete(RateLimitBucket).where(
+                    RateLimitBucket.tat
+                    < cast(func.extract('epoch', func.now()), Float)
+                ))
+                await db.commit()
+        except Exception as error:
+            logger.warning('Rate limit cleanup failed: %r', error)
+
+
+def build_rate_limit_backend(
+        kind: str, session_factory: Callable[[], AsyncSession]
+) -> RateLimitBackend:
+    """Create rate limit backend by its settings name."""
+
+    if kind == 'memory':
+        return MemoryRateLimitBackend()
+    if kind == 'postgres':
+        return PostgresRateLimitBackend(session_factory)
+    raise ValueError(f'Unknown rate limit backend: {kind}')
@@ -0,0 +1,59 @@
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Iterable
+
+from services.history import HistoryEvent
+
+GRANULARITIES = ('hour', 'day')
+STEPS = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+
+
+def truncate(moment: datetime, granularity: str) -> datetime:
+    """Start of the rollup bucket the moment belongs to."""
+
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def bucket_range(
+        date_from: datetime, date_to: datetime, granularity: str
+) -> tuple[datetime, datetime]:
+    """Event time range of the buckets starting from ``date_from`` to
+    ``date_to`` inclusive, end excluded."""
+
+    start = truncate(date_from, granularity)
+    if start < date_from:
+        start += STEPS[granularity]
+    return start, truncate(date_to, granularity) + STEPS[granularity]
+
+
+def aggregate(
+        events: Iterable[HistoryEvent], user_agents: bool
+) -> tuple[list[dict], list[dict]]:
+    """Count history events per link and bucket for every granularity.
+
+    Rows are sorted by key so concurrent upserts lock them in one order.
+    """
+
+    usage: Counter = Counter()
+    agents: Counter = Counter()
+    for event in events:
+        for granularity in GRANULARITIES:
+            key = (event.short_url, granularity,
+                   truncate(event.used_at, granularity))
+            usage[key] += 1
+            if user_agents:
+                agents[key + (event.user_agent,)] += 1
+    usage_rows = [
+        {'short_url': short_url, 'granularity': granularity,
+         'bucket': bucket, 'count': count}
+        for (short_url, granularity, bucket), count in sorted(usage.items())
+    ]
+    agent_rows = [
+        {'short_url': short_url, 'granularity': granularity,
+         'bucket': bucket, 'user_agent': user_agent, 'count': count}
+        for (short_url, granularity, bucket, user_agent), count
+        in sorted(agents.items())
+    ]
+    return usage_rows, agent_rows
@@ -1,8 +1,19 @@
+from typing import Any
+
+from core.config import app_settings
+from db.db import async_session, engine, replicas
+from db.partitions import PartitionMaintainer
 from models.short_url import ShortUrl as ShortUrlModel
-from models.short_url import ShortUrlHistory
+from models.short_url import (ShortUrlAgentRollup, ShortUrlArchive,
+                              ShortUrlHistory, ShortUrlUsageRollup)
 from schemas.short_url import OriginalUrl, ShortUrl
 
 from .base import RepositoryDB
+from .cache import CacheInvalidator, UrlCache
+from .counter import UsageCounter
+from .expiry import ExpirySweeper
+from .history import HistoryEvent, HistoryWriter
+from .id_generator import build_id_generator
 
 
 class Repository(
@@ -11,4 +22,68 @@ class Repository(
     pass
 
 
-urls_crud = Repository(ShortUrlModel, ShortUrlHistory)
+urls_cache = UrlCache(
+    max_size=app_settings.cache_max_size,
+    ttl=app_settings.cache_ttl,
+    negative_ttl=app_settings.cache_negative_ttl,
+)
+cache_invalidator = CacheInvalidator(
+    cache=urls_cache,
+    dsn=app_settings.database_listen_dsn or app_settings.database_dsn,
+    channel=app_settings.cache_invalidation_channel,
+)
+usage_counter = UsageCounter(
+    interval=app_settings.usage_flush_interval,
+    threshold=app_settings.usage_flush_threshold,
+)
+history_writer = HistoryWriter(
+    batch_size=app_settings.history_batch_size,
+    flush_interval=app_settings.history_flush_interval,
+    max_size=app_settings.history_queue_size,
+    policy=app_settings.history_backpressure,
+    sample_rate=app_settings.history_sample_rate,
+)
+partition_maintainer = PartitionMaintainer(
+    engine=engine,
+    interval=app_settings.history_partition_interval,
+    ahead=app_settings.history_partitions_ahead,
+    retention_days=app_settings.history_retention_days,
+    period=app_settings.partition_maintenance_period,
+)
+expiry_sweeper = ExpirySweeper(
+    engine=engine, model=ShortUrlModel, archive=ShortUrlArchive,
+    batch_size=app_settings.expiry_sweep_batch,
+    purge=app_settings.expiry_purge,
+    purge_after_days=app_settings.expiry_purge_after_days,
+    period=app_settings.expiry_sweep_period,
+)
+id_generator = build_id_generator(
+    kind=app_settings.short_id_generator,
+    length=app_settings.short_url_length,
+    sequence=app_settings.short_id_sequence,
+    block_size=app_settings.short_id_block_size,
+    secret=app_settings.short_id_secret,
+)
+urls_crud = Repository(
+    ShortUrlModel, ShortUrlHistory, cache=urls_cache,
+    invalidation_channel=app_settings.cache_invalidation_channel,
+    counter=usage_counter, history=history_writer,
+    id_generator=id_generator, rollup=ShortUrlUsageRollup,
+    agent_rollup=ShortUrlAgentRollup, replicas=replicas,
+)
+
+
+async def save_usage_counts(deltas: dict[Any, int]) -> None:
+    """Flush buffered usage counts with a fresh session."""
+
+    async with async_session() as db:
+        await urls_crud.flush_usage_counts(
+            db=db, deltas=deltas, committed=usage_counter.flushed
+        )
+
+
+async def save_history(events: list[HistoryEvent]) -> None:
+    """Write usage history batch with a fresh session."""
+
+    async with async_session() as db:
+        await urls_crud.write_history(db=db, events=events)
@@ -0,0 +1,45 @@
+import asyncio
+import os
+import sys
+from contextlib import contextmanager
+from typing import Optional
+
+import pytest
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+)
+from db.db import track_queries
+
+
+@pytest.fixture(scope='session')
+def event_loop():
+    """One event loop for all tests, pooled connections are bound to it."""
+
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def query_budget():
+    """Fail when the block runs more database statements than allowed.
+
+    Requests sent through httpx AsyncClient inside the block are counted,
+    they run in the test task.
+    """
+
+    @contextmanager
+    def budget(statements: int, round_trips: Optional[int] = None):
+        with track_queries() as stats:
+            yield stats
+        assert stats.statements <= statements, (
+            f'Query budget of {statements} statements exceeded: {stats}'
+        )
+        if round_trips is not None:
+            assert stats.round_trips <= round_trips, (
+                f'Query budget of {round_trips} round trips exceeded: '
+                f'{stats}'
+            )
+
+    return budget
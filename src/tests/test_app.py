@@ -1,14 +1,21 @@
+import json
 import os
 import sys
+from datetime import datetime, timedelta
 
 import pytest
 from fastapi import status
 from httpx import AsyncClient
+from sqlalchemy import select, update
 
 sys.path.insert(
     0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 )
 from core.config import app_settings
+from db.db import async_session
+from models.short_url import ShortUrl
+from services.jobs import process_next_job
+from services.short_url import expiry_sweeper, urls_cache
 from src.main import app
 
 
@@ -86,10 +93,11 @@ async def test():
         async with AsyncClient(app=app, base_url=app_url) as client:
             response = await client.get(f'{short_id}')
         assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
-        data = response.json()
-        original_url = data.get("original_url")
-        assert original_url is not None
-        assert response.json() == {"original_url": f"{original_url}"}
+        assert response.headers['location'] == 'https://google.ru'
+
+        async with AsyncClient(app=app, base_url=app_url) as client:
+            response = await client.get(f'{short_id}/status')
+        assert response.json() == {"usage_count": 1}
 
     async def test_get_short_url_status():
         """Test get short url status."""
@@ -131,3 +139,195 @@ async def test():
     await test_get_original_url()
     await test_get_short_url_status()
     await test_delete_short_url()
+
+
+@pytest.mark.asyncio
+async def test_health_probes():
+    """Test liveness and readiness probes."""
+
+    async with AsyncClient(app=app, base_url=app_url) as client:
+        response = await client.get('/ping/live')
+        assert response.json() == {'status': 'alive'}
+        response = await client.get('/ping/ready')
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()['status'] == 'ready'
+
+
+@pytest.mark.asyncio
+async def test_get_short_url_history():
+    """Test usage history pages by cursor."""
+
+    async with AsyncClient(app=app, base_url=app_url) as client:
+        response = await client.post(
+            '/', json={"original_url": "https://google.ru"}
+        )
+        short_id = response.json().get("short_id")
+        for _ in range(3):
+            await client.get(f'{short_id}')
+        response = await client.get(
+            f'{short_id}/status', params={'full-info': True,
+                                          'max-result': 2}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.json()) == 2
+        cursor = response.headers['x-next-cursor']
+        response = await client.get(
+            f'{short_id}/status', params={'full-info': True,
+                                          'max-result': 2,
+                                          'cursor': cursor}
+        )
+    assert len(response.json()) == 1
+    assert 'x-next-cursor' not in response.headers
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('rollups_enabled', [True, False])
+async def test_get_short_url_stats(monkeypatch, rollups_enabled):
+    """Test usage stats from rollups and from raw history."""
+
+    monkeypatch.setattr(app_settings, 'rollups_enabled', rollups_enabled)
+    monkeypatch.setattr(app_settings, 'rollup_user_agents', True)
+    async with AsyncClient(app=app, base_url=app_url) as client:
+        response = await client.post(
+            '/', json={"original_url": "https://google.ru"}
+        )
+        short_id = response.json().get("short_id")
+        for _ in range(2):
+            await client.get(f'{short_id}', headers={'user-agent': 'stats'})
+        response = await client.get(f'{short_id}/stats', params={
+            'granularity': 'day', 'from': '2026-01-01T00:00:00Z',
+            'user-agents': True,
+        })
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.json()) == 1
+        assert response.json()[0]['count'] == 2
+        assert response.json()[0]['user_agents'] == {'stats': 2}
+        response = await client.get(f'{short_id}/stats', params={
+            'from': '2026-01-02T03:00:00+03:00',
+            'to': '2026-01-01T23:00:00Z',
+        })
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_stream_bulk_create():
+    """Test streaming bulk create from NDJSON upload."""
+
+    async def upload():
+        yield b'{"original_url": "https://ya.ru"}\n'
+        yield b'"not url"\n"https://google.ru"\n'
+
+    async with AsyncClient(app=app, base_url=app_url) as client:
+        response = await client.post(
+            'shorten/stream', content=upload(),
+            headers={'content-type': 'application/x-ndjson'}
+        )
+    assert response.status_code == status.HTTP_200_OK
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [result['line'] for result in results] == [1, 2, 3]
+    assert 'error' in results[1]
+    assert results[2]['original_url'] == 'https://google.ru'
+
+
+@pytest.mark.asyncio
+async def test_shorten_job():
+    """Test bulk create job progress and results."""
+
+    async def upload():
+        yield b'{"original_url": "https://ya.ru"}\n"https://goo'
+        yield b'gle.ru"\n"not url"\n'
+
+    async with AsyncClient(app=app, base_url=app_url) as client:
+        response = await client.post(
+            'jobs/shorten', content=upload(),
+            headers={'content-type': 'application/x-ndjson'}
+        )
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        job_id = response.json()['id']
+        assert response.json()['status'] == 'pending'
+        assert response.json()['total'] == 3
+        while await process_next_job():
+            pass
+        response = await client.get(f'jobs/{job_id}')
+        assert response.json()['status'] == 'done'
+        assert response.json()['processed'] == 3
+        response = await client.get(
+            f'jobs/{job_id}/results', params={'max-result': 1}
+        )
+        assert response.json()[0]['original_url'] == 'https://ya.ru'
+        response = await client.get(
+            f'jobs/{job_id}/results',
+            params={'cursor': response.headers['x-next-cursor']}
+        )
+        assert response.json()[0]['original_url'] == 'https://google.ru'
+        assert response.json()[0]['position'] == 1
+        assert 'error' in response.json()[1]
+        assert 'short_id' not in response.json()[1]
+        response = await client.post(
+            'jobs/shorten', content=b'"https://ya.ru"\n{"url": 1}\n',
+            headers={'content-type': 'application/x-ndjson'}
+        )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_query_budget(query_budget):
+    """Test database statements do not grow with the batch size."""
+
+    urls = [
+        {"original_url": f"https://example.com/budget/{number}"}
+        for number in range(50)
+    ]
+    async with AsyncClient(app=app, base_url=app_url) as client:
+        with query_budget(statements=4, round_trips=6):
+            response = await client.post('shorten', json=urls)
+        assert response.status_code == status.HTTP_201_CREATED
+        short_id = response.json()[0]['short_id']
+        with query_budget(statements=4, round_trips=8):
+            response = await client.get(f'{short_id}')
+    assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+
+
+@pytest.mark.asyncio
+async def test_link_expiry():
+    """Test expiring short url is redirected until swept."""
+
+    expires_at = (datetime.utcnow() + timedelta(hours=1)).isoformat()
+    async with AsyncClient(app=app, base_url=app_url) as client:
+        response = await client.post('/', json={
+            "original_url": "https://example.com/expiry",
+            "expires_at": expires_at,
+        })
+        assert response.status_code == status.HTTP_201_CREATED
+        short_id = response.json()['short_id']
+        response = await client.get(f'{short_id}')
+        assert response.status_code == status.HTTP_307_TEMPORARY_REDIRECT
+
+        async with async_session() as db:
+            await db.execute(update(ShortUrl).where(
+                ShortUrl.short_id == short_id
+            ).values(expires_at=datetime.utcnow() - timedelta(seconds=1)))
+            await db.commit()
+        urls_cache.clear()
+        expired, _ = await expiry_sweeper.run_once()
+        assert expired >= 1
+        response = await client.get(f'{short_id}')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json() == {'detail': 'Short url has expired'}
+
+        response = await client.post(
+            'jobs/shorten', headers={'content-type': 'application/x-ndjson'},
+            content=json.dumps({
+                "original_url": "https://example.com/expiry/job",
+                "expires_at": expires_at,
+            }).encode()
+        )
+        job_id = response.json()['id']
+        while await process_next_job():
+            pass
+        response = await client.get(f'jobs/{job_id}/results')
+    async with async_session() as db:
+        job_url = await db.scalar(select(ShortUrl).where(
+            ShortUrl.short_id == response.json()[0]['short_id']
+        ))
+    assert job_url.expires_at.isoformat() == expires_at
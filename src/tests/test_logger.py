@@ -0,0 +1,86 @@
+import io
+import logging
+import os
+import sys
+import threading
+
+import orjson
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+)
+from core.logger import (AsyncQueueHandler, JsonFormatter, SamplingFilter,
+                         parse_sample_rates, truncate)
+
+
+def make_record(name: str = 'app', level: int = logging.INFO,
+                msg: str = 'message %s', args: tuple = ('a',),
+                **extra) -> logging.LogRecord:
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_truncate():
+    """Test long text is cut with the number of dropped characters."""
+
+    assert truncate('short', 5) == 'short'
+    assert truncate('x' * 12, 5) == 'xxxxx... [7 more]'
+
+
+def test_json_formatter_fields():
+    """Test JSON record with extra fields and truncated values."""
+
+    formatter = JsonFormatter(max_length=10)
+    data = orjson.loads(formatter.format(make_record(
+        msg='%s', args=('y' * 20,), short_id='abc', count=3, flag=None,
+        url='https://example.com/long', _private='hidden'
+    )))
+    assert data['level'] == 'INFO'
+    assert data['logger'] == 'app'
+    assert data['message'] == 'yyyyyyyyyy... [10 more]'
+    assert data['time'].endswith('+00:00')
+    assert data['short_id'] == 'abc'
+    assert data['count'] == 3
+    assert data['flag'] is None
+    assert data['url'] == 'https://ex... [14 more]'
+    assert '_private' not in data
+    assert 'args' not in data
+
+    try:
+        raise ValueError('bad')
+    except ValueError:
+        record = make_record(exc_info=sys.exc_info())
+    assert 'ValueError: bad' in orjson.loads(
+        JsonFormatter(max_length=100).format(record)
+    )['exception']
+
+
+def test_sampling_filter():
+    """Test sampled loggers pass a share of INFO records, others all."""
+
+    assert parse_sample_rates('a=0.5, b = 0 ,bad,c=') == {'a': 0.5, 'b': 0.0}
+    sampling = SamplingFilter('sampled=0')
+    assert not sampling.filter(make_record('sampled'))
+    assert sampling.filter(make_record('sampled', logging.WARNING))
+    assert sampling.filter(make_record('other'))
+    assert all(
+        SamplingFilter('sampled=1').filter(make_record('sampled'))
+        for _ in range(100)
+    )
+
+
+def test_async_queue_handler_starts_lazily():
+    """Test the writer thread starts with the first record."""
+
+    threads = threading.active_count()
+    handler = AsyncQueueHandler(queue_size=1)
+    stream = io.StringIO()
+    handler._target.setStream(stream)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    assert threading.active_count() == threads
+    handler.handle(make_record())
+    assert threading.active_count() == threads + 1
+    handler.close()
+    assert threading.active_count() == threads
+    assert stream.getvalue() == 'message a\n'
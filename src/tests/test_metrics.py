@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Run like gunicorn: the master loads the config and forks workers that
+# import the app, /metrics is then answered from the merged files.
+GUNICORN_RUN = textwrap.dedent('''
+    import os
+    import runpy
+    import types
+
+    conf = runpy.run_path('gunicorn.conf.py')
+    conf['on_starting'](None)
+    for worker in range(2):
+        pid = os.fork()
+        if pid == 0:
+            from core.metrics import CACHE_SIZE, REQUEST_LATENCY
+            REQUEST_LATENCY.labels('GET', '/test', 200).observe(0.01)
+            CACHE_SIZE.set(5)
+            os._exit(0)
+        os.waitpid(pid, 0)
+        if worker:
+            conf['child_exit'](None, types.SimpleNamespace(pid=pid))
+    from core.metrics import metrics_response
+    print(metrics_response().body.decode())
+''')
+
+
+def test_metrics_aggregate_gunicorn_workers(tmp_path):
+    """Test /metrics merges requests of two forked workers."""
+
+    env = {
+        name: value for name, value in os.environ.items()
+        if name != 'PROMETHEUS_MULTIPROC_DIR'
+    }
+    env['TMPDIR'] = str(tmp_path)
+    result = subprocess.run(
+        [sys.executable, '-c', GUNICORN_RUN], cwd=SRC_DIR, env=env,
+        capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    assert os.listdir(tmp_path / 'prometheus_metrics')
+    assert ('http_request_duration_seconds_count{method="GET",'
+            'route="/test",status="200"} 2.0') in result.stdout
+    # Live gauges of the exited second worker are forgotten.
+    assert 'url_cache_size 5.0' in result.stdout
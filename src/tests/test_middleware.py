@@ -0,0 +1,182 @@
+import asyncio
+import os
+import sys
+import uuid
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+)
+from api.v1.redirect import RedirectMiddleware
+from core.middleware import (BlackList, BlackListMiddleware,
+                             BlackListReloader, IpRanges,
+                             RateLimitMiddleware)
+from services.cache import CachedUrl
+from services.rate_limit import MemoryRateLimitBackend
+from services.short_url import history_writer, urls_cache, usage_counter
+
+
+def test_ip_ranges_match_networks():
+    """Test IPv4 and IPv6 lookup over merged ranges."""
+
+    ranges = IpRanges([
+        '10.0.0.0/24', '10.0.1.0/24', '192.168.1.7', '2001:db8::/32', 'bad'
+    ])
+    assert len(ranges) == 3
+    assert '10.0.1.255' in ranges
+    assert '10.0.2.0' not in ranges
+    assert '192.168.1.7' in ranges
+    assert '192.168.1.8' not in ranges
+    assert '::ffff:10.0.0.1' in ranges
+    assert '2001:db8:1::1' in ranges
+    assert '2001:db9::1' not in ranges
+    assert 'unknown' not in ranges
+
+
+def call(middleware, client, headers=()):
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': '/', 'headers': headers,
+        'client': (client, 1234),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    return messages[0]['status']
+
+
+async def app(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+def test_black_list_middleware(tmp_path):
+    """Test deny by network, trusted X-Forwarded-For and file reload."""
+
+    black_list = tmp_path / 'black_list.txt'
+    black_list.write_text('# abusers\n203.0.113.0/24\n')
+    networks = BlackList(['198.51.100.1'])
+    reloader = BlackListReloader(str(black_list), 0, black_list=networks)
+    reloader.reload()
+    middleware = BlackListMiddleware(
+        app, black_list=networks, trusted_proxies=['127.0.0.1']
+    )
+    assert call(middleware, '198.51.100.1') == 403
+    assert call(middleware, '203.0.113.9') == 403
+    assert call(middleware, '192.0.2.1') == 200
+
+    forwarded = [(b'x-forwarded-for', b'203.0.113.9, 127.0.0.1')]
+    assert call(middleware, '127.0.0.1', forwarded) == 403
+    assert call(middleware, '192.0.2.1', forwarded) == 200
+    # Header bytes are latin-1 like in Starlette, not a decoding error.
+    assert call(middleware, '127.0.0.1', [
+        (b'x-forwarded-for', b'203.0.113.9, \xe9vil, 127.0.0.1')
+    ]) == 200
+
+    black_list.write_text('192.0.2.0/24\n')
+    os.utime(black_list, (0, 1))
+    asyncio.run(reloader.run_once())
+    assert call(middleware, '192.0.2.1') == 403
+    assert call(middleware, '203.0.113.9') == 200
+    assert call(middleware, '198.51.100.1') == 403
+
+    # Admin hooks replace their own source, the file stays loaded.
+    networks.update('admin', ['203.0.113.9'])
+    assert call(middleware, '203.0.113.9') == 403
+    assert call(middleware, '192.0.2.1') == 403
+
+
+def test_rate_limit_middleware():
+    """Test burst, 429 with Retry-After and unlimited routes."""
+
+    middleware = RateLimitMiddleware(
+        app, backend=MemoryRateLimitBackend(),
+        limits={'create': (0.5, 2), 'redirect': (0, 1)}
+    )
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        messages.append(message)
+
+    async def request(method, path, client='192.0.2.1'):
+        messages.clear()
+        await middleware({
+            'type': 'http', 'method': method, 'path': path, 'headers': [],
+            'client': (client, 1234),
+        }, receive, send)
+        return messages[0]
+
+    async def run():
+        assert (await request('POST', '/api/v1/shorten'))['status'] == 200
+        assert (await request('POST', '/api/v1/'))['status'] == 200
+        rejected = await request('POST', '/api/v1/shorten')
+        assert rejected['status'] == 429
+        assert (b'retry-after', b'2') in rejected['headers']
+        assert (await request('POST', '/api/v1/', '192.0.2.2'))[
+            'status'] == 200
+        for _ in range(5):
+            assert (await request('GET', '/api/v1/abc'))['status'] == 200
+
+    asyncio.run(run())
+
+
+def test_redirect_fast_path():
+    """Test cached redirects and errors skip the app, other requests not."""
+
+    middleware = RedirectMiddleware(app)
+    url_id = uuid.uuid4()
+    urls_cache.set('fast1', CachedUrl(url_id, 'https://example.com/a b'))
+    urls_cache.set_missing('fast2', 'Short url was deleted')
+    messages = []
+    counts = []
+    events = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        messages.append(message)
+
+    async def request(method, path):
+        messages.clear()
+        await middleware({
+            'type': 'http', 'method': method, 'path': path,
+            'headers': [(b'user-agent', b'test')],
+        }, receive, send)
+        return messages
+
+    async def save_counts(deltas):
+        counts.append(deltas)
+
+    async def save_history(batch):
+        events.extend(batch)
+
+    async def run():
+        await usage_counter.start(flush=save_counts)
+        await history_writer.start(write=save_history)
+        try:
+            start, _ = await request('GET', '/api/v1/fast1')
+            assert start['status'] == 307
+            assert (b'location', b'https://example.com/a%20b') in start[
+                'headers']
+            start, body = await request('GET', '/api/v1/fast2')
+            assert start['status'] == 400
+            assert body['body'] == b'{"detail":"Short url was deleted"}'
+            for path in ('/api/v1/ping', '/api/v1/', '/api/v1/fast1/status'):
+                assert (await request('GET', path))[0]['status'] == 200
+            assert (await request('POST', '/api/v1/'))[0]['status'] == 200
+        finally:
+            await usage_counter.stop()
+            await history_writer.stop()
+        assert counts == [{url_id: 1}]
+        assert [event.user_agent for event in events] == ['test']
+
+    asyncio.run(run())
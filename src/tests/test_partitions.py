@@ -0,0 +1,152 @@
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+)
+from db.partitions import (DEFAULT_PARTITION, create_partition_sql,
+                           drop_expired_partitions, ensure_partitions,
+                           expired_partitions, missing_ranges,
+                           partition_bounds, partition_end, partition_name,
+                           partition_start)
+
+
+class Connection:
+    """Records statements, answers catalog and default partition reads."""
+
+    def __init__(self, partitions: list[str], stray: frozenset = frozenset()):
+        self.partitions = partitions
+        self.stray = stray
+        self.statements = []
+
+    async def execute(self, statement, params=None):
+        sql = str(statement)
+        self.statements.append(sql)
+        if 'pg_inherits' in sql:
+            return SimpleNamespace(scalars=lambda: iter(self.partitions))
+        return SimpleNamespace(rowcount=2)
+
+    async def scalar(self, statement, params):
+        return params['start'] in self.stray
+
+
+def test_partition_bounds():
+    """Test day and month ranges across month and year ends."""
+
+    moment = datetime(2026, 12, 31, 23, 59, 59, 999999)
+    day = partition_start(moment, 'day')
+    month = partition_start(moment, 'month')
+    assert day == datetime(2026, 12, 31)
+    assert partition_end(day, 'day') == datetime(2027, 1, 1)
+    assert month == datetime(2026, 12, 1)
+    assert partition_end(month, 'month') == datetime(2027, 1, 1)
+    assert partition_end(datetime(2026, 1, 1), 'month') == datetime(
+        2026, 2, 1
+    )
+    assert partition_end(datetime(2028, 2, 1), 'month') == datetime(
+        2028, 3, 1
+    )
+    assert partition_end(datetime(2028, 2, 28), 'day') == datetime(
+        2028, 2, 29
+    )
+    assert partition_name(day, 'day') == 'short_url_history_p20261231'
+    assert partition_name(month, 'month') == 'short_url_history_p202612'
+    assert create_partition_sql(month, 'month') == (
+        'CREATE TABLE IF NOT EXISTS short_url_history_p202612 '
+        'PARTITION OF short_url_history FOR VALUES '
+        "FROM ('2026-12-01T00:00:00') TO ('2027-01-01T00:00:00')"
+    )
+
+
+def test_partition_ranges_across_interval_change():
+    """Test ranges are read from names and gaps filled by days."""
+
+    assert partition_bounds('short_url_history_p202610') == (
+        datetime(2026, 10, 1), datetime(2026, 11, 1)
+    )
+    assert partition_bounds('short_url_history_p20261031') == (
+        datetime(2026, 10, 31), datetime(2026, 11, 1)
+    )
+    assert partition_bounds(DEFAULT_PARTITION) is None
+    assert partition_bounds('short_url_history_p2026') is None
+
+    october = partition_bounds('short_url_history_p202610')
+    assert missing_ranges([october], datetime(2026, 11, 1), 'month') == [
+        (datetime(2026, 11, 1), 'month')
+    ]
+    assert missing_ranges([october], datetime(2026, 10, 7), 'day') == []
+    days = [
+        partition_bounds(f'short_url_history_p202611{day:02}')
+        for day in range(1, 29)
+    ]
+    assert missing_ranges(days, datetime(2026, 11, 1), 'month') == [
+        (datetime(2026, 11, 29), 'day'), (datetime(2026, 11, 30), 'day')
+    ]
+
+
+def test_expired_partitions_selection():
+    """Test only partitions ended before the border are dropped."""
+
+    names = [
+        'short_url_history_p20261003', DEFAULT_PARTITION,
+        'short_url_history_p20261001', 'short_url_history_p20261002',
+        'short_url_history_p202610', 'short_url_history_pbroken',
+        'other_table_p20261001',
+    ]
+    border = datetime(2026, 10, 3)
+    assert expired_partitions(names, border) == [
+        'short_url_history_p20261001', 'short_url_history_p20261002',
+    ]
+    assert expired_partitions(names, border - timedelta(
+        microseconds=1
+    )) == ['short_url_history_p20261001']
+    # Partitions of both intervals expire, the interval setting may change.
+    assert expired_partitions(names, datetime(2026, 11, 1)) == [
+        'short_url_history_p202610', 'short_url_history_p20261001',
+        'short_url_history_p20261002', 'short_url_history_p20261003',
+    ]
+
+    today = partition_start(datetime.utcnow(), 'day')
+    old = partition_name(today - timedelta(days=10), 'day')
+    recent = partition_name(today - timedelta(days=2), 'day')
+    connection = Connection([old, recent, DEFAULT_PARTITION])
+    assert asyncio.run(
+        drop_expired_partitions(connection, retention_days=5)
+    ) == [old]
+    assert connection.statements[-1] == f'DROP TABLE {old}'
+
+
+def test_ensure_partitions_moves_default_rows():
+    """Test missing ranges are created, stray rows leave the default."""
+
+    today = partition_start(datetime.utcnow(), 'day')
+    tomorrow = partition_end(today, 'day')
+    after = partition_end(tomorrow, 'day')
+    connection = Connection(
+        [partition_name(today, 'day'), DEFAULT_PARTITION], stray={tomorrow}
+    )
+    created = asyncio.run(ensure_partitions(connection, 'day', ahead=2))
+    assert created == [
+        partition_name(tomorrow, 'day'), partition_name(after, 'day')
+    ]
+    statements = connection.statements[1:]
+    assert statements[0] == (
+        f'ALTER TABLE short_url_history DETACH PARTITION {DEFAULT_PARTITION}'
+    )
+    assert statements[1] == create_partition_sql(tomorrow, 'day')
+    assert statements[2].startswith(
+        f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} '
+    )
+    assert statements[3] == (
+        f'ALTER TABLE short_url_history ATTACH PARTITION '
+        f'{DEFAULT_PARTITION} DEFAULT'
+    )
+    assert statements[4:] == [create_partition_sql(after, 'day')]
+
+    # Without the default partition there is nothing to move.
+    connection = Connection([], stray={today})
+    assert len(asyncio.run(ensure_partitions(connection, 'month', 0))) == 1
+    assert 'DETACH' not in ' '.join(connection.statements)
@@ -0,0 +1,601 @@
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql.dml import Insert
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+)
+from core.config import app_settings
+from db.partitions import partition_start
+from db.replicas import ReplicaRouter
+from schemas.short_url import OriginalUrl
+from services.base import (MAX_BIND_PARAMS, encode_cursor, url_digest,
+                           values_chunk_size)
+from services.bulk import iter_records
+from services.cache import MISSING, CachedUrl, UrlCache
+from services.counter import UsageCounter
+from services.history import HistoryEvent, HistoryWriter
+from services.jobs import ShortenJobs
+from services.id_generator import (FeistelIdGenerator, SequenceIdGenerator,
+                                   base62_encode)
+from services.periodic import PeriodicTask
+from services.rollup import aggregate, bucket_range
+from services.short_url import urls_cache, urls_crud
+
+
+def test_url_cache_lru_and_ttl():
+    """Test cache eviction, expiration and counters."""
+
+    cache = UrlCache(max_size=2, ttl=60, negative_ttl=0.01)
+    cache.set('a', CachedUrl(1, 'https://a.ru'))
+    cache.set('b', CachedUrl(2, 'https://b.ru'))
+    assert cache.get('a') == CachedUrl(1, 'https://a.ru')
+    cache.set('c', CachedUrl(3, 'https://c.ru'))
+    assert cache.get('b') is MISSING
+    assert cache.get('c').original_url == 'https://c.ru'
+
+    cache.set_missing('d', 'Short url not found')
+    assert cache.get('d') == 'Short url not found'
+    time.sleep(0.02)
+    assert cache.get('d') is MISSING
+
+    cache.invalidate('a')
+    assert cache.get('a') is MISSING
+    stats = cache.stats()
+    assert stats['hits'] == 3
+    assert stats['misses'] == 3
+    assert stats['evictions'] == 2
+
+
+def test_usage_counter_flush():
+    """Test usage increments are merged and flushed on stop."""
+
+    flushed = []
+    counter = UsageCounter(interval=60, threshold=1000)
+
+    async def flush(deltas):
+        assert counter.pending('a') == 2
+        counter.flushed()
+        # Committed counts are not added again while the session closes.
+        assert counter.pending('a') == 0
+        flushed.append(deltas)
+
+    async def run():
+        await counter.start(flush=flush)
+        counter.add('a')
+        counter.add('a')
+        counter.add('b')
+        assert counter.pending('a') == 2
+        assert counter.depth == 3
+        await counter.stop()
+        assert counter.pending('a') == 0
+
+    asyncio.run(run())
+    assert flushed == [{'a': 2, 'b': 1}]
+
+
+def test_history_writer_drop_oldest():
+    """Test full history queue drops oldest events and drains on stop."""
+
+    written = []
+
+    async def write(events):
+        written.extend(events)
+
+    async def run():
+        writer = HistoryWriter(
+            batch_size=2, flush_interval=60, max_size=3,
+            policy='drop_oldest'
+        )
+        for event in range(5):
+            await writer.put(event)
+        assert writer.depth == 3
+        assert writer.dropped == 2
+        await writer.start(write=write)
+        await writer.stop()
+
+    asyncio.run(run())
+    assert written == [2, 3, 4]
+
+
+def test_replica_router_skips_failed_replicas():
+    """Test round-robin over replicas that are not marked down."""
+
+    router = ReplicaRouter(
+        ['postgresql+asyncpg://u:p@replica-a/db',
+         'postgresql+asyncpg://u:p@replica-b/db'],
+        retry_after=60, options={}
+    )
+    hosts = {router.choose().url.host for _ in range(4)}
+    assert hosts == {'replica-a', 'replica-b'}
+
+    router.mark_down(router.engines[0], ConnectionError())
+    assert {router.choose().url.host for _ in range(4)} == {'replica-b'}
+    router.mark_down(router.engines[1], ConnectionError())
+    assert router.choose() is None
+    assert router.session() is None
+    assert [replica['healthy'] for replica in router.stats()] == [
+        False, False
+    ]
+
+
+def test_stream_records_parse_incrementally():
+    """Test line splitting across chunks, formats and per line errors."""
+
+    async def chunks(*parts):
+        for part in parts:
+            yield part
+
+    async def records(stream_format, *parts):
+        return [
+            record async for record in iter_records(
+                chunks(*parts), stream_format
+            )
+        ]
+
+    async def records_raw(stream_format, *parts):
+        return [
+            record async for record in iter_records(
+                chunks(*parts), stream_format, validate=False
+            )
+        ]
+
+    ndjson = asyncio.run(records(
+        'ndjson', b'{"original_url": "https://a.ru"}\n"https://b', b'.ru"\n',
+        b'\n42\n"not url"\n' + b'x' * 10000 + b'\n"https://\xd1\x8f.ru"'
+    ))
+    assert [number for number, _, _ in ndjson] == [1, 2, 4, 5, 6, 7]
+    assert [data['original_url'] for _, data, _ in ndjson if data] == [
+        'https://a.ru', 'https://b.ru', 'https://xn--41a.ru'
+    ]
+    assert ndjson[4][2] == 'Line is too long'
+
+    raw = asyncio.run(records_raw(
+        'ndjson', b'"not url"\n{"original_url": "https://b.ru", '
+        b'"expires_at": "2030-01-01T03:00:00+03:00"}\n42\n'
+        b'{"original_url": "https://c.ru", "expires_at": "soon"}\n'
+    ))
+    assert raw[0] == (1, {'original_url': 'not url', 'expires_at': None}, None)
+    assert raw[1][1] == {
+        'original_url': 'https://b.ru', 'expires_at': datetime(2030, 1, 1)
+    }
+    assert raw[2][1] is None
+    assert raw[3][1] is None
+
+    expiring = asyncio.run(records(
+        'ndjson', b'{"original_url": "https://b.ru", '
+        b'"expires_at": "2030-01-01T00:00:00Z"}\n'
+        b'{"original_url": "https://c.ru", "expires_at": "2020-01-01T00:00"}\n'
+    ))
+    assert expiring[0][1]['expires_at'] == datetime(2030, 1, 1)
+    assert expiring[1][2] == 'expiration time is in the past'
+
+    csv_records = asyncio.run(records(
+        'csv', b'original_url,note\r\nhttps://a.ru,"x, y"\r\nbad\r\n'
+    ))
+    assert csv_records[0] == (2, {'original_url': 'https://a.ru'}, None)
+    assert csv_records[1][1] is None
+
+
+def test_link_expiry_time():
+    """Test expiry time validation and expired cache entries."""
+
+    obj_in = OriginalUrl(
+        original_url='https://a.ru',
+        expires_at=datetime.now(timezone(timedelta(hours=3))) + timedelta(
+            hours=1
+        )
+    )
+    assert obj_in.expires_at.tzinfo is None
+    assert obj_in.expires_at > datetime.utcnow() + timedelta(minutes=59)
+    with pytest.raises(ValidationError):
+        OriginalUrl(
+            original_url='https://a.ru',
+            expires_at=datetime.utcnow() - timedelta(seconds=1)
+        )
+
+    urls_cache.set('live1', CachedUrl(
+        1, 'https://a.ru', datetime.utcnow() + timedelta(hours=1)
+    ))
+    urls_cache.set('dead1', CachedUrl(
+        2, 'https://b.ru', datetime.utcnow() - timedelta(seconds=1)
+    ))
+    urls_cache.set_missing('gone1', 'Short url has expired')
+    try:
+        assert urls_crud.cached_url('live1').id == 1
+        assert urls_crud.cached_url('dead1') is MISSING
+        assert urls_cache.get('dead1') is MISSING
+        with pytest.raises(HTTPException):
+            urls_crud.cached_url('gone1')
+    finally:
+        urls_cache.clear()
+
+
+def test_rollup_aggregate_and_bucket_range():
+    """Test per bucket counts of history events and raw history range."""
+
+    events = [
+        HistoryEvent(1, 'b', 'curl', datetime(2026, 10, 1, 10, 59)),
+        HistoryEvent(2, 'a', 'curl', datetime(2026, 10, 1, 10, 1)),
+        HistoryEvent(3, 'a', 'httpx', datetime(2026, 10, 1, 11, 0)),
+        HistoryEvent(4, 'a', 'curl', datetime(2026, 10, 1, 10, 30)),
+    ]
+    usage_rows, agent_rows = aggregate(events, user_agents=False)
+    assert agent_rows == []
+    assert [
+        (row['short_url'], row['granularity'], row['bucket'].hour,
+         row['count'])
+        for row in usage_rows
+    ] == [
+        ('a', 'day', 0, 3), ('a', 'hour', 10, 2), ('a', 'hour', 11, 1),
+        ('b', 'day', 0, 1), ('b', 'hour', 10, 1),
+    ]
+    _, agent_rows = aggregate(events, user_agents=True)
+    assert {
+        (row['short_url'], row['bucket'].hour, row['user_agent']):
+            row['count']
+        for row in agent_rows if row['granularity'] == 'hour'
+    } == {
+        ('a', 10, 'curl'): 2, ('a', 11, 'httpx'): 1, ('b', 10, 'curl'): 1
+    }
+
+    assert bucket_range(
+        datetime(2026, 10, 1, 10, 30), datetime(2026, 10, 1, 12, 5), 'hour'
+    ) == (datetime(2026, 10, 1, 11), datetime(2026, 10, 1, 13))
+    assert bucket_range(
+        datetime(2026, 10, 1), datetime(2026, 10, 3, 8), 'day'
+    ) == (datetime(2026, 10, 1), datetime(2026, 10, 4))
+
+
+def test_periodic_task_survives_failures(caplog):
+    """Test periodic task logs a failed run, keeps going and stops."""
+
+    class Flaky(PeriodicTask):
+        failure_message = 'Flaky run failed'
+        runs = 0
+
+        async def run_once(self):
+            self.runs += 1
+            if self.runs == 1:
+                raise ValueError('boom')
+
+    async def run():
+        task = Flaky(period=0)
+        await task.start()
+        while task.runs < 3:
+            await asyncio.sleep(0)
+        await task.stop()
+        await task.stop()
+        return task
+
+    task = asyncio.run(run())
+    assert task._task is None
+    assert "Flaky run failed: ValueError('boom')" in caplog.text
+
+
+def test_base62_encode_fixed_width():
+    """Test ids are padded to their length and overflow is rejected."""
+
+    assert base62_encode(0, 4) == '0000'
+    assert base62_encode(61, 4) == '000z'
+    assert base62_encode(62, 4) == '0010'
+    assert base62_encode(62 ** 4 - 1, 4) == 'zzzz'
+    assert {
+        len(base62_encode(number, 3)) for number in range(0, 62 ** 3, 997)
+    } == {3}
+    with pytest.raises(ValueError):
+        base62_encode(62 ** 4, 4)
+
+
+def test_feistel_permutation_is_bijection():
+    """Test permutation maps its whole small domain onto itself."""
+
+    generator = FeistelIdGenerator(2, 'seq', 10, 'secret')
+    # 62 ** 2 ids hold 11 bits, the permutation uses the even 10 of them.
+    domain = range(1 << 10)
+    permuted = [generator.permute(number) for number in domain]
+    assert sorted(permuted) == list(domain)
+    assert permuted != list(domain)
+    assert permuted == [
+        FeistelIdGenerator(2, 'seq', 10, 'secret').permute(number)
+        for number in domain
+    ]
+    assert permuted != [
+        FeistelIdGenerator(2, 'seq', 10, 'other').permute(number)
+        for number in domain
+    ]
+    assert {len(generator.encode(number)) for number in domain} == {2}
+    with pytest.raises(ValueError):
+        generator.permute(1 << 10)
+
+
+def test_sequence_blocks_are_not_reused():
+    """Test ids come from preallocated blocks, each number used once."""
+
+    class Result:
+        def __init__(self, values):
+            self._values = values
+
+        def scalars(self):
+            return iter(self._values)
+
+    class Database:
+        """Sequence returning consecutive numbers per generate_series."""
+
+        def __init__(self):
+            self.last = 0
+            self.sizes = []
+
+        async def execute(self, statement):
+            size = max(statement.compile().params.values())
+            self.sizes.append(size)
+            values = range(self.last + 1, self.last + size + 1)
+            self.last += size
+            return Result(values)
+
+    async def run(generator, db, counts):
+        return [
+            short_id for count in counts
+            for short_id in await generator.generate(db, count)
+        ]
+
+    db = Database()
+    ids = asyncio.run(run(SequenceIdGenerator(3, 'seq', 3), db, [2, 2, 5]))
+    assert ids == [base62_encode(number, 3) for number in range(1, 10)]
+    assert db.sizes == [3, 3, 3]
+
+    db = Database()
+    generator = FeistelIdGenerator(3, 'seq', 4, 'secret')
+    ids = asyncio.run(run(generator, db, [3, 7, 1]))
+    assert len(set(ids)) == len(ids) == 11
+    assert db.sizes == [4, 6, 4]
+    assert ids == [generator.encode(number) for number in range(1, 12)]
+
+
+def test_url_digest_normalization():
+    """Test urls differing only in case, default port or root slash match."""
+
+    same = [
+        'https://example.com', 'https://example.com/',
+        'HTTPS://EXAMPLE.com/', 'https://Example.COM:443/',
+        'https://example.com/#fragment',
+    ]
+    assert {url_digest(url) for url in same} == {
+        url_digest('https://example.com/')
+    }
+    assert url_digest('http://example.com:80/a') == url_digest(
+        'http://example.com/a'
+    )
+    different = [
+        'https://example.com/', 'http://example.com/',
+        'https://example.com:8443/', 'https://example.com/a',
+        'https://example.com/a/', 'https://example.com/A',
+        'https://example.com/?q=1', 'https://user:pw@example.com/',
+    ]
+    assert len({url_digest(url) for url in different}) == len(different)
+
+
+class ShortUrlTable:
+    """In memory short_url table answering the statements of create_rows."""
+
+    def __init__(self):
+        self.rows = []
+        self.inserts = 0
+
+    async def execute(self, statement):
+        params = statement.compile(dialect=postgresql.dialect()).params
+        if isinstance(statement, Insert):
+            self.inserts += 1
+            values = {}
+            for name, value in params.items():
+                column, _, row = name.rpartition('_m')
+                if column and row.isdigit():
+                    values.setdefault(int(row), {})[column] = value
+            created = []
+            for row in values.values():
+                row['id'] = len(self.rows) + 1
+                row['del_status'] = False
+                self.rows.append(SimpleNamespace(**row))
+                created.append(self.rows[-1])
+            return created
+        digests, = params.values()
+        return [
+            row for row in self.rows
+            if row.original_url_digest in digests and not row.del_status
+            and row.expires_at is None
+        ]
+
+
+def test_create_rows_dedup(monkeypatch):
+    """Test repeated urls reuse rows within a batch and across batches."""
+
+    monkeypatch.setattr(app_settings, 'dedup_enabled', True)
+    expires_at = datetime.utcnow() + timedelta(hours=1)
+    table = ShortUrlTable()
+
+    first = asyncio.run(urls_crud.create_rows(table, [
+        {'original_url': 'https://a.ru/'},
+        {'original_url': 'HTTPS://A.RU:443'},
+        {'original_url': 'https://b.ru/'},
+        {'original_url': 'https://a.ru/', 'expires_at': expires_at},
+        {'original_url': 'https://a.ru/', 'expires_at': expires_at},
+    ]))
+    assert len(table.rows) == 4
+    assert first[0] is first[1]
+    assert len({row.id for row in first}) == 4
+    assert first[3].expires_at == expires_at
+
+    second = asyncio.run(urls_crud.create_rows(table, [
+        {'original_url': 'https://b.ru'},
+        {'original_url': 'https://c.ru/'},
+        {'original_url': 'https://a.ru/'},
+    ]))
+    assert len(table.rows) == 5
+    assert second[0].id == first[2].id
+    assert second[2].id == first[0].id
+    assert second[1].original_url == 'https://c.ru/'
+
+    table.rows[0].del_status = True
+    third, = asyncio.run(urls_crud.create_rows(table, [
+        {'original_url': 'https://a.ru/'}
+    ]))
+    assert third.id == 6
+    assert third.short_id != table.rows[0].short_id
+
+    monkeypatch.setattr(app_settings, 'dedup_enabled', False)
+    repeated = asyncio.run(urls_crud.create_rows(table, [
+        {'original_url': 'https://b.ru/'},
+        {'original_url': 'https://b.ru/'},
+    ]))
+    assert [row.id for row in repeated] == [7, 8]
+
+
+def test_status_page_bounds_used_at(monkeypatch):
+    """Test history pages bound used_at so partitions can be pruned."""
+
+    monkeypatch.setattr(app_settings, 'history_partition_interval', 'day')
+    monkeypatch.setattr(app_settings, 'history_retention_days', None)
+    statements = []
+
+    class Database:
+        async def execute(self, statement):
+            statements.append(statement.compile(
+                dialect=postgresql.dialect()
+            ))
+            return SimpleNamespace(all=list)
+
+    url = SimpleNamespace(id=1, created_at=datetime(2026, 10, 1, 15, 30))
+    asyncio.run(urls_crud.get_status(
+        Database(), url, full_info=True, limit=10, offset=0
+    ))
+    cursor = encode_cursor(datetime(2026, 10, 5, 12), uuid.uuid4())
+    asyncio.run(urls_crud.get_status(
+        Database(), url, full_info=True, limit=10, offset=0, cursor=cursor
+    ))
+    first, page = statements
+    assert 'short_url_history.used_at >= %(used_at_1)s' in str(first)
+    assert first.params['used_at_1'] == datetime(2026, 10, 1)
+    assert 'short_url_history.used_at <= %(used_at_2)s' in str(page)
+    assert page.params['used_at_2'] == datetime(2026, 10, 5, 12)
+
+    monkeypatch.setattr(app_settings, 'history_retention_days', 3)
+    asyncio.run(urls_crud.get_status(
+        Database(), url, full_info=True, limit=10, offset=0
+    ))
+    assert statements[-1].params['used_at_1'] == partition_start(
+        datetime.utcnow() - timedelta(days=3), 'day'
+    )
+
+
+class JobSession:
+    """Session recording commits and statements of shorten jobs."""
+
+    def __init__(self):
+        self.added = []
+        self.log = []
+
+    def add(self, obj):
+        obj.id = uuid.uuid4()
+        self.added.append(obj)
+
+    async def commit(self):
+        self.log.append('commit')
+
+    async def rollback(self):
+        self.log.append('rollback')
+
+    async def execute(self, statement, params=None):
+        if params is not None:
+            self.log.append(('insert', len(params)))
+        else:
+            self.log.append(str(statement).split()[0])
+        return SimpleNamespace(scalar_one_or_none=lambda: None, rowcount=1)
+
+
+def test_shorten_job_upload_commits_chunks():
+    """Test upload chunks are committed under an uploading job."""
+
+    jobs = ShortenJobs(urls_crud, chunk_size=2, max_failures=3,
+                       retry_delay=1)
+
+    async def records(*lines):
+        for number, line in enumerate(lines, 1):
+            if line is None:
+                yield number, None, 'Invalid line'
+            else:
+                yield number, {'original_url': line}, None
+
+    db = JobSession()
+    job = asyncio.run(jobs.submit(db, records(
+        'https://a.ru', 'https://b.ru', 'https://c.ru'
+    ), max_size=10))
+    assert (job.status, job.total) == ('pending', 3)
+    assert db.log == [
+        'commit', ('insert', 2), 'UPDATE', 'commit', ('insert', 1),
+        'UPDATE', 'commit', 'commit',
+    ]
+
+    db = JobSession()
+    with pytest.raises(HTTPException):
+        asyncio.run(jobs.submit(db, records(
+            'https://a.ru', 'https://b.ru', None
+        ), max_size=10))
+    assert db.added[0].status == 'uploading'
+    assert db.log[-4:] == ['commit', 'rollback', 'DELETE', 'commit']
+
+
+def test_shorten_job_retry_backoff():
+    """Test failed jobs wait for retry_at before they are locked again."""
+
+    statements = []
+
+    class Session(JobSession):
+        async def execute(self, statement, params=None):
+            statements.append(str(statement))
+            return await super().execute(statement, params)
+
+    jobs = ShortenJobs(urls_crud, chunk_size=2, max_failures=3,
+                       retry_delay=1)
+    assert not asyncio.run(jobs.process_next(Session()))
+    assert 'shorten_job.retry_at IS NULL OR shorten_job.retry_at <=' in (
+        statements[0]
+    )
+    asyncio.run(jobs._record_failure(Session(), uuid.uuid4(), ValueError()))
+    assert 'retry_at=(CAST(' in statements[1]
+    assert 'power(' in statements[1]
+
+
+def test_insert_chunks_fit_bind_limit(monkeypatch):
+    """Test huge chunk size settings are split to the bind limit."""
+
+    monkeypatch.setattr(app_settings, 'bulk_create_chunk_size', 100000)
+    monkeypatch.setattr(app_settings, 'dedup_enabled', False)
+    table = ShortUrlTable()
+    counts = []
+    execute = table.execute
+
+    async def count_params(statement):
+        counts.append(len(statement.compile(
+            dialect=postgresql.dialect()
+        ).params))
+        return await execute(statement)
+
+    table.execute = count_params
+    rows = asyncio.run(urls_crud.create_rows(table, [
+        {'original_url': f'https://a.ru/{number}'} for number in range(5000)
+    ]))
+    assert len(rows) == 5000
+    assert len(counts) == 2
+    assert max(counts) <= MAX_BIND_PARAMS
+    # Rows bind all 9 columns of short_url.
+    assert values_chunk_size(urls_crud._model.__table__) == 3640